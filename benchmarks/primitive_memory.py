@@ -0,0 +1,124 @@
+"""Memory and allocation time of the primitive wrappers (numbers and strings) of the
+translator runtime (js2py.base), alone and in string heavy translated programs (templating and
+JSON building). Run it before and after a change and compare the results:
+
+    python benchmarks/primitive_memory.py -o before.json
+    python benchmarks/primitive_memory.py -o after.json
+    python benchmarks/primitive_memory.py --compare before.json after.json
+
+The memory is measured with tracemalloc (python 3 only): bytes per wrapper that stays alive and
+the peak memory of the programs.
+"""
+from __future__ import print_function
+import os
+import sys
+import gc
+import time
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import js2py
+from js2py.base import Js
+from js2py.utils.parsers import set_parser_backend
+from run import add_report_arguments, write_report, load_reports, ratio
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+COUNT = 100000
+
+TEMPLATE = '''
+var rows = [];
+for (var i = 0; i < %d; i++) {
+    rows.push('<tr><td class="id">' + i + '</td><td>' + 'name ' + (i %% 97) + '</td><td>' +
+              (i %% 2 ? 'odd' : 'even') + '</td></tr>');
+}
+rows.join('\\n').length
+''' % (COUNT // 10)
+
+JSON_BUILD = '''
+var items = [];
+for (var i = 0; i < %d; i++) {
+    items.push({id: i, name: 'item ' + i, tags: ['a' + (i %% 7), 'b' + (i %% 11)], ok: i %% 3 == 0});
+}
+JSON.stringify({items: items}).length
+''' % (COUNT // 20)
+
+
+def wrappers(kind):
+    if kind == 'strings':
+        return [Js(u'item %d' % i) for i in range(COUNT)]
+    return [Js(i + 0.5) for i in range(COUNT)]  # numbers outside of NUM_BANK
+
+
+def measure(fn):
+    """Returns (time, memory), memory is the memory allocated by fn and still alive when it
+       returned (peak memory for programs) or None without tracemalloc"""
+    gc.collect()
+    start = _timer()
+    fn()
+    elapsed = _timer() - start
+    if tracemalloc is None:
+        return elapsed, None
+    gc.collect()
+    tracemalloc.start()
+    res = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current if isinstance(res, list) else peak
+
+
+def benchmark():
+    results = {}
+    for kind in ('strings', 'numbers'):
+        elapsed, memory = measure(lambda: wrappers(kind))
+        results[kind] = {
+            'time': elapsed,
+            'bytes_per_object': memory / float(COUNT) if memory is not None else None
+        }
+    for name, source in (('template', TEMPLATE), ('json', JSON_BUILD)):
+        elapsed, memory = measure(lambda: js2py.eval_js(source))
+        results[name] = {'time': elapsed, 'peak_memory': memory}
+    return results
+
+
+def show(results):
+    for name in sorted(results):
+        print('%-10s %s' % (name, '  '.join(
+            '%s=%s' % (key, '%.4g' % value if value is not None else '-')
+            for key, value in sorted(results[name].items()))))
+
+
+def compare(old_path, new_path):
+    old, new = load_reports(old_path, new_path)
+    print('%-10s %-18s %12s %12s %7s' % ('case', 'metric', 'old', 'new', 'ratio'))
+    for name in sorted(new):
+        for key in sorted(new[name]):
+            a, b = old.get(name, {}).get(key), new[name][key]
+            if a is None or b is None:
+                continue
+            print('%-10s %-18s %12.4g %12.4g %7.2f' % (name, key, a, b, ratio(a, b)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Memory and allocation time of the primitive wrappers of js2py.base.')
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    set_parser_backend('pyjsparser')  # the programs are translated by eval_js
+    results = benchmark()
+    show(results)
+    if args.output:
+        write_report(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""Benchmark suite of the translator and the VM (internals) runtimes.
+
+Runs a fixed corpus through every phase separately and records the time and the peak memory
+(allocated by the phase, measured with tracemalloc in a separate run) of each phase as JSON:
+
+  parse         pyjsparser parse of the source (the parser backend is pinned to pyjsparser)
+  translate     translating_nodes.trans (translator) or bytecode generation (vm)
+  compile       python compile() (translator) or label resolution of the tape (vm)
+  first_run     first execution in a fresh global scope
+  steady_run    median of the following executions in a fresh global scope
+
+The corpus consists of js2py/utils/esprima.js (loaded and used to parse a file), the translated
+babel bundle js2py/es6/babel.py (translator only and without parse and translate, its JS source
+is not in the repo) and a fixed sample of the test262 tests in tests/test_cases.
+
+    python benchmarks/run.py -o before.json
+    python benchmarks/run.py -o after.json
+    python benchmarks/run.py --compare before.json after.json
+
+Use --cases and --runtimes to run a subset, babel alone takes several minutes.
+"""
+from __future__ import print_function
+import os
+import re
+import sys
+import gc
+import json
+import time
+import codecs
+import argparse
+import platform
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+import js2py
+from js2py.translators import translating_nodes, DEFAULT_HEADER
+from js2py.utils.parsers import parse, get_parser_backend, set_parser_backend
+from js2py.internals.space import Space
+from js2py.internals import fill_space
+from js2py.internals.byte_trans import ByteCodeGenerator
+from js2py.internals.code import Code
+
+try:
+    import tracemalloc
+except ImportError:  # python 2
+    tracemalloc = None
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+PHASES = ['parse', 'translate', 'compile', 'first_run', 'steady_run']
+RUNTIMES = ['translator', 'vm']
+STEADY_REPEAT = 5
+
+TEST262_PATH = os.path.join(ROOT, 'tests', 'test_cases')
+TEST262_INCLUDES = os.path.join(ROOT, 'tests', 'includes')
+TEST262_SAMPLE = [
+    'built-ins/Array/prototype/sort/S15.4.4.11_A4_T3.js',
+    'built-ins/JSON/stringify/15.12.3-11-25.js',
+    'built-ins/Math/tan/S15.8.2.18_A6.js',
+    'built-ins/RegExp/prototype/exec/S15.10.6.2_A4_T10.js',
+    'built-ins/String/prototype/replace/S15.5.4.11_A1_T16.js',
+    'language/expressions/object/S11.1.5_A2.js',
+    'language/statements/for/S12.6.3_A6.js',
+    'language/statements/try/S12.14_A13_T3.js',
+]
+
+
+def load(path):
+    with codecs.open(path, 'r', 'utf-8') as f:
+        return f.read()
+
+
+def esprima_case():
+    # esprima exports to the exports object in the vm and to the global esprima otherwise
+    return load(os.path.join(ROOT, 'js2py', 'utils', 'esprima.js')) + (
+        '\n;(typeof exports !== "undefined" ? exports : esprima).parse(%s).body.length' %
+        json.dumps(load(os.path.join(TEST262_INCLUDES, 'propertyHelper.js'))))
+
+
+def test262_case(rel_path):
+    raw = load(os.path.join(TEST262_PATH, rel_path))
+    code = load(os.path.join(TEST262_INCLUDES, 'init.js'))
+    m = re.search(r'includes:\s*\[(.*?)\]', raw)
+    if m:
+        for include in m.group(1).split(','):
+            if include.strip():
+                code += load(os.path.join(TEST262_INCLUDES, include.strip()))
+    return code + raw
+
+
+def get_cases():
+    """Returns the list of (name, kind, loader), kind is 'js' or 'py' (already translated)"""
+    cases = [('esprima', 'js', esprima_case),
+             ('babel', 'py', lambda: load(os.path.join(ROOT, 'js2py', 'es6', 'babel.py')))]
+    for rel_path in TEST262_SAMPLE:
+        cases.append(('test262/' + rel_path[:-3], 'js',
+                      lambda rel_path=rel_path: test262_case(rel_path)))
+    return cases
+
+
+def translator_phases(kind, source):
+    """Yields (phase, function) pairs, each function takes the result of the previous one."""
+    if kind == 'js':
+        yield 'parse', lambda _: parse(source)
+
+        def translate(tree):
+            translating_nodes.clean_stacks()
+            return DEFAULT_HEADER + translating_nodes.trans(tree)
+
+        yield 'translate', translate
+        yield 'compile', lambda py: compile(py, '<benchmark>', 'exec')
+    else:
+        yield 'compile', lambda _: compile(source, '<benchmark>', 'exec')
+
+    def run(code):
+        exec (code, {})
+        return code
+
+    yield 'first_run', run
+    yield 'steady_run', run
+
+
+def vm_phases(kind, source):
+    if kind != 'js':
+        return
+    yield 'parse', lambda _: parse(source)
+
+    def translate(tree):
+        generator = ByteCodeGenerator(Code())
+        generator.exe.space = Space()
+        generator.exe.space.exe = generator.exe
+        generator.emit(tree)
+        return generator
+
+    def compile_tape(generator):
+        generator.exe.compile()
+        return generator
+
+    def run(generator):
+        space = Space()
+        generator.exe.space = space
+        space.exe = generator.exe
+        fill_space.fill_space(space, generator)
+        generator.exe.run(space.GlobalObj)
+        return generator
+
+    yield 'translate', translate
+    yield 'compile', compile_tape
+    yield 'first_run', run
+    yield 'steady_run', run
+
+
+def run_phases(phases, trace_memory=False, steady_repeat=STEADY_REPEAT):
+    """Runs the phases, returns {phase: time} or {phase: peak memory} when trace_memory"""
+    results = {}
+    value = None
+    for phase, fn in phases:
+        repeat = steady_repeat if phase == 'steady_run' and not trace_memory else 1
+        samples = []
+        for _ in range(repeat):
+            gc.collect()
+            if trace_memory:
+                tracemalloc.start()
+                start = 0
+            else:
+                start = _timer()
+            value = fn(value)
+            if trace_memory:
+                samples.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            else:
+                samples.append(_timer() - start)
+        samples.sort()
+        results[phase] = samples[len(samples) // 2]
+    return results
+
+
+def benchmark(case_filter=None, runtimes=RUNTIMES, memory=True, steady_repeat=STEADY_REPEAT,
+              verbose=True):
+    results = {}
+    for name, kind, loader in get_cases():
+        if case_filter and not re.search(case_filter, name):
+            continue
+        source = loader()
+        for runtime in runtimes:
+            get_phases = translator_phases if runtime == 'translator' else vm_phases
+            if not list(get_phases(kind, source)):
+                continue
+            if verbose:
+                print('%-10s %s' % (runtime, name), end=' ')
+                sys.stdout.flush()
+            times = run_phases(get_phases(kind, source), steady_repeat=steady_repeat)
+            peaks = {}
+            if memory and tracemalloc is not None:
+                peaks = run_phases(get_phases(kind, source), trace_memory=True)
+            results.setdefault(runtime, {})[name] = dict(
+                (phase, {'time': times[phase], 'peak_memory': peaks.get(phase)})
+                for phase in times)
+            if verbose:
+                print(' '.join('%s=%.3fs' % (p, times[p]) for p in PHASES if p in times))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=ROOT,
+            stderr=subprocess.STDOUT).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report_meta():
+    '''Returns the description of the environment stored with the results'''
+    return {
+        'revision': git_revision(),
+        'js2py_version': js2py.__version__,
+        'parser_backend': get_parser_backend().name,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def add_report_arguments(parser):
+    '''Adds the -o and --compare arguments of the benchmark scripts'''
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files')
+
+
+def write_report(results, path, **meta):
+    '''Writes the results with report_meta() (updated with meta) to path or to stdout if None'''
+    report = {'meta': report_meta(), 'results': results}
+    report['meta'].update(meta)
+    if path:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+def load_reports(old_path, new_path):
+    '''Returns the results of two files written by write_report, prints their revisions'''
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print('%s (%s) -> %s (%s)' % (old_path, old['meta']['revision'], new_path,
+                                  new['meta']['revision']))
+    return old['results'], new['results']
+
+
+def ratio(old, new):
+    return float(new) / old if old else float('nan')
+
+
+def compare(old_path, new_path):
+    old, new = load_reports(old_path, new_path)
+    print('%-10s %-60s %-11s %10s %10s %7s %10s' % ('runtime', 'case', 'phase', 'old [s]',
+                                                    'new [s]', 'ratio', 'mem ratio'))
+    for runtime in RUNTIMES:
+        for name in sorted(new.get(runtime, {})):
+            before = old.get(runtime, {}).get(name)
+            if before is None:
+                continue
+            after = new[runtime][name]
+            for phase in PHASES:
+                if phase not in before or phase not in after:
+                    continue
+                a, b = before[phase], after[phase]
+                mem_ratio = ('%10.2f' % ratio(a['peak_memory'], b['peak_memory'])
+                             if a['peak_memory'] and b['peak_memory'] else '%10s' % '-')
+                print('%-10s %-60s %-11s %10.4f %10.4f %7.2f %s' %
+                      (runtime, name, phase, a['time'], b['time'], ratio(a['time'], b['time']),
+                       mem_ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Per-phase timings and peak memory of the js2py runtimes.')
+    add_report_arguments(parser)
+    parser.add_argument('--cases', help='regex selecting the cases to run')
+    parser.add_argument('--runtimes', nargs='+', choices=RUNTIMES, default=RUNTIMES)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='do not measure the peak memory (twice as fast)')
+    parser.add_argument('--repeat', type=int, default=STEADY_REPEAT,
+                        help='number of steady state runs (default %d)' % STEADY_REPEAT)
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+    sys.setrecursionlimit(10000)
+    # the results must not depend on the optional parser backends installed
+    set_parser_backend('pyjsparser')
+    results = benchmark(args.cases, args.runtimes, not args.no_memory, args.repeat)
+    write_report(results, args.output, steady_repeat=args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Shows how the translation time scales with the number of inline definitions (object, array
+and function literals) in a bundle. Doubling the bundle should roughly double the time.
+
+    python benchmarks/translation_scaling.py [max_size]
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from js2py.translators import translating_nodes
+from js2py.utils.parsers import parse
+
+# every module has 4 inline definitions: 2 functions, an object and an array
+MODULE = '''
+var m%d = (function () {
+    var state = {count: %d, items: [1, 2, 3]};
+    return function (x) { state.count += x; return state.count; };
+})();
+'''
+
+
+def bundle(size):
+    return ''.join(MODULE % (n, n) for n in range(size))
+
+
+def measure(size):
+    tree = parse(bundle(size))
+    translating_nodes.clean_stacks()
+    start = time.time()
+    translating_nodes.trans(tree)
+    return time.time() - start
+
+
+def main(max_size=16000):
+    sys.setrecursionlimit(10000)
+    print('%8s %8s %10s %12s' % ('modules', 'inlines', 'time [s]', 'us / inline'))
+    size = 1000
+    while size <= max_size:
+        t = measure(size)
+        print('%8d %8d %10.3f %12.1f' % (size, 4 * size, t, 1e6 * t / (4 * size)))
+        size *= 2
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -62,11 +62,13 @@
 """
 
 __author__ = 'Piotr Dabkowski'
+__version__ = '0.74'
 __all__ = [
     'EvalJs', 'translate_js', 'import_js', 'eval_js', 'parse_js',
     'translate_file', 'run_file', 'disable_pyimport', 'eval_js6',
     'translate_js6', 'PyJsException', 'get_file_contents',
-    'write_file_contents', 'require'
+    'write_file_contents', 'require', 'enable_disk_cache',
+    'disable_disk_cache', 'SnippetCache', 'enable_parse_cache', 'disable_parse_cache'
 ]
 
 from .base import PyJsException
@@ -5,7 +5,7 @@ import re
 from .translators.friendly_nodes import REGEXP_CONVERTER
 from .utils.injector import fix_js_args
 from types import FunctionType, ModuleType, GeneratorType, BuiltinFunctionType, MethodType, BuiltinMethodType
-from math import floor, log10
+from math import floor, log10, fmod
 import traceback
 try:
     import numpy
@@ -252,6 +252,9 @@ def is_generic_descriptor(desc):
 
 
 class PyJs(object):
+    # no instance dict here so that the primitive wrappers can use __slots__ (the other
+    # subclasses don't define __slots__ and have the instance dict)
+    __slots__ = ()
     PRIMITIVES = frozenset(
         ['String', 'Number', 'Boolean', 'Undefined', 'Null'])
     TYPE = 'Object'
@@ -809,14 +812,8 @@ class PyJs(object):
             return NaN
         if abs(b) == float('inf'):
             return Js(a)
-        pyres = Js(a % b)  #different signs in python and javascript
-        #python has the same sign as b and js has the same
-        #sign as a.
-        if a < 0 and pyres.value > 0:
-            pyres.value -= abs(b)
-        elif a > 0 and pyres.value < 0:
-            pyres.value += abs(b)
-        return Js(pyres)
+        # python % has the same sign as b, fmod (like js) has the same sign as a
+        return Js(fmod(a, b))
 
     #Comparisons (I dont implement === and !== here, these
     # will be implemented as external functions later)
@@ -1014,6 +1011,9 @@ if six.PY3:
 
 def PyJsStrictEq(a, b):
     '''a===b'''
+    typ = type(a)
+    if typ is type(b) and (typ is PyJsNumber or typ is PyJsString):
+        return true if a.value == b.value else false
     tx, ty = Type(a), Type(b)
     if tx != ty:
         return false
@@ -1372,6 +1372,8 @@ ObjectPrototype = PyJsObject()
 #Function
 class PyJsFunction(PyJs):
     Class = 'Function'
+    # set to False for the translated functions that never use their arguments object
+    needs_arguments = True
 
     def __init__(self, func, prototype=None, extensible=True, source=None):
         cand = fix_js_args(func)
@@ -1452,8 +1454,11 @@ class PyJsFunction(PyJs):
             args = (args, )
         args = tuple(Js(e) for e in args)  # this wont be needed later
 
-        arguments = PyJsArguments(
-            args, self)  # tuple will be converted to arguments object.
+        if self.needs_arguments:
+            arguments = PyJsArguments(
+                args, self)  # tuple will be converted to arguments object.
+        else:  # the translator knows that the function does not use it
+            arguments = undefined
         arglen = self.argcount  #function expects this number of args.
         if len(args) > arglen:
             args = args[0:arglen]
@@ -1575,8 +1580,99 @@ def Empty():
 
 #Number
 class PyJsNumber(PyJs):  #Note i dont implement +0 and -0. Just 0.
+    # Primitives have no own properties (own is the empty dict of PyJs, never modified
+    # because they are not extensible) so only the value and the prototype are stored.
+    __slots__ = ('value', 'prototype')
     TYPE = 'Number'
     Class = 'Number'
+    extensible = False
+
+    def __init__(self, value=None, prototype=None):
+        self.value = value
+        self.prototype = prototype
+
+    def get_own_property(self, prop):
+        return None
+
+    # Fast paths of the most common operations: operators with two numbers work directly on the
+    # python floats and create the result with number (no Js conversion), other operands are
+    # left to the generic PyJs methods.
+    def to_number(self):
+        return self
+
+    def to_boolean(self):
+        return true if self.value and self.value == self.value else false
+
+    def __nonzero__(self):
+        return bool(self.value) and self.value == self.value
+
+    __bool__ = __nonzero__
+
+    def __neg__(self):
+        return number(-self.value)
+
+    def __add__(self, other):
+        if type(other) is PyJsNumber:
+            return number(self.value + other.value)
+        return PyJs.__add__(self, other)
+
+    def __sub__(self, other):
+        if type(other) is PyJsNumber:
+            return number(self.value - other.value)
+        return PyJs.__sub__(self, other)
+
+    def __mul__(self, other):
+        if type(other) is PyJsNumber:
+            return number(self.value * other.value)
+        return PyJs.__mul__(self, other)
+
+    def __div__(self, other):
+        if type(other) is PyJsNumber and other.value:
+            return number(self.value / other.value)
+        return PyJs.__div__(self, other)
+
+    __truediv__ = __div__
+
+    # comparisons with NaN are false both in python and js
+    def __lt__(self, other):
+        if type(other) is PyJsNumber:
+            return true if self.value < other.value else false
+        return PyJs.__lt__(self, other)
+
+    def __le__(self, other):
+        if type(other) is PyJsNumber:
+            return true if self.value <= other.value else false
+        return PyJs.__le__(self, other)
+
+    def __gt__(self, other):
+        if type(other) is PyJsNumber:
+            return true if self.value > other.value else false
+        return PyJs.__gt__(self, other)
+
+    def __ge__(self, other):
+        if type(other) is PyJsNumber:
+            return true if self.value >= other.value else false
+        return PyJs.__ge__(self, other)
+
+    def __eq__(self, other):
+        if type(other) is PyJsNumber:
+            return true if self.value == other.value else false
+        return PyJs.__eq__(self, other)
+
+    def __ne__(self, other):
+        if type(other) is PyJsNumber:
+            return false if self.value == other.value else true
+        return PyJs.__ne__(self, other)
+
+    __hash__ = PyJs.__hash__
+
+
+def number(value):
+    '''Same as Js(value) for python float value'''
+    cand = NUM_BANK.get(value)
+    if cand is None:
+        return PyJsNumber(value, NumberPrototype)
+    return cand
 
 
 NumberPrototype = PyJsObject({}, ObjectPrototype)
@@ -1598,6 +1694,7 @@ PyJs.CHAR_BANK = CHAR_BANK
 # Different than implementation design in order to improve performance
 #for example I dont create separate property for each character in string, it would take ages.
 class PyJsString(PyJs):
+    __slots__ = ('value', 'prototype')
     TYPE = 'String'
     Class = 'String'
     extensible = False
@@ -1608,22 +1705,31 @@ class PyJsString(PyJs):
             raise TypeError  # this will be internal error
         self.value = value
         self.prototype = prototype
-        self.own = {}
-        # this should be optimized because its mych slower than python str creation (about 50 times!)
-        # Dont create separate properties for every index. Just
-        self.own['length'] = {
-            'value': Js(len(value)),
-            'writable': False,
-            'enumerable': False,
-            'configurable': False
-        }
+        # Dont create separate properties for every index. The length property is created
+        # only when requested (see get_own_property)
         if len(value) == 1:
             CHAR_BANK[value] = self  #, 'writable': False,
             # 'enumerable': True, 'configurable': False}
 
+    @property
+    def own(self):
+        return {'length': self.get_own_property('length')}
+
+    def get_own_property(self, prop):
+        if prop == 'length':
+            return {
+                'value': number(len(self.value)),
+                'writable': False,
+                'enumerable': False,
+                'configurable': False
+            }
+        return None
+
     def get(self, prop):
         if not isinstance(prop, basestring):
             prop = prop.to_string().value
+        if prop == 'length':
+            return number(len(self.value))
         try:
             index = int(prop)
             if index < 0:
@@ -1639,6 +1745,22 @@ class PyJsString(PyJs):
     def can_put(self, prop):
         return False
 
+    def to_string(self):
+        return self
+
+    def to_boolean(self):
+        return true if self.value else false
+
+    def __nonzero__(self):
+        return bool(self.value)
+
+    __bool__ = __nonzero__
+
+    def __add__(self, other):
+        if type(other) is PyJsString:
+            return Js(self.value + other.value)
+        return PyJs.__add__(self, other)
+
     def __iter__(self):
         for i in xrange(len(self.value)):
             yield Js(i)  # maybe create an int bank?
@@ -1653,8 +1775,28 @@ CHAR_BANK[''] = Js('')
 
 #Boolean
 class PyJsBoolean(PyJs):
+    __slots__ = ('value', 'prototype')
     TYPE = 'Boolean'
     Class = 'Boolean'
+    extensible = False
+
+    def __init__(self, value=None, prototype=None):
+        self.value = value
+        self.prototype = prototype
+
+    def get_own_property(self, prop):
+        return None
+
+    def to_boolean(self):
+        return self
+
+    def __nonzero__(self):
+        return self.value
+
+    __bool__ = __nonzero__
+
+    def neg(self):
+        return false if self.value else true
 
 
 BooleanPrototype = PyJsObject({}, ObjectPrototype)
@@ -0,0 +1,228 @@
+'''Ahead-of-time compiler of JavaScript bundles.
+
+Translates a directory of JS files into a Python package of precompiled modules so that
+translated libraries can be shipped (eg. in a container) and never translated at runtime:
+
+    $ python -m js2py.compile path/to/js_libs path/to/jslibs [--bytecode-only]
+
+Every JS file becomes one module of the package (lib/my-lib.js becomes lib_my_lib). Modules
+are imported lazily, only when they are first accessed (or via load(name) on python 2), and
+each one runs in its own global scope. Like with translate_file, the module exposes its global
+scope under the module name, and the values of the declared globals after the module ran also as
+module attributes:
+
+>>> import jslibs
+>>> jslibs.MANIFEST['modules']['example']
+{'exports': ['someFunction'], 'source': 'example.js'}
+>>> jslibs.example.someFunction(1)
+>>> from jslibs.example import example
+
+The manifest (also written to manifest.json) maps every module to its source file and the
+names it declares in its global scope. With --bytecode-only only the .pyc files are written,
+those can only be imported by the same Python version that compiled them.
+'''
+from __future__ import print_function
+
+__all__ = ['compile_bundle', 'compile_file']
+
+import os
+import re
+import sys
+import json
+import codecs
+import keyword
+import pprint
+import argparse
+import py_compile
+
+from . import __version__ as JS2PY_VERSION
+from .translators.translator import translate_js
+from .utils import parse_cache
+from .utils.disk_cache import PYTHON_TAG
+
+MODULE_HEADER = u'''# Generated by js2py.compile from %s, do not edit.
+from js2py.pyjs import *
+# setting scope
+var = new_global_scope()
+
+# Code follows:
+'''
+
+MODULE_FOOTER = u'''
+
+# Add lib to the module scope
+%s = var.to_python()
+__all__ = %r
+globals().update((_name, getattr(%s, _name)) for _name in __all__[1:])
+'''
+
+PACKAGE_INIT = u'''"""JavaScript modules compiled by js2py.compile, do not edit.
+
+Modules are imported lazily, on first access."""
+import importlib
+
+MANIFEST = %s
+
+__all__ = sorted(MANIFEST['modules'])
+
+
+def load(name):
+    """Imports and returns the compiled module name"""
+    if name not in MANIFEST['modules']:
+        raise ImportError('No compiled JavaScript module named %%r' %% name)
+    return importlib.import_module('.' + name, __name__)
+
+
+def __getattr__(name):
+    if name in MANIFEST['modules']:
+        return load(name)
+    raise AttributeError('module %%r has no attribute %%r' %% (__name__, name))
+'''
+
+JS_EXTENSIONS = ('.js', )
+
+
+def module_name(rel_path):
+    '''Python module name of the JS file at rel_path (relative to the bundle root)'''
+    name = os.path.splitext(rel_path)[0].replace(os.sep, '_').replace('/', '_')
+    name = re.sub(r'\W', '_', name)
+    if not name or name[0].isdigit() or keyword.iskeyword(name):
+        name = '_' + name
+    return name
+
+
+def declared_names(node, names=None):
+    '''Returns names declared by var statements and function declarations in the global scope
+       of the syntax tree node.'''
+    if names is None:
+        names = []
+    if isinstance(node, list):
+        for e in node:
+            declared_names(e, names)
+    elif isinstance(node, dict):
+        typ = node.get('type')
+        if typ == 'FunctionDeclaration':
+            if node['id']['name'] not in names:
+                names.append(node['id']['name'])
+            return names
+        elif typ in ('FunctionExpression', 'ArrowFunctionExpression'):
+            return names
+        elif typ == 'VariableDeclarator':
+            if node['id']['name'] not in names:
+                names.append(node['id']['name'])
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                declared_names(value, names)
+    return names
+
+
+def compile_file(input_path, output_path, name=None, bytecode_only=False):
+    '''Translates the JS file input_path to the python module output_path and compiles it.
+       Returns the list of exported names.'''
+    with codecs.open(input_path, 'r', 'utf-8') as f:
+        js = f.read()
+    if name is None:
+        name = module_name(os.path.basename(input_path))
+
+    parsed = []
+
+    def parse_fn(code):
+        # keep the tree to find the declared names, it is not modified so it can be shared
+        parsed.append(parse_cache.parse(code))
+        return parsed[0]
+
+    py_code = translate_js(js, HEADER=u'', parse_fn=parse_fn)
+    exports = declared_names(parsed[0])
+
+    # only valid python identifiers can become module attributes
+    attrs = [
+        e for e in exports if re.match(r'^[A-Za-z_]\w*$', e) and
+        not keyword.iskeyword(e) and e != name
+    ]
+    source = (MODULE_HEADER % os.path.basename(input_path) + py_code +
+              MODULE_FOOTER % (name, [name] + attrs, name))
+    with codecs.open(output_path, 'w', 'utf-8') as f:
+        f.write(source)
+    _compile_module(output_path, bytecode_only)
+    return exports
+
+
+def _compile_module(path, bytecode_only=False):
+    if bytecode_only:
+        # sourceless modules have to be placed next to the (removed) source
+        py_compile.compile(path, cfile=path + 'c', doraise=True)
+        os.remove(path)
+    else:
+        py_compile.compile(path, doraise=True)
+
+
+def compile_bundle(src, output_dir, bytecode_only=False, verbose=False):
+    '''Compiles all JS files in directory src (recursively) into the python package output_dir.
+       Returns the manifest.'''
+    manifest = {
+        'js2py_version': JS2PY_VERSION,
+        'python_tag': PYTHON_TAG,
+        'bytecode_only': bytecode_only,
+        'modules': {}
+    }
+    sources = []
+    for root, dirs, files in os.walk(src):
+        dirs.sort()
+        for f in sorted(files):
+            if f.endswith(JS_EXTENSIONS):
+                sources.append(os.path.relpath(os.path.join(root, f), src))
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    for rel_path in sources:
+        name = module_name(rel_path)
+        if name in manifest['modules']:
+            raise ValueError('%s and %s map to the same module name %s' %
+                             (rel_path, manifest['modules'][name]['source'], name))
+        if name in ('load', 'MANIFEST'):
+            raise ValueError('%s can not be used as a module name (%s)' %
+                             (name, rel_path))
+        if verbose:
+            print('Compiling %s -> %s' % (rel_path, name))
+        output_path = os.path.join(output_dir, name + '.py')
+        exports = compile_file(
+            os.path.join(src, rel_path), output_path, name, bytecode_only)
+        manifest['modules'][name] = {
+            'source': rel_path.replace(os.sep, '/'),
+            'exports': exports
+        }
+
+    with codecs.open(os.path.join(output_dir, 'manifest.json'), 'w', 'utf-8') as f:
+        f.write(json.dumps(manifest, indent=2, sort_keys=True))
+    init_path = os.path.join(output_dir, '__init__.py')
+    with codecs.open(init_path, 'w', 'utf-8') as f:
+        f.write(PACKAGE_INIT % pprint.pformat(manifest))
+    _compile_module(init_path, bytecode_only)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m js2py.compile',
+        description='Translates a directory of JavaScript files into a package of '
+        'precompiled, lazily imported python modules.')
+    parser.add_argument('src', help='directory with the JavaScript files')
+    parser.add_argument('output', help='directory of the generated python package')
+    parser.add_argument(
+        '--bytecode-only',
+        action='store_true',
+        help='write only .pyc files (importable only by this python version)')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.src):
+        parser.error('%s is not a directory' % args.src)
+    manifest = compile_bundle(
+        args.src, args.output, args.bytecode_only, verbose=not args.quiet)
+    if not args.quiet:
+        print('Compiled %d modules into %s' % (len(manifest['modules']),
+                                               args.output))
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    main()
@@ -1,6 +1,10 @@
 # coding=utf-8
 from .translators import translate_js, DEFAULT_HEADER
+from .translators.translator import compile_js_with_compilation_plan, CP_FUNCTION, translate_js_stream, STREAM_CHUNK_SIZE
 from .es6 import js6_to_js5
+from .utils.disk_cache import enable_disk_cache, disable_disk_cache, get_disk_cache
+from .utils.snippet_cache import SnippetCache
+from .utils.parse_cache import enable_parse_cache, disable_parse_cache
 import sys
 import time
 import json
@@ -12,10 +16,15 @@ import codecs
 __all__ = [
     'EvalJs', 'translate_js', 'import_js', 'eval_js', 'translate_file',
     'eval_js6', 'translate_js6', 'run_file', 'disable_pyimport',
-    'get_file_contents', 'write_file_contents'
+    'get_file_contents', 'write_file_contents', 'enable_disk_cache',
+    'disable_disk_cache', 'SnippetCache', 'enable_parse_cache', 'disable_parse_cache'
 ]
 DEBUG = False
 
+# compilation plans are defined here and not in the contexts, they only need the js2py.pyjs names
+COMPILATION_PLAN_GLOBALS = {}
+exec ('from js2py.pyjs import *', COMPILATION_PLAN_GLOBALS)
+
 
 def disable_pyimport():
     import pyjsparser.parser
@@ -57,7 +66,7 @@ def write_file_contents(path_or_file, contents):
             f.write(contents)
 
 
-def translate_file(input_path, output_path):
+def translate_file(input_path, output_path, streaming=False):
     '''
     Translates input JS file to python and saves the it to the output path.
     It appends some convenience code at the end so that it is easy to import JS objects.
@@ -69,14 +78,24 @@ def translate_file(input_path, output_path):
     >>> from example import example
     >>> example.a(30)
     30
+
+    With streaming the python code is written statement by statement (see translate_js_stream),
+    use it for very large files.
     '''
     js = get_file_contents(input_path)
 
-    py_code = translate_js(js)
     lib_name = os.path.basename(output_path).split('.')[0]
     head = '__all__ = [%s]\n\n# Don\'t look below, you will not understand this Python code :) I don\'t.\n\n' % repr(
         lib_name)
     tail = '\n\n# Add lib to the module scope\n%s = var.to_python()' % lib_name
+    if streaming:
+        with codecs.open(path_as_local(output_path), "w", "utf-8") as f:
+            f.write(head)
+            for code in translate_js_stream(js):
+                f.write(code)
+            f.write(tail)
+        return
+    py_code = translate_js(js)
     out = head + py_code + tail
     write_file_contents(output_path, out)
 
@@ -148,9 +167,16 @@ class EvalJs(object):
         >>> ctx.execute("var esprima = require('esprima');")
         >>> ctx.execute("esprima.parse('var a = 1')")
 
+        cache is the SnippetCache used by execute to store compiled snippets. By default every EvalJs
+        gets its own unbounded cache, pass a bounded one (possibly shared by many EvalJs instances)
+        in long running processes:
+        >>> cache = SnippetCache(max_entries=10000, ttl=3600)
+        >>> ctx = EvalJs(cache=cache)
+
        You can run interactive javascript console with console method!"""
 
-    def __init__(self, context={}, enable_require=False):
+    def __init__(self, context={}, enable_require=False, cache=None):
+        self.__dict__['cache'] = cache if cache is not None else SnippetCache()
         self.__dict__['_context'] = {}
         exec (DEFAULT_HEADER, self._context)
         self.__dict__['_var'] = self._context['var'].to_python()
@@ -178,26 +204,50 @@ class EvalJs(object):
         run the same javascript snippet you save many instructions needed to parse and convert the
         js code to python code.
 
-        This cache causes minor overhead (a cache dicts is updated) but the Js=>Py conversion process
+        This cache causes minor overhead (the cache is updated) but the Js=>Py conversion process
         is typically expensive compared to actually running the generated python code.
 
-        Note that the cache is just a dict, it has no expiration or cleanup so when running this
+        Note that by default the cache has no expiration or cleanup so when running this
         in automated situations with vast amounts of snippets it might increase memory usage.
+        Pass a bounded SnippetCache to the EvalJs constructor in that case.
+
+        If the disk cache is enabled (see enable_disk_cache) compiled code is also stored on disk
+        so that it survives process restarts.
+
+        With use_compilation_plan snippets that differ only in their string and numeric literals
+        share one translated and compiled code object, the literals are passed to it at run time.
         """
-        try:
-            cache = self.__dict__['cache']
-        except KeyError:
-            cache = self.__dict__['cache'] = {}
+        if use_compilation_plan:
+            plan = compile_js_with_compilation_plan(js)
+            if plan is not None:
+                code, constants, keys = plan
+                namespace = {}
+                exec (code, COMPILATION_PLAN_GLOBALS, namespace)
+                namespace[CP_FUNCTION](self._context['var'], constants, keys)
+                return
+        cache = self.__dict__['cache']
         hashkey = hashlib.md5(js.encode('utf-8')).digest()
-        try:
-            compiled = cache[hashkey]
-        except KeyError:
-            code = translate_js(
-                js, '', use_compilation_plan=use_compilation_plan)
-            compiled = cache[hashkey] = compile(code, '<EvalJS snippet>',
-                                                'exec')
+        compiled = cache.get(hashkey)
+        if compiled is None:
+            dc = get_disk_cache()
+            compiled = dc.get('code', js) if dc is not None else None
+            if compiled is None:
+                code = translate_js(js, '')
+                compiled = compile(code, '<EvalJS snippet>', 'exec')
+                if dc is not None:
+                    dc.set('code', js, compiled)
+            cache.set(hashkey, compiled)
         exec (compiled, self._context)
 
+    def execute_stream(self, js, chunk_size=STREAM_CHUNK_SIZE):
+        """executes javascript js in current context like execute, but the translated code is
+        compiled and executed in chunks of whole top-level statements, so that the memory used
+        stays bounded also for very large bundles. Nothing is cached."""
+        for n, code in enumerate(translate_js_stream(js, '', chunk_size=chunk_size)):
+            compiled = compile(code, '<EvalJS snippet chunk %d>' % n, 'exec')
+            del code
+            exec (compiled, self._context)
+
     def eval(self, expression, use_compilation_plan=False):
         """evaluates expression in current context and returns its value"""
         code = 'PyJsEvalResult = eval(%s)' % json.dumps(expression)
@@ -1 +1 @@
-from .seval import eval_js_vm
\ No newline at end of file
+from .seval import eval_js_vm, VmProgram
\ No newline at end of file
@@ -22,6 +22,16 @@ def Type(obj):
     return obj.TYPE
 
 
+# version of the prototype objects watched by the inline caches (see PropertyCache). Bumped when
+# a watched object gets or loses an own property, which invalidates all the caches.
+PROTOTYPE_VERSION = 0
+
+
+def invalidate_property_caches():
+    global PROTOTYPE_VERSION
+    PROTOTYPE_VERSION += 1
+
+
 # 8.6.2
 class PyJs(object):
     TYPE = 'Object'
@@ -31,6 +41,12 @@ class PyJs(object):
     Class = None
     extensible = True
     value = None
+    # set on the objects that are a part of a prototype chain cached by a PropertyCache
+    is_watched = False
+    # layout of the own properties of the PyJsObjects, None when they are stored in own
+    shape = None
+    # elements of the PyJsArrays in the dense mode
+    dense = None
 
     own = {}
 
@@ -81,6 +97,8 @@ class PyJs(object):
             desc['set'].call(
                 self, (val, ))  # calling setter on own or inherited element
         else:  # new property
+            if self.is_watched:
+                invalidate_property_caches()
             self.own[prop] = {
                 'value': val,
                 'writable': True,
@@ -114,6 +132,12 @@ class PyJs(object):
         # takes py returns Py
         return self.get_property(prop) is not None
 
+    def own_keys(self, enumerable_only=False):
+        # returns the list of the names of own properties
+        if enumerable_only:
+            return [e for e, d in six.iteritems(self.own) if d.get('enumerable')]
+        return list(self.own)
+
     def delete(self, prop, throw=False):
         assert type(prop) == unicode
         # takes py, returns py
@@ -121,6 +145,8 @@ class PyJs(object):
         if desc is None:
             return True
         if desc['configurable']:
+            if self.is_watched:
+                invalidate_property_caches()
             del self.own[prop]
             return True
         if throw:
@@ -157,6 +183,8 @@ class PyJs(object):
                                     'Could not define own property')
                 return False
             # extensible must be True
+            if self.is_watched:
+                invalidate_property_caches()
             if is_data_descriptor(desc) or is_generic_descriptor(desc):
                 DEFAULT_DATA_DESC = {
                     'value': undefined,  # undefined
@@ -310,6 +338,199 @@ def get_member_dot(self, prop, space):
         raise RuntimeError('Unknown type! - ' + repr(typ))
 
 
+# types using the PyJs implementation of the property getting and putting, see PropertyCache
+_PLAIN_GET = {}
+_PLAIN_PUT = {}
+
+
+def _uses_pyjs_methods(typ, names):
+    for name in names:
+        meth = six.get_unbound_function(getattr(typ, name))
+        if meth is not six.get_unbound_function(getattr(
+                PyJs, name)) and meth is not six.get_unbound_function(
+                    getattr(PyJsObject, name)):
+            return False
+    return True
+
+
+class PropertyCache(object):
+    """Inline cache of a member access with the constant name prop, used by the VM ops.
+
+    Remembers the property descriptors (or None if missing) found in the prototype chains starting
+    at up to MAX_ENTRIES different prototypes. Own properties of the objects are checked on every
+    access so the cache is valid until an object in a cached chain gets or loses an own property,
+    such objects are watched and invalidate all the caches (see PROTOTYPE_VERSION). Watched
+    objects use the dictionary mode so that the cached descriptors stay up to date. Accesses
+    not handled by PyJs.get and PyJs.put (strings length and indices, arrays, scopes etc.) are
+    not cached. The entries hold the prototypes, so the caches of a tape run in another space
+    must be cleared (see Code.clear_property_caches)."""
+    MAX_ENTRIES = 4
+
+    def __init__(self, prop):
+        self.prop = prop
+        self.string_special = prop == 'length' or prop.isdigit()
+        self.entries = []
+        self.version = PROTOTYPE_VERSION
+
+    def lookup(self, proto):
+        if self.version != PROTOTYPE_VERSION:
+            self.entries = []
+            self.version = PROTOTYPE_VERSION
+        for cached_proto, desc in self.entries:
+            if cached_proto is proto:
+                return desc
+        if proto is None:
+            return None
+        if len(self.entries) >= self.MAX_ENTRIES:
+            return proto.get_property(self.prop)
+        obj = proto
+        while obj is not None:
+            obj.is_watched = True
+            if obj.shape is not None:
+                # the cached descriptors must be the ones updated by put
+                obj._to_dictionary_mode()
+            if self.prop in obj.own:
+                break
+            obj = obj.prototype
+        desc = proto.get_property(self.prop)
+        self.entries.append((proto, desc))
+        return desc
+
+    def clear(self):
+        self.entries = []
+
+    def get(self, obj, space):
+        """same as get_member_dot(obj, prop, space)"""
+        typ = type(obj)
+        if typ not in PRIMITIVES:
+            plain = _PLAIN_GET.get(typ)
+            if plain is None:
+                plain = _PLAIN_GET[typ] = _uses_pyjs_methods(
+                    typ, ('get', 'get_property', 'get_own_property'))
+            if not plain:
+                return obj.get(self.prop)
+            shape = obj.shape
+            if shape is not None:
+                index = shape.index.get(self.prop)
+                if index is not None:  # shapes only hold data properties
+                    return obj.slots[index]
+                desc = self.lookup(obj.prototype)
+            else:
+                desc = obj.own.get(self.prop)
+                if desc is None:
+                    desc = self.lookup(obj.prototype)
+            this = obj
+        else:
+            # primitives use the properties of their prototypes
+            if typ is unicode and not self.string_special:
+                this = space.StringPrototype
+            elif typ is float:
+                this = space.NumberPrototype
+            elif typ is bool:
+                this = space.BooleanPrototype
+            else:
+                return get_member_dot(obj, self.prop, space)
+            desc = self.lookup(this)
+        if desc is None:
+            return undefined
+        if 'value' in desc:
+            return desc['value']
+        if is_undefined(desc['get']):
+            return undefined
+        return desc['get'].call(this)
+
+    def put(self, obj, val):
+        """same as obj.put(prop, val), obj must be an object"""
+        typ = type(obj)
+        plain = _PLAIN_PUT.get(typ)
+        if plain is None:
+            plain = _PLAIN_PUT[typ] = _uses_pyjs_methods(
+                typ, ('put', 'can_put', 'get_property', 'get_own_property'))
+        if plain:
+            shape = obj.shape
+            if shape is not None:
+                index = shape.index.get(self.prop)
+                if index is not None:
+                    if shape.attributes[index][0]:  # writable
+                        obj.slots[index] = val
+                        return
+                elif obj.extensible and not obj.is_watched and self.lookup(
+                        obj.prototype) is None:
+                    obj._add_property(self.prop, DEFAULT_ATTRIBUTES, val)
+                    return
+            else:
+                desc = obj.own.get(self.prop)
+                if desc is not None:
+                    if desc.get('writable'):
+                        desc['value'] = val
+                        return
+                elif obj.extensible and not obj.is_watched and self.lookup(
+                        obj.prototype) is None:
+                    obj.own[self.prop] = {
+                        'value': val,
+                        'writable': True,
+                        'configurable': True,
+                        'enumerable': True
+                    }
+                    return
+        obj.put(self.prop, val)
+
+
+# Shapes
+
+# (writable, enumerable, configurable) of the properties created by assignments
+DEFAULT_ATTRIBUTES = (True, True, True)
+
+
+class Shape(object):
+    """Layout of the own properties of PyJsObjects, shared by all the objects that got the same
+    data properties with the same attributes in the same order. The objects only keep the list
+    of the values (slots) and the shapes form a tree of transitions starting at EMPTY_SHAPE."""
+    __slots__ = ('parent', 'keys', 'attributes', 'index', 'transitions')
+
+    # objects with more properties and shapes with more transitions use the dictionary mode
+    MAX_PROPERTIES = 64
+    MAX_TRANSITIONS = 32
+
+    def __init__(self, parent=None, prop=None, attributes=None):
+        self.parent = parent
+        self.transitions = {}
+        if parent is None:
+            self.keys = ()
+            self.attributes = ()
+            self.index = {}
+        else:
+            self.keys = parent.keys + (prop, )
+            self.attributes = parent.attributes + (attributes, )
+            self.index = dict(parent.index)
+            self.index[prop] = len(parent.keys)
+
+    def add(self, prop, attributes):
+        """Returns the shape with the new property or None if the object should use the dictionary
+        mode instead."""
+        key = prop, attributes
+        shape = self.transitions.get(key)
+        if shape is None:
+            if len(self.keys) >= self.MAX_PROPERTIES or len(
+                    self.transitions) >= self.MAX_TRANSITIONS:
+                return None
+            shape = self.transitions[key] = Shape(self, prop, attributes)
+        return shape
+
+
+EMPTY_SHAPE = Shape()
+
+
+class _DictionaryMode(object):
+    """Non-data descriptor of PyJsObject.own, called only while the object has a shape so that
+    the code using own directly keeps working."""
+
+    def __get__(self, obj, typ=None):
+        if obj is None:
+            return self
+        return obj._to_dictionary_mode()
+
+
 # Object
 
 
@@ -317,36 +538,173 @@ class PyJsObject(PyJs):
     TYPE = 'Object'
     Class = 'Object'
 
+    # objects start with a shape and go to the dictionary mode when they get an accessor,
+    # change the attributes or delete a property (other than the last one), or get too big
+    own = _DictionaryMode()
+
     def __init__(self, prototype=None):
         self.prototype = prototype
-        self.own = {}
+        self.shape = EMPTY_SHAPE
+        self.slots = []
+
+    def _to_dictionary_mode(self):
+        own = {}
+        for prop, (writable, enumerable, configurable), value in zip(
+                self.shape.keys, self.shape.attributes, self.slots):
+            own[prop] = {
+                'value': value,
+                'writable': writable,
+                'enumerable': enumerable,
+                'configurable': configurable
+            }
+        self.shape = None
+        self.slots = None
+        self.own = own
+        return own
+
+    def _add_property(self, prop, attributes, val):
+        if self.is_watched:
+            invalidate_property_caches()
+        shape = self.shape
+        if shape is not None:
+            shape = shape.add(prop, attributes)
+        if shape is None:
+            writable, enumerable, configurable = attributes
+            self.own[prop] = {
+                'value': val,
+                'writable': writable,
+                'enumerable': enumerable,
+                'configurable': configurable
+            }
+        else:
+            self.shape = shape
+            self.slots.append(val)
+
+    def get(self, prop):
+        shape = self.shape
+        if shape is None:
+            return PyJs.get(self, prop)
+        index = shape.index.get(prop)
+        if index is not None:
+            return self.slots[index]
+        if self.prototype is None:
+            return undefined
+        cand = self.prototype.get_property(prop)
+        if cand is None:
+            return undefined
+        if is_data_descriptor(cand):
+            return cand['value']
+        if is_undefined(cand['get']):
+            return undefined
+        return cand['get'].call(self)
+
+    def get_own_property(self, prop):
+        shape = self.shape
+        if shape is None:
+            return self.own.get(prop)
+        index = shape.index.get(prop)
+        if index is None:
+            return None
+        # a copy, changes have to go through put and define_own_property
+        writable, enumerable, configurable = shape.attributes[index]
+        return {
+            'value': self.slots[index],
+            'writable': writable,
+            'enumerable': enumerable,
+            'configurable': configurable
+        }
+
+    def get_property(self, prop):
+        shape = self.shape
+        if shape is None:
+            return PyJs.get_property(self, prop)
+        if prop in shape.index:
+            return self.get_own_property(prop)
+        if self.prototype is not None:
+            return self.prototype.get_property(prop)
+
+    def put(self, prop, val, throw=False):
+        shape = self.shape
+        if shape is None:
+            return PyJs.put(self, prop, val, throw)
+        index = shape.index.get(prop)
+        if index is not None and shape.attributes[index][0]:
+            self.slots[index] = val
+            return
+        if not self.can_put(prop):
+            if throw:
+                raise MakeError('TypeError', 'Could not define own property')
+            return
+        desc = self.prototype.get_property(
+            prop) if self.prototype is not None else None
+        if is_accessor_descriptor(desc):
+            desc['set'].call(self, (val, ))  # calling inherited setter
+        else:  # new property
+            self._add_property(prop, DEFAULT_ATTRIBUTES, val)
+
+    def delete(self, prop, throw=False):
+        shape = self.shape
+        if shape is not None:
+            index = shape.index.get(prop)
+            if index is None:
+                return True
+            if index == len(self.slots) - 1 and shape.attributes[index][2]:
+                if self.is_watched:
+                    invalidate_property_caches()
+                self.shape = shape.parent
+                self.slots.pop()
+                return True
+            self._to_dictionary_mode()
+        return PyJs.delete(self, prop, throw)
+
+    def define_own_property(self, prop, desc, throw):
+        shape = self.shape
+        if shape is not None:
+            if prop not in shape.index and self.extensible and not is_accessor_descriptor(
+                    desc):
+                self._add_property(prop, (bool(desc.get('writable')),
+                                          bool(desc.get('enumerable')),
+                                          bool(desc.get('configurable'))),
+                                   desc.get('value', undefined))
+                return True
+            self._to_dictionary_mode()
+        return PyJs.define_own_property(self, prop, desc, throw)
+
+    def own_keys(self, enumerable_only=False):
+        shape = self.shape
+        if shape is None:
+            return PyJs.own_keys(self, enumerable_only)
+        if enumerable_only:
+            return [
+                e for e, attributes in zip(shape.keys, shape.attributes)
+                if attributes[1]
+            ]
+        return list(shape.keys)
 
     def _init(self, props, vals):
         i = 0
         for prop, kind in props:
-            if prop in self.own:  # just check... probably will not happen very often.
-                if is_data_descriptor(self.own[prop]):
+            current = self.get_own_property(prop)
+            if current is not None:  # just check... probably will not happen very often.
+                if is_data_descriptor(current):
                     if kind != 'i':
                         raise MakeError(
                             'SyntaxError',
                             'Invalid object initializer! Duplicate property name "%s"'
                             % prop)
                 else:
-                    if kind == 'i' or (kind == 'g' and 'get' in self.own[prop]
-                                       ) or (kind == 's'
-                                             and 'set' in self.own[prop]):
+                    if kind == 'i' or (kind == 'g' and 'get' in current) or (
+                            kind == 's' and 'set' in current):
                         raise MakeError(
                             'SyntaxError',
                             'Invalid object initializer! Duplicate setter/getter of prop: "%s"'
                             % prop)
 
             if kind == 'i':  # init
-                self.own[prop] = {
-                    'value': vals[i],
-                    'writable': True,
-                    'enumerable': True,
-                    'configurable': True
-                }
+                if current is None:
+                    self._add_property(prop, DEFAULT_ATTRIBUTES, vals[i])
+                else:
+                    self.put(prop, vals[i])
             elif kind == 'g':  # get
                 self.define_own_property(prop, {
                     'get': vals[i],
@@ -373,25 +731,66 @@ class PyJsObject(PyJs):
 # Array
 
 
-# todo Optimise Array - extremely slow due to index conversions from str to int and back etc.
-# solution - make get and put methods callable with any type of prop and handle conversions from inside
-# if not array then use to_string(prop). In array if prop is integer then just use it
-# also consider removal of these stupid writable, enumerable etc for ints.
+def _dense_index(prop):
+    # returns the int value of the prop if it is a canonical array index that can be stored in
+    # a dense array, None otherwise
+    if prop.isdigit() and (prop[0] != '0' or prop == '0'):
+        try:
+            return int(prop)
+        except ValueError:  # some unicode digits
+            return None
+
+
+def _is_default_element(desc, new):
+    # whether the desc keeps (or creates if new) a data property with the default attributes
+    if 'get' in desc or 'set' in desc:
+        return False
+    for attribute in ('writable', 'enumerable', 'configurable'):
+        if desc.get(attribute, None if new else True) is not True:
+            return False
+    return True
+
+
 class PyJsArray(PyJs):
+    """Arrays start in the dense mode: the elements 0..len(dense)-1 are kept in the dense list,
+    the elements between len(dense) and length are holes and there are no other own properties.
+    The array switches to the dictionary mode (own dict with descriptors) when it gets a hole
+    inside, an accessor, an element with non-default attributes or any other own property, and
+    when the code uses own directly."""
     Class = 'Array'
 
+    own = _DictionaryMode()
+
     def __init__(self, length, prototype=None):
         self.prototype = prototype
-        self.own = {
+        self.dense = []
+        self.length = float(length)
+
+    def _to_dictionary_mode(self):
+        own = {
             'length': {
-                'value': float(length),
+                'value': self.length,
                 'writable': True,
                 'enumerable': False,
                 'configurable': False
             }
         }
+        for i, ele in enumerate(self.dense):
+            own[unicode(i)] = {
+                'value': ele,
+                'writable': True,
+                'enumerable': True,
+                'configurable': True
+            }
+        self.dense = None
+        self.length = None
+        self.own = own
+        return own
 
     def _init(self, elements):
+        if self.dense is not None and not self.dense and None not in elements:
+            self.dense = list(elements)
+            return
         for i, ele in enumerate(elements):
             if ele is None: continue
             self.own[unicode(i)] = {
@@ -401,9 +800,92 @@ class PyJsArray(PyJs):
                 'configurable': True
             }
 
+    def get(self, prop):
+        dense = self.dense
+        if dense is not None:
+            if prop == 'length':
+                return self.length
+            index = _dense_index(prop)
+            if index is not None and index < len(dense):
+                return dense[index]
+        return PyJs.get(self, prop)
+
+    def get_member(self, unconverted_prop):
+        dense = self.dense
+        if dense is not None and type(unconverted_prop) is float and 0 <= unconverted_prop < len(dense):
+            index = int(unconverted_prop)
+            if index == unconverted_prop:
+                return dense[index]
+        return self.get(to_string(unconverted_prop))
+
+    def put_member(self, unconverted_prop, val):
+        dense = self.dense
+        if dense is not None and type(unconverted_prop) is float and 0 <= unconverted_prop < len(dense):
+            index = int(unconverted_prop)
+            if index == unconverted_prop:
+                dense[index] = val
+                return
+        return self.put(to_string(unconverted_prop), val)
+
+    def get_own_property(self, prop):
+        dense = self.dense
+        if dense is None:
+            return self.own.get(prop)
+        # copies, changes have to go through put and define_own_property
+        if prop == 'length':
+            return {
+                'value': self.length,
+                'writable': True,
+                'enumerable': False,
+                'configurable': False
+            }
+        index = _dense_index(prop)
+        if index is not None and index < len(dense):
+            return {
+                'value': dense[index],
+                'writable': True,
+                'enumerable': True,
+                'configurable': True
+            }
+        return None
+
+    def delete(self, prop, throw=False):
+        dense = self.dense
+        if dense is not None:
+            index = _dense_index(prop)
+            if index is not None and index < len(dense):
+                if index != len(dense) - 1:
+                    self._to_dictionary_mode()
+                    return PyJs.delete(self, prop, throw)
+                dense.pop()  # a hole at the end
+                return True
+        return PyJs.delete(self, prop, throw)
+
+    def own_keys(self, enumerable_only=False):
+        dense = self.dense
+        if dense is None:
+            return PyJs.own_keys(self, enumerable_only)
+        keys = [] if enumerable_only else ['length']
+        keys.extend(unicode(i) for i in xrange(len(dense)))
+        return keys
+
     def put(self, prop, val, throw=False):
         assert type(val) != int
         # takes py, returns none
+        dense = self.dense
+        if dense is not None:
+            index = _dense_index(prop)
+            if index is not None:
+                if index < len(dense):
+                    dense[index] = val
+                    return
+                if index == len(dense) and self.extensible and (
+                        self.prototype is None
+                        or self.prototype.get_property(prop) is None):
+                    dense.append(val)
+                    if index >= self.length:
+                        self.length = index + 1.
+                    return
         if not self.can_put(prop):
             if throw:
                 raise MakeError('TypeError', 'Could not define own property')
@@ -427,6 +909,30 @@ class PyJsArray(PyJs):
 
     def define_own_property(self, prop, desc, throw):
         assert type(desc.get('value')) != int
+        dense = self.dense
+        if dense is not None:
+            if prop == 'length':
+                if 'value' in desc and _is_default_element(
+                        dict(desc, enumerable=True), False):
+                    new_len = to_uint32(desc['value'])
+                    if new_len != to_number(desc['value']):
+                        raise MakeError('RangeError', 'Invalid range!')
+                    del dense[new_len:]
+                    self.length = float(new_len)
+                    return True
+            else:
+                index = _dense_index(prop)
+                if index is not None and index < len(dense):
+                    if _is_default_element(desc, False):
+                        if 'value' in desc:
+                            dense[index] = desc['value']
+                        return True
+                elif index == len(dense) and _is_default_element(desc, True):
+                    dense.append(desc.get('value', undefined))
+                    if index >= self.length:
+                        self.length = index + 1.
+                    return True
+            self._to_dictionary_mode()
         old_len_desc = self.get_own_property('length')
         old_len = old_len_desc['value']  #  value is js type so convert to py.
         if prop == 'length':
@@ -684,7 +1190,6 @@ class Scope(PyJs):
             # not global, less powerful but faster closure.
             self.own = scope  # simple dictionary which maps name directly to js object.
 
-        self.par = super(Scope, self)
         self.stack = []
 
     def register(self, var):
@@ -714,7 +1219,7 @@ class Scope(PyJs):
         if self.prototype is None:
             desc = self.own.get(var)  # global scope
             if desc is None:
-                self.par.put(var, val, False)
+                PyJs.put(self, var, val, False)
             else:
                 if desc['writable']:  # todo consider getters/setters
                     desc['value'] = val
@@ -774,6 +1279,67 @@ class Scope(PyJs):
         return False
 
 
+class FunctionScope(Scope):
+    """Scope of a call of a function whose variables are known statically. Variables live in the
+    slots list and are accessed by index by the LOAD_SLOT/STORE_SLOT ops, names maps the variable
+    names to their slots for the access by name. names is shared by all the calls."""
+
+    def __init__(self, names, slots, space, parent):
+        self.space = space
+        self.prototype = parent
+        self.names = names
+        self.slots = slots
+        self.own = {}  # variables unknown to the byte generator (added by eval code)
+        self.is_with_scope = False
+        self.stack = []
+
+    def register(self, var):
+        if var not in self.names and var not in self.own:
+            self.own[var] = undefined
+
+    def put(self, var, val, throw=False):
+        slot = self.names.get(var)
+        if slot is not None:
+            self.slots[slot] = val
+            return val
+        elif var in self.own:
+            self.own[var] = val
+            return val
+        return self.prototype.put(var, val)
+
+    def get(self, var, throw=False):
+        slot = self.names.get(var)
+        if slot is not None:
+            return self.slots[slot]
+        cand = self.own.get(var)
+        if cand is None:
+            return self.prototype.get(var, throw)
+        return cand
+
+    def delete(self, var, throw=False):
+        if var in self.names or var in self.own:
+            return False
+        return self.prototype.delete(var)
+
+
+def frame_layout(params, declared, name, is_declaration, uses_arguments=True):
+    """Returns the layout of the frames of a function whose variables are known statically:
+    (names, num_slots, param_slots, arguments_slot, name_slot). names maps the parameters, the
+    declared variables, arguments and the name of a function expression (if not shadowed) to
+    their slots. name_slot is None if the function name is not bound in its own scope and
+    arguments_slot is None if the function never observes its arguments object, so that it
+    does not have to be created."""
+    names = {}
+    for e in tuple(params) + tuple(declared) + ('arguments', ):
+        if e not in names:
+            names[e] = len(names)
+    name_slot = None
+    if name and not is_declaration and name not in names:
+        name_slot = names[name] = len(names)
+    return (names, len(names), tuple(names[e] for e in params),
+            names['arguments'] if uses_arguments else None, name_slot)
+
+
 def get_new_arguments_obj(args, space):
     obj = space.NewObject()
     obj.Class = 'Arguments'
@@ -794,6 +1360,8 @@ class PyJsFunction(PyJs):
     Class = 'Function'
     source = '{ [native code] }'
     IS_CONSTRUCTOR = True
+    # CodeSegment keeping the code of the functions compiled at runtime on the tape
+    segment = None
 
     def __init__(self,
                  code,
@@ -803,7 +1371,8 @@ class PyJsFunction(PyJs):
                  space,
                  is_declaration,
                  definitions,
-                 prototype=None):
+                 prototype=None,
+                 layout=None):
         self.prototype = prototype
         self.own = {}
 
@@ -820,6 +1389,8 @@ class PyJsFunction(PyJs):
         self.params = params
         self.arguments_in_params = 'arguments' in params
         self.definitions = definitions
+        # frame layout (see frame_layout) if the variables are stored in slots
+        self.layout = layout
 
         # todo remove this check later
         for p in params:
@@ -848,12 +1419,12 @@ class PyJsFunction(PyJs):
         if not self.is_native:  # set prototype for user defined functions
             # constructor points to this function
             proto = space.NewObject()
-            proto.own['constructor'] = {
+            proto.define_own_property('constructor', {
                 'value': self,
                 'writable': True,
                 'enumerable': False,
                 'configurable': True
-            }
+            }, False)
             self.own['prototype'] = {
                 'value': proto,
                 'writable': True,
@@ -903,6 +1474,20 @@ class PyJsFunction(PyJs):
         return new
 
     def _generate_my_context(self, this, args):
+        if self.layout is not None:
+            names, num_slots, param_slots, arguments_slot, name_slot = self.layout
+            slots = [undefined] * num_slots
+            for slot, arg in izip(param_slots, args):
+                slots[slot] = arg
+            if arguments_slot is not None and not self.arguments_in_params:
+                slots[arguments_slot] = get_new_arguments_obj(args, self.space)
+            if name_slot is not None:
+                slots[name_slot] = self
+            my_ctx = FunctionScope(names, slots, self.space, self.ctx)
+            my_ctx.THIS_BINDING = this
+            if self.segment is not None:  # keep the code while it is executed
+                my_ctx.segment = self.segment
+            return my_ctx
         my_ctx = Scope(
             dict(izip(self.params, args)), self.space, parent=self.ctx)
         my_ctx.registers(self.definitions)
@@ -913,6 +1498,8 @@ class PyJsFunction(PyJs):
             my_ctx.own[
                 self.
                 name] = self  # this should be immutable binding but come on!
+        if self.segment is not None:
+            my_ctx.segment = self.segment
         return my_ctx
 
 
@@ -3,6 +3,7 @@ from .simplex import MakeError
 from .opcodes import *
 from .operations import *
 from .trans_utils import *
+from .base import frame_layout
 
 SPECIAL_IDENTIFIERS = {'true', 'false', 'this'}
 
@@ -23,6 +24,10 @@ class ByteCodeGenerator:
 
         self.states = []
 
+        # static scope chain of the code being emitted, innermost last:
+        # ('function', names or None if its scope is dynamic), ('catch', param_name) or ('with', None)
+        self.scopes = []
+
     def record_state(self):
         self.states.append(
             (self.declared_continue_labels, self.declared_break_labels,
@@ -37,6 +42,33 @@ class ByteCodeGenerator:
         self.implicit_breaks, self.implicit_continues, \
         self.declared_vars, self.function_declaration_tape = self.states.pop()
 
+    def resolve(self, name):
+        ''' returns (depth, slot) of the variable if it is stored in a slot of a function frame,
+            None if it must be looked up by name (global, dynamic scope, with, catch param). '''
+        depth = 0
+        for kind, data in reversed(self.scopes):
+            if kind == 'function':
+                if data is None:
+                    return None
+                slot = data.get(name)
+                if slot is not None:
+                    return depth, slot
+            elif kind != 'catch' or data == name:
+                return None
+            depth += 1
+        return None
+
+    def _emit_function_body(self, body, params, name, is_declaration):
+        declared, dynamic, uses_arguments = function_scope_info(body)
+        # dynamic functions always get the arguments object, eval code can observe it
+        layout = None if dynamic else frame_layout(params, declared, name,
+                                                   is_declaration, uses_arguments)
+        self.scopes.append(('function', layout[0] if layout else None))
+        self.emit(body)
+        self.ReturnStatement(None)
+        self.scopes.pop()
+        return layout
+
     def ArrayExpression(self, elements, **kwargs):
         for e in elements:
             if e is None:
@@ -68,7 +100,13 @@ class ByteCodeGenerator:
                 raise MakeError('SyntaxError',
                                 'Invalid left-hand side in assignment')
             self.emit(right)
-            if operator:
+            slot = self.resolve(left['name'])
+            if slot is not None:
+                if operator:
+                    self.emit('STORE_OP_SLOT', left['name'], slot[0], slot[1], operator)
+                else:
+                    self.emit('STORE_SLOT', left['name'], slot[0], slot[1])
+            elif operator:
                 self.emit('STORE_OP', left['name'], operator)
             else:
                 self.emit('STORE', left['name'])
@@ -276,6 +314,16 @@ class ByteCodeGenerator:
         if defaults:
             raise NotImplementedError('Defaults not available in ECMA 5.1')
 
+        name = id.get('name')
+        assert name is not None
+        params = tuple(p['name'] for p in params)
+        # declared functions are created on the entry of the enclosing function (or program), so
+        # they are not enclosed by the catch and with scopes the declaration is in
+        outer_scopes = self.scopes
+        self.scopes = outer_scopes[:]
+        while self.scopes and self.scopes[-1][0] != 'function':
+            self.scopes.pop()
+
         # compile function
         self.record_state(
         )  # cleans translator state and appends it to the stack so that it can be later restored
@@ -296,8 +344,7 @@ class ByteCodeGenerator:
         self.emit('LABEL', declarations_done)
         self.function_declaration_tape.append(LABEL(function_declarations))
 
-        self.emit(body)
-        self.ReturnStatement(None)
+        layout = self._emit_function_body(body, params, name, True)
 
         self.function_declaration_tape.append(JUMP(declarations_done))
         self.exe.tape.extend(self.function_declaration_tape)
@@ -307,19 +354,25 @@ class ByteCodeGenerator:
         self.restore_state()
 
         # create function object and append to stack
-        name = id.get('name')
-        assert name is not None
         self.declared_vars.append(name)
         self.function_declaration_tape.append(
-            LOAD_FUNCTION(function_start, tuple(p['name'] for p in params),
-                          name, True, tuple(declared_vars)))
-        self.function_declaration_tape.append(STORE(name))
+            LOAD_FUNCTION(function_start, params, name, True,
+                          tuple(declared_vars), layout))
+        slot = self.resolve(name)
+        if slot is not None:
+            self.function_declaration_tape.append(STORE_SLOT(name, slot[0], slot[1]))
+        else:
+            self.function_declaration_tape.append(STORE(name))
         self.function_declaration_tape.append(POP())
+        self.scopes = outer_scopes
 
     def FunctionExpression(self, id, params, defaults, body, **kwargs):
         if defaults:
             raise NotImplementedError('Defaults not available in ECMA 5.1')
 
+        name = id.get('name') if id else None
+        params = tuple(p['name'] for p in params)
+
         # compile function
         self.record_state(
         )  # cleans translator state and appends it to the stack so that it can be later restored
@@ -340,8 +393,7 @@ class ByteCodeGenerator:
         self.emit('LABEL', declarations_done)
         self.function_declaration_tape.append(LABEL(function_declarations))
 
-        self.emit(body)
-        self.ReturnStatement(None)
+        layout = self._emit_function_body(body, params, name, False)
 
         self.function_declaration_tape.append(JUMP(declarations_done))
         self.exe.tape.extend(self.function_declaration_tape)
@@ -351,10 +403,8 @@ class ByteCodeGenerator:
         self.restore_state()
 
         # create function object and append to stack
-        name = id.get('name') if id else None
-        self.emit('LOAD_FUNCTION', function_start,
-                  tuple(p['name'] for p in params), name, False,
-                  tuple(declared_vars))
+        self.emit('LOAD_FUNCTION', function_start, params, name, False,
+                  tuple(declared_vars), layout)
 
     def Identifier(self, name, **kwargs):
         if name == 'true':
@@ -364,7 +414,11 @@ class ByteCodeGenerator:
         elif name == 'undefined':
             self.emit('LOAD_UNDEFINED')
         else:
-            self.emit('LOAD', name)
+            slot = self.resolve(name)
+            if slot is not None:
+                self.emit('LOAD_SLOT', name, slot[0], slot[1])
+            else:
+                self.emit('LOAD', name)
 
     def IfStatement(self, test, consequent, alternate, **kwargs):
         alt = self.exe.get_new_label()
@@ -557,7 +611,9 @@ class ByteCodeGenerator:
         self.emit('LABEL', catch_label)
         self.emit('LOAD_UNDEFINED')
         if handler:
+            self.scopes.append(('catch', handler['param']['name']))
             self.emit(handler['body'])
+            self.scopes.pop()
         self.emit('NOP')
 
         # finally block
@@ -612,7 +668,11 @@ class ByteCodeGenerator:
                 self.emit('POSTFIX_MEMBER_DOT', post, incr, name)
         elif argument['type'] == 'Identifier':
             name = to_key(argument)
-            self.emit('POSTFIX', post, incr, name)
+            slot = self.resolve(name)
+            if slot is not None:
+                self.emit('POSTFIX_SLOT', post, incr, name, slot[0], slot[1])
+            else:
+                self.emit('POSTFIX', post, incr, name)
         else:
             raise MakeError('SyntaxError',
                             'Invalid left-hand side in assignment')
@@ -634,7 +694,11 @@ class ByteCodeGenerator:
         self.declared_vars.append(name)
         if init is not None:
             self.emit(init)
-            self.emit('STORE', name)
+            slot = self.resolve(name)
+            if slot is not None:
+                self.emit('STORE_SLOT', name, slot[0], slot[1])
+            else:
+                self.emit('STORE', name)
             self.emit('POP')
 
     def WhileStatement(self, test, body, **kwargs):
@@ -666,7 +730,9 @@ class ByteCodeGenerator:
         self.emit('JUMP', end_label)
         self.emit('LABEL', beg_label)
         self.emit('LOAD_UNDEFINED')
+        self.scopes.append(('with', None))
         self.emit(body)
+        self.scopes.pop()
         self.emit('NOP')
         self.emit('LABEL', end_label)
 
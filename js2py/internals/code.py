@@ -1,23 +1,54 @@
 from .opcodes import *
 from .space import *
 from .base import *
+from . import peephole
+
+import sys
+import weakref
+
+import six
+
+if six.PY3:
+    xrange = range
+
+# return location used by _call, it is never on the tape even if the tape is truncated and reused
+END_OF_TAPE = sys.maxsize
+
+# fills the ops of the reclaimed segments that are followed by the segments still in use
+_RECLAIMED = NOP()
+
+
+class CodeSegment(object):
+    '''Handle of the code compiled at runtime by eval or Function (see Code.begin_segment).
+    The code stays on the tape as long as the handle is referenced: by the functions created by
+    the code, by the contexts executing them and by the caller executing the code itself.'''
+
+    def __init__(self, start, first_label):
+        self.start = start
+        self.first_label = first_label
 
 
 class Code:
     '''Can generate, store and run sequence of ops representing js code'''
 
-    def __init__(self, is_strict=False, debug_mode=False):
+    def __init__(self, is_strict=False, debug_mode=False, optimize=None):
         self.tape = []
+        # bound eval methods of the ops on the tape, built by compile
+        self.evals = []
         self.compiled = False
         self.label_locs = None
         self.is_strict = is_strict
         self.debug_mode = debug_mode
+        # run the peephole optimizer on compile, by default peephole.ENABLED
+        self.optimize = optimize
 
         self.contexts = []
         self.current_ctx = None
         self.return_locs = []
         self._label_count = 0
         self.label_locs = None
+        # [weakref to CodeSegment or None when reclaimed, start, end, first_label, last_label]
+        self.segments = []
 
         # useful references
         self.GLOBAL_THIS = None
@@ -36,17 +67,75 @@ class Code:
         self.tape.append(OP_CODES[op_code](*args))
 
     def compile(self, start_loc=0):
-        ''' Records locations of labels and compiles the code '''
+        ''' Records locations of labels and compiles the code: removes the labels, resolves jump
+            targets to tape locations and binds eval of every op. The tape before start_loc must
+            be already compiled. '''
         self.label_locs = {} if self.label_locs is None else self.label_locs
-        loc = start_loc
-        while loc < len(self.tape):
-            if type(self.tape[loc]) == LABEL:
-                self.label_locs[self.tape[loc].num] = loc
-                del self.tape[loc]
-                continue
-            loc += 1
+        tape = self.tape[start_loc:]
+        if self.optimize or (self.optimize is None and peephole.ENABLED):
+            tape = peephole.optimize(tape)
+        ops = []
+        for op in tape:
+            if type(op) == LABEL:
+                self.label_locs[op.num] = start_loc + len(ops)
+            else:
+                ops.append(op)
+        for op in ops:
+            if hasattr(op, 'link'):
+                op.link(self.label_locs)
+        # in place, the lists can be in use by a running interpreter
+        self.tape[start_loc:] = ops
+        self.evals[start_loc:] = [op.eval for op in ops]
         self.compiled = True
 
+    def begin_segment(self):
+        ''' Starts a segment of code compiled at runtime, everything emitted until compile_segment
+            belongs to it: the ops and the labels. Reclaims the unused segments first. '''
+        self.collect_segments()
+        return CodeSegment(len(self.tape), self._label_count + 1)
+
+    def compile_segment(self, segment):
+        self.compile(start_loc=segment.start)
+        ref = weakref.ref(segment)
+        for op in self.tape[segment.start:]:
+            if type(op) is LOAD_FUNCTION:
+                op.segment = ref
+        self.segments.append(
+            [ref, segment.start,
+             len(self.tape), segment.first_label, self._label_count])
+
+    def collect_segments(self):
+        ''' Removes the labels and ops of the segments that are not referenced anymore, the tape
+            is truncated if they are at its end. Must not be called while compiling. '''
+        for record in self.segments:
+            ref, start, end, first_label, last_label = record
+            if ref is not None and ref() is None:
+                for label in xrange(first_label, last_label + 1):
+                    self.label_locs.pop(label, None)
+                self.tape[start:end] = [_RECLAIMED] * (end - start)
+                self.evals[start:end] = [_RECLAIMED.eval] * (end - start)
+                record[0] = None
+        while self.segments and self.segments[-1][0] is None:
+            start = self.segments.pop()[1]
+            del self.tape[start:]
+            del self.evals[start:]
+
+    def clear_property_caches(self):
+        ''' Forgets the prototypes remembered by the inline caches of the ops (see PropertyCache),
+            needed before running the tape in another space. '''
+        for op in self.tape:
+            cache = getattr(op, 'cache', None)
+            if cache is not None:
+                cache.clear()
+
+    def segment_stats(self):
+        ''' Returns the number of live segments and the current size of the tape. '''
+        live = 0
+        for record in self.segments:
+            if record[0] is not None and record[0]() is not None:
+                live += 1
+        return {'live_segments': live, 'tape_size': len(self.tape)}
+
     def _call(self, func, this, args):
         ''' Calls a bytecode function func
             NOTE:  use !ONLY! when calling functions from native methods! '''
@@ -57,7 +146,7 @@ class Code:
         old_curr_ctx = self.current_ctx
 
         self.contexts = [FakeCtx()]
-        self.return_locs = [len(self.tape)]  # target line after return
+        self.return_locs = [END_OF_TAPE]  # target line after return
 
         # prepare my ctx
         my_ctx = func._generate_my_context(this, args)
@@ -114,12 +203,13 @@ class Code:
         initial_len = len(ctx.stack)
         loc = start
         entry_level = len(self.contexts)
+        evals = self.evals
         # for e in self.tape[start:end]:
         #     print e
         if self.debug_mode:
             print(self._get_dbg_indent() + 'ctx entry (from:%d, to:%d)' % (start, end))
-        while loc < len(self.tape):
-            if len(self.contexts) == entry_level and loc >= end:
+        while loc < len(evals):
+            if loc >= end and len(self.contexts) == entry_level:
                 if self.debug_mode:
                     self._on_fragment_exit('normal')
                 assert loc == end
@@ -130,52 +220,48 @@ class Code:
             # execute instruction
             if self.debug_mode:
                 print(self._get_dbg_indent() + str(loc), self.tape[loc])
-            status = self.tape[loc].eval(ctx)
+            status = evals[loc](ctx)
 
             # check status for special actions
-            if status is not None:
-                if type(status) == int:  # jump to label
-                    loc = self.label_locs[status]
-                    if len(self.contexts) == entry_level:
-                        # check if jumped outside of the fragment and break if so
-                        if not start <= loc < end:
-                            if self.debug_mode:
-                                self._on_fragment_exit('jump outside loc:%d label:%d' % (loc, status))
-                            delta_stack = len(ctx.stack) - initial_len
-                            assert delta_stack == +1, 'Stack change must be equal to +1! got %d' % delta_stack
-                            return ctx.stack.pop(), 2, status  # jump outside
-                    continue
-
-                elif len(status) == 2:  # a call or a return!
-                    # call: (new_ctx, func_loc_label_num)
-                    if status[0] is not None:
-                        # append old state to the stack
-                        self.contexts.append(ctx)
-                        self.return_locs.append(loc + 1)
-                        # set new state
-                        loc = self.label_locs[status[1]]
-                        ctx = status[0]
-                        self.current_ctx = ctx
-                        continue
-
-                    # return: (None, None)
-                    else:
-                        if len(self.contexts) == entry_level:
-                            if self.debug_mode:
-                                self._on_fragment_exit('return')
-                            delta_stack = len(ctx.stack) - initial_len
-                            assert delta_stack == +1, 'Stack change must be equal to +1! got %d' % delta_stack
-                            return undefined, 1, ctx.stack.pop(
-                            )  # return signal
-                        return_value = ctx.stack.pop()
-                        ctx = self.contexts.pop()
-                        self.current_ctx = ctx
-                        ctx.stack.append(return_value)
-
-                        loc = self.return_locs.pop()
-                        continue
-            # next instruction
-            loc += 1
+            if status is None:
+                # next instruction
+                loc += 1
+            elif status.__class__ is int:  # jump to location
+                loc = status
+                if len(self.contexts) == entry_level:
+                    # check if jumped outside of the fragment and break if so
+                    if not start <= loc < end:
+                        if self.debug_mode:
+                            self._on_fragment_exit('jump outside loc:%d' % loc)
+                        delta_stack = len(ctx.stack) - initial_len
+                        assert delta_stack == +1, 'Stack change must be equal to +1! got %d' % delta_stack
+                        return ctx.stack.pop(), 2, status  # jump outside
+
+            # call: (new_ctx, func_loc_label_num)
+            elif status[0] is not None:
+                # append old state to the stack
+                self.contexts.append(ctx)
+                self.return_locs.append(loc + 1)
+                # set new state
+                loc = self.label_locs[status[1]]
+                ctx = status[0]
+                self.current_ctx = ctx
+
+            # return: (None, None)
+            else:
+                if len(self.contexts) == entry_level:
+                    if self.debug_mode:
+                        self._on_fragment_exit('return')
+                    delta_stack = len(ctx.stack) - initial_len
+                    assert delta_stack == +1, 'Stack change must be equal to +1! got %d' % delta_stack
+                    return undefined, 1, ctx.stack.pop(
+                    )  # return signal
+                return_value = ctx.stack.pop()
+                ctx = self.contexts.pop()
+                self.current_ctx = ctx
+                ctx.stack.append(return_value)
+
+                loc = self.return_locs.pop()
         if self.debug_mode:
             self._on_fragment_exit('internal error - unexpected end of tape, will crash')
         assert False, 'Remember to add NOP at the end!'
@@ -183,41 +269,40 @@ class Code:
     def run(self, ctx, starting_loc=0):
         loc = starting_loc
         self.current_ctx = ctx
-        while loc < len(self.tape):
+        # the evals list grows in place when code is compiled at runtime (eval, new Function)
+        evals = self.evals
+        debug_mode = self.debug_mode
+        while loc < len(evals):
             # execute instruction
-            if self.debug_mode:
+            if debug_mode:
                 print(loc, self.tape[loc])
-            status = self.tape[loc].eval(ctx)
-
-            # check status for special actions
-            if status is not None:
-                if type(status) == int:  # jump to label
-                    loc = self.label_locs[status]
-                    continue
-
-                elif len(status) == 2:  # a call or a return!
-                    # call: (new_ctx, func_loc_label_num)
-                    if status[0] is not None:
-                        # append old state to the stack
-                        self.contexts.append(ctx)
-                        self.return_locs.append(loc + 1)
-                        # set new state
-                        loc = self.label_locs[status[1]]
-                        ctx = status[0]
-                        self.current_ctx = ctx
-                        continue
-
-                    # return: (None, None)
-                    else:
-                        return_value = ctx.stack.pop()
-                        ctx = self.contexts.pop()
-                        self.current_ctx = ctx
-                        ctx.stack.append(return_value)
-
-                        loc = self.return_locs.pop()
-                        continue
-            # next instruction
-            loc += 1
+            status = evals[loc](ctx)
+
+            # check status for special actions, the most common first
+            if status is None:
+                # next instruction
+                loc += 1
+            elif status.__class__ is int:  # jump to location
+                loc = status
+
+            # call: (new_ctx, func_loc_label_num)
+            elif status[0] is not None:
+                # append old state to the stack
+                self.contexts.append(ctx)
+                self.return_locs.append(loc + 1)
+                # set new state
+                loc = self.label_locs[status[1]]
+                ctx = status[0]
+                self.current_ctx = ctx
+
+            # return: (None, None)
+            else:
+                return_value = ctx.stack.pop()
+                ctx = self.contexts.pop()
+                self.current_ctx = ctx
+                ctx.stack.append(return_value)
+
+                loc = self.return_locs.pop()
         assert len(ctx.stack) == 1, ctx.stack
         return ctx.stack.pop()
 
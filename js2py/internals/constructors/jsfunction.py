@@ -1,7 +1,7 @@
 from ..base import *
 from ..conversions import *
 from ..func_utils import *
-from pyjsparser import parse
+from ...utils.parse_cache import parse
 from ..byte_trans import ByteCodeGenerator, Code
 
 
@@ -24,17 +24,20 @@ def executable_function(_body, _args, space, global_context=True):
     return co()
 
 
-# you can use this one lovely piece of function to compile and execute code on the fly! Watch out though as it may generate lots of code.
-# todo tape cleanup? we dont know which pieces are needed and which are not so rather impossible without smarter machinery something like GC,
-# a one solution would be to have a separate tape for functions
+# you can use this one lovely piece of function to compile and execute code on the fly!
+# The code gets its own segment of the tape which is reclaimed when neither the returned
+# function nor the functions created by the code are referenced anymore (see Code.begin_segment).
 def executable_code(code_str, space, global_context=True):
     # parse first to check if any SyntaxErrors
     parsed = parse(code_str)
 
-    old_tape_len = len(space.byte_generator.exe.tape)
+    exe = space.byte_generator.exe
+    segment = exe.begin_segment()
     space.byte_generator.record_state()
-    start = space.byte_generator.exe.get_new_label()
-    skip = space.byte_generator.exe.get_new_label()
+    # the code is not enclosed by any statically known scope, its variables are looked up by name
+    space.byte_generator.scopes = []
+    start = exe.get_new_label()
+    skip = exe.get_new_label()
     space.byte_generator.emit('JUMP', skip)
     space.byte_generator.emit('LABEL', start)
     space.byte_generator.emit(parsed)
@@ -43,18 +46,14 @@ def executable_code(code_str, space, global_context=True):
     space.byte_generator.emit('NOP')
     space.byte_generator.restore_state()
 
-    space.byte_generator.exe.compile(
-        start_loc=old_tape_len
-    )  # dont read the code from the beginning, dont be stupid!
+    exe.compile_segment(
+        segment)  # dont read the code from the beginning, dont be stupid!
 
     ctx = space.GlobalObj if global_context else space.exe.current_ctx
 
     def ex_code():
-        ret, status, token = space.byte_generator.exe.execute_fragment_under_context(
+        ret, status, token = exe.execute_fragment_under_context(
             ctx, start, skip)
-        # todo Clean up the tape!
-        # this is NOT a way to do that because the fragment may contain the executable code! We dont want to remove it
-        #del space.byte_generator.exe.tape[old_tape_len:]
         if status == 0:
             return ret
         elif status == 3:
@@ -63,6 +62,7 @@ def executable_code(code_str, space, global_context=True):
             raise RuntimeError(
                 'Unexpected return status during JIT execution: %d' % status)
 
+    ex_code.segment = segment  # keeps the code on the tape
     return ex_code
 
 
@@ -38,7 +38,7 @@ class ObjectMethods:
             raise MakeError(
                 'TypeError',
                 'Object.getOwnPropertyDescriptor called on non-object')
-        desc = obj.own.get(to_string(prop))
+        desc = obj.get_own_property(to_string(prop))
         return convert_to_js_type(desc, args.space)
 
     def getOwnPropertyNames(this, args):
@@ -47,7 +47,7 @@ class ObjectMethods:
             raise MakeError(
                 'TypeError',
                 'Object.getOwnPropertyDescriptor called on non-object')
-        return args.space.ConstructArray(obj.own.keys())
+        return args.space.ConstructArray(obj.own_keys())
 
     def create(this, args):
         obj = get_arg(args, 0)
@@ -159,10 +159,7 @@ class ObjectMethods:
         obj = get_arg(args, 0)
         if not is_object(obj):
             raise MakeError('TypeError', 'Object.keys called on non-object')
-        return args.space.ConstructArray([
-            unicode(e) for e, d in six.iteritems(obj.own)
-            if d.get('enumerable')
-        ])
+        return args.space.ConstructArray(obj.own_keys(enumerable_only=True))
 
 
 # some utility functions:
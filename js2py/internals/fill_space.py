@@ -1,6 +1,9 @@
 from __future__ import unicode_literals
 
 from .base import Scope
+from .space import Space
+from .byte_trans import ByteCodeGenerator
+from .code import Code
 from .func_utils import *
 from .conversions import *
 import six
@@ -144,7 +147,7 @@ def fill_space(space, byte_generator):
                 msg = to_string(message)
             else:
                 msg = u''
-            return space.NewError(typ, msg)
+            return args.space.NewError(typ, msg)
 
         j = easy_func(creator, space)
         j.name = unicode(typ)
@@ -279,3 +282,22 @@ def fill_space(space, byte_generator):
     set_protected(global_scope, 'Infinity', Infinity)
     for k, v in builtins.items():
         set_non_enumerable(global_scope, k, v)
+
+
+# space filled by the first forked_space call, never used to run any code
+_PRISTINE_SPACE = []
+
+
+def forked_space(byte_generator):
+    ''' Returns a space filled like by fill_space(Space(), byte_generator), but much faster: it is
+        a fork of the pristine space filled only once. '''
+    if not _PRISTINE_SPACE:
+        pristine = Space()
+        fill_space(pristine, ByteCodeGenerator(Code()))
+        _PRISTINE_SPACE.append(pristine)
+    space = _PRISTINE_SPACE[0].fork()
+    space.byte_generator = byte_generator
+    space.exe = byte_generator.exe
+    byte_generator.exe.space = space
+    space.GlobalObj.registers(byte_generator.declared_vars)
+    return space
@@ -25,8 +25,8 @@ def convert_to_js_type(e, space=None):
         return e
     if t in (int, long, float):
         return float(e)
-    elif isinstance(t, basestring):
-        return unicode(t)
+    elif isinstance(e, basestring):
+        return unicode(e)
     elif t in (list, tuple):
         if space is None:
             raise MakeError(
@@ -58,14 +58,17 @@ def is_js_type(e):
         return False
 
 
-# todo optimise these 2!
 def js_array_to_tuple(arr):
     length = to_uint32(arr.get(u'length'))
+    if arr.dense is not None and len(arr.dense) == length:
+        return tuple(arr.dense)
     return tuple(arr.get(unicode(e)) for e in xrange(length))
 
 
 def js_array_to_list(arr):
     length = to_uint32(arr.get(u'length'))
+    if arr.dense is not None and len(arr.dense) == length:
+        return list(arr.dense)
     return [arr.get(unicode(e)) for e in xrange(length)]
 
 
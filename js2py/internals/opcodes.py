@@ -1,5 +1,5 @@
 from .operations import *
-from .base import get_member, get_member_dot, PyJsFunction, Scope
+from .base import get_member, get_member_dot, PyJsFunction, Scope, PropertyCache
 
 
 class OP_CODE(object):
@@ -57,6 +57,27 @@ class POSTFIX(OP_CODE):
         ctx.stack.append(target + self.ca)
 
 
+class POSTFIX_SLOT(OP_CODE):
+    _params = ['cb', 'ca', 'identifier', 'depth', 'slot']
+
+    def __init__(self, post, incr, identifier, depth, slot):
+        self.identifier = identifier
+        self.depth = depth
+        self.slot = slot
+        self.cb = 1 if incr else -1
+        self.ca = -self.cb if post else 0
+
+    def eval(self, ctx):
+        scope = ctx
+        depth = self.depth
+        while depth:
+            scope = scope.prototype
+            depth -= 1
+        target = to_number(scope.slots[self.slot]) + self.cb
+        scope.slots[self.slot] = target
+        ctx.stack.append(target + self.ca)
+
+
 class POSTFIX_MEMBER(OP_CODE):
     _params = ['cb', 'ca']
 
@@ -141,7 +162,7 @@ class LABEL(OP_CODE):
 
 
 # I implemented interpreter in the way that when an integer is returned by eval operation the execution will jump
-# to the location of the label (it is loc = label_locations[label])
+# to that location of the tape. Labels are resolved to tape locations by Code.compile which calls link of every op.
 
 
 class BASE_JUMP(OP_CODE):
@@ -149,18 +170,22 @@ class BASE_JUMP(OP_CODE):
 
     def __init__(self, label):
         self.label = label
+        self.target = None
+
+    def link(self, label_locs):
+        self.target = label_locs[self.label]
 
 
 class JUMP(BASE_JUMP):
     def eval(self, ctx):
-        return self.label
+        return self.target
 
 
 class JUMP_IF_TRUE(BASE_JUMP):
     def eval(self, ctx):
         val = ctx.stack.pop()
         if to_boolean(val):
-            return self.label
+            return self.target
 
 
 class JUMP_IF_EQ(BASE_JUMP):
@@ -169,28 +194,28 @@ class JUMP_IF_EQ(BASE_JUMP):
         cmp = ctx.stack.pop()
         if strict_equality_op(ctx.stack[-1], cmp):
             ctx.stack.pop()
-            return self.label
+            return self.target
 
 
 class JUMP_IF_TRUE_WITHOUT_POP(BASE_JUMP):
     def eval(self, ctx):
         val = ctx.stack[-1]
         if to_boolean(val):
-            return self.label
+            return self.target
 
 
 class JUMP_IF_FALSE(BASE_JUMP):
     def eval(self, ctx):
         val = ctx.stack.pop()
         if not to_boolean(val):
-            return self.label
+            return self.target
 
 
 class JUMP_IF_FALSE_WITHOUT_POP(BASE_JUMP):
     def eval(self, ctx):
         val = ctx.stack[-1]
         if not to_boolean(val):
-            return self.label
+            return self.target
 
 
 class POP(OP_CODE):
@@ -287,19 +312,24 @@ class LOAD_REGEXP(OP_CODE):
 
 class LOAD_FUNCTION(OP_CODE):
     _params = ['start', 'params', 'name', 'is_declaration', 'definitions']
+    # weakref to the CodeSegment of the code compiled at runtime, see Code.compile_segment
+    segment = None
 
-    def __init__(self, start, params, name, is_declaration, definitions):
+    def __init__(self, start, params, name, is_declaration, definitions, layout=None):
         assert type(start) == int
         self.start = start  # its an ID of label pointing to the beginning of the function bytecode
         self.params = params
         self.name = name
         self.is_declaration = bool(is_declaration)
         self.definitions = tuple(set(definitions + params))
+        self.layout = layout  # frame layout if the variables are stored in slots, see frame_layout
 
     def eval(self, ctx):
-        ctx.stack.append(
-            ctx.space.NewFunction(self.start, ctx, self.params, self.name,
-                                  self.is_declaration, self.definitions))
+        func = ctx.space.NewFunction(self.start, ctx, self.params, self.name,
+                                     self.is_declaration, self.definitions, self.layout)
+        if self.segment is not None:
+            func.segment = self.segment()
+        ctx.stack.append(func)
 
 
 class LOAD_OBJECT(OP_CODE):
@@ -362,10 +392,29 @@ class LOAD_MEMBER_DOT(OP_CODE):
 
     def __init__(self, prop):
         self.prop = prop
+        self.cache = PropertyCache(prop)
 
     def eval(self, ctx):
         obj = ctx.stack.pop()
-        ctx.stack.append(get_member_dot(obj, self.prop, ctx.space))
+        ctx.stack.append(self.cache.get(obj, ctx.space))
+
+
+class LOAD_SLOT(OP_CODE):
+    # variable in the slot of the frame depth scopes up, resolved by the byte generator
+    _params = ['identifier', 'depth', 'slot']
+
+    def __init__(self, identifier, depth, slot):
+        self.identifier = identifier
+        self.depth = depth
+        self.slot = slot
+
+    def eval(self, ctx):
+        scope = ctx
+        depth = self.depth
+        while depth:
+            scope = scope.prototype
+            depth -= 1
+        ctx.stack.append(scope.slots[self.slot])
 
 
 # --------------- STORING --------------
@@ -409,6 +458,7 @@ class STORE_MEMBER_DOT(OP_CODE):
 
     def __init__(self, prop):
         self.prop = prop
+        self.cache = PropertyCache(prop)
 
     def eval(self, ctx):
         value = ctx.stack.pop()
@@ -425,7 +475,7 @@ class STORE_MEMBER_DOT(OP_CODE):
                     "Cannot set property '%s' of undefined" % self.prop)
             # just ignore...
         else:
-            left.put(self.prop, value)
+            self.cache.put(left, value)
         ctx.stack.append(value)
 
 
@@ -502,6 +552,44 @@ class STORE_MEMBER_DOT_OP(OP_CODE):
             left.put(self.prop, ctx.stack[-1])
 
 
+class STORE_SLOT(OP_CODE):
+    _params = ['identifier', 'depth', 'slot']
+
+    def __init__(self, identifier, depth, slot):
+        self.identifier = identifier
+        self.depth = depth
+        self.slot = slot
+
+    def eval(self, ctx):
+        scope = ctx
+        depth = self.depth
+        while depth:
+            scope = scope.prototype
+            depth -= 1
+        scope.slots[self.slot] = ctx.stack[-1]  # don't pop
+
+
+class STORE_OP_SLOT(OP_CODE):
+    _params = ['identifier', 'depth', 'slot', 'op']
+
+    def __init__(self, identifier, depth, slot, op):
+        self.identifier = identifier
+        self.depth = depth
+        self.slot = slot
+        self.op = op
+
+    def eval(self, ctx):
+        scope = ctx
+        depth = self.depth
+        while depth:
+            scope = scope.prototype
+            depth -= 1
+        value = ctx.stack.pop()
+        new_value = BINARY_OPERATIONS[self.op](scope.slots[self.slot], value)
+        scope.slots[self.slot] = new_value
+        ctx.stack.append(new_value)
+
+
 # --------------- CALLS --------------
 
 
@@ -540,12 +628,13 @@ class CALL_METHOD_DOT(OP_CODE):
 
     def __init__(self, prop):
         self.prop = prop
+        self.cache = PropertyCache(prop)
 
     def eval(self, ctx):
         args = ctx.stack.pop()
         base = ctx.stack.pop()
 
-        func = get_member_dot(base, self.prop, ctx.space)
+        func = self.cache.get(base, ctx.space)
 
         return bytecode_call(ctx, func, base, args)
 
@@ -572,11 +661,12 @@ class CALL_METHOD_DOT_NO_ARGS(OP_CODE):
 
     def __init__(self, prop):
         self.prop = prop
+        self.cache = PropertyCache(prop)
 
     def eval(self, ctx):
         base = ctx.stack.pop()
 
-        func = get_member_dot(base, self.prop, ctx.space)
+        func = self.cache.get(base, ctx.space)
 
         return bytecode_call(ctx, func, base, ())
 
@@ -744,18 +834,25 @@ class FOR_IN(OP_CODE):
         self.body_start_label = body_start_label
         self.continue_label = continue_label
         self.break_label = break_label
+        self.continue_target = None
+        self.break_target = None
+
+    def link(self, label_locs):
+        self.continue_target = label_locs[self.continue_label]
+        self.break_target = label_locs[self.break_label]
 
     def eval(self, ctx):
         iterable = ctx.stack.pop()
         if is_null(iterable) or is_undefined(iterable):
             ctx.stack.pop()
             ctx.stack.append(undefined)
-            return self.break_label
+            return self.break_target
 
         obj = to_object(iterable, ctx.space)
 
-        for e in sorted(obj.own):
-            if not obj.own[e]['enumerable']:
+        for e in sorted(obj.own_keys()):
+            desc = obj.get_own_property(e)
+            if desc is None or not desc['enumerable']:
                 continue
 
             ctx.put(
@@ -780,7 +877,7 @@ class FOR_IN(OP_CODE):
             elif typ == 2:  # jump outside
                 # now have to figure out whether this is a continue or something else...
                 ctx.stack.append(val)
-                if spec == self.continue_label:
+                if spec == self.continue_target:
                     # just a continue, perform next iteration as normal
                     continue
                 return spec  # break or smth, go there and finish the iteration
@@ -790,7 +887,125 @@ class FOR_IN(OP_CODE):
             else:
                 raise RuntimeError('Invalid return code')
 
-        return self.break_label
+        return self.break_target
+
+
+# ------------ SUPERINSTRUCTIONS ----------
+# emitted only by the peephole optimizer (see peephole.py), every one of them replaces a sequence
+# of simple ops and has exactly the same effect on the stack and on the scope.
+
+
+class LOAD_BINARY_CONST(OP_CODE):
+    # LOAD identifier; LOAD_NUMBER/LOAD_STRING val; BINARY_OP operator
+    _params = ['identifier', 'val', 'operator']
+
+    def __init__(self, identifier, val, operator):
+        self.identifier = identifier
+        self.val = val
+        self.operator = operator
+        self.operation = BINARY_OPERATIONS[operator]
+
+    def eval(self, ctx):
+        ctx.stack.append(
+            self.operation(ctx.get(self.identifier, throw=True), self.val))
+
+
+class LOAD_SLOT_BINARY_CONST(OP_CODE):
+    # LOAD_SLOT identifier depth slot; LOAD_NUMBER/LOAD_STRING val; BINARY_OP operator
+    _params = ['identifier', 'depth', 'slot', 'val', 'operator']
+
+    def __init__(self, identifier, depth, slot, val, operator):
+        self.identifier = identifier
+        self.depth = depth
+        self.slot = slot
+        self.val = val
+        self.operator = operator
+        self.operation = BINARY_OPERATIONS[operator]
+
+    def eval(self, ctx):
+        scope = ctx
+        depth = self.depth
+        while depth:
+            scope = scope.prototype
+            depth -= 1
+        ctx.stack.append(self.operation(scope.slots[self.slot], self.val))
+
+
+class COMPARE_AND_JUMP(BASE_JUMP):
+    # BINARY_OP operator; JUMP_IF_TRUE/JUMP_IF_FALSE label - only for operators returning a bool
+    _params = ['operator', 'label', 'jump_if']
+
+    def __init__(self, operator, label, jump_if):
+        BASE_JUMP.__init__(self, label)
+        self.operator = operator
+        self.operation = BINARY_OPERATIONS[operator]
+        self.jump_if = jump_if
+
+    def eval(self, ctx):
+        right = ctx.stack.pop()
+        left = ctx.stack.pop()
+        if self.operation(left, right) is self.jump_if:
+            return self.target
+
+
+class INCREMENT(OP_CODE):
+    # POSTFIX post incr identifier; POP
+    _params = ['identifier', 'cb']
+
+    def __init__(self, identifier, cb):
+        self.identifier = identifier
+        self.cb = cb
+
+    def eval(self, ctx):
+        ctx.put(self.identifier, to_number(ctx.get(self.identifier)) + self.cb)
+
+
+class INCREMENT_SLOT(OP_CODE):
+    # POSTFIX_SLOT post incr identifier depth slot; POP
+    _params = ['identifier', 'depth', 'slot', 'cb']
+
+    def __init__(self, identifier, depth, slot, cb):
+        self.identifier = identifier
+        self.depth = depth
+        self.slot = slot
+        self.cb = cb
+
+    def eval(self, ctx):
+        scope = ctx
+        depth = self.depth
+        while depth:
+            scope = scope.prototype
+            depth -= 1
+        scope.slots[self.slot] = to_number(scope.slots[self.slot]) + self.cb
+
+
+class STORE_POP(OP_CODE):
+    # STORE identifier; POP
+    _params = ['identifier']
+
+    def __init__(self, identifier):
+        self.identifier = identifier
+
+    def eval(self, ctx):
+        ctx.put(self.identifier, ctx.stack.pop())
+
+
+class STORE_SLOT_POP(OP_CODE):
+    # STORE_SLOT identifier depth slot; POP
+    _params = ['identifier', 'depth', 'slot']
+
+    def __init__(self, identifier, depth, slot):
+        self.identifier = identifier
+        self.depth = depth
+        self.slot = slot
+
+    def eval(self, ctx):
+        scope = ctx
+        depth = self.depth
+        while depth:
+            scope = scope.prototype
+            depth -= 1
+        scope.slots[self.slot] = ctx.stack.pop()
 
 
 # all opcodes...
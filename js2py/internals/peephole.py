@@ -0,0 +1,87 @@
+'''Peephole optimizer of the tape, run by Code.compile before the labels are resolved.
+
+It replaces the most common sequences of simple ops emitted by the ByteCodeGenerator by
+superinstructions (one dispatch instead of 2 or 3) and removes ops that do nothing:
+
+    LOAD x; LOAD_NUMBER c; BINARY_OP op      ->  LOAD_BINARY_CONST x c op
+    BINARY_OP cmp; JUMP_IF_FALSE label       ->  COMPARE_AND_JUMP cmp label False
+    POSTFIX x; POP                           ->  INCREMENT x
+    STORE x; POP                             ->  STORE_POP x
+
+and the same for the variables stored in slots (LOAD_SLOT, POSTFIX_SLOT and STORE_SLOT).
+    LOAD_UNDEFINED; POP                      ->  (removed)
+    NOP                                      ->  (removed unless next to a label)
+
+Sequences are never fused across a LABEL, so every jump target stays at the beginning of an op.
+NOPs next to labels are kept because they mark the boundaries of the fragments executed by
+TRY_CATCH_FINALLY, WITH and FOR_IN (see ByteCodeGenerator).
+'''
+from .opcodes import *
+
+ENABLED = True
+
+# these return a python bool so COMPARE_AND_JUMP can skip to_boolean
+COMPARISONS = {'==', '!=', '===', '!==', '<', '<=', '>', '>='}
+
+
+def _fuse3(a, b, c):
+    if type(b) in (LOAD_NUMBER, LOAD_STRING) and type(c) is BINARY_OP:
+        if type(a) is LOAD_SLOT:
+            return LOAD_SLOT_BINARY_CONST(a.identifier, a.depth, a.slot, b.val, c.operator)
+        if type(a) is LOAD:
+            return LOAD_BINARY_CONST(a.identifier, b.val, c.operator)
+
+
+def _fuse2(a, b):
+    typ = type(a)
+    if type(b) is POP:
+        if typ is STORE_SLOT:
+            return STORE_SLOT_POP(a.identifier, a.depth, a.slot)
+        if typ is POSTFIX_SLOT:
+            return INCREMENT_SLOT(a.identifier, a.depth, a.slot, a.cb)
+        if typ is STORE:
+            return STORE_POP(a.identifier)
+        if typ is POSTFIX:
+            return INCREMENT(a.identifier, a.cb)
+    elif typ is BINARY_OP and a.operator in COMPARISONS:
+        if type(b) is JUMP_IF_FALSE:
+            return COMPARE_AND_JUMP(a.operator, b.label, False)
+        if type(b) is JUMP_IF_TRUE:
+            return COMPARE_AND_JUMP(a.operator, b.label, True)
+
+
+def optimize(tape):
+    ''' Returns the optimized copy of the tape (a list of ops with labels). '''
+    res = []
+    n = len(tape)
+    i = 0
+    while i < n:
+        op = tape[i]
+        typ = type(op)
+        if typ is LABEL:
+            res.append(op)
+            i += 1
+            continue
+        nxt = tape[i + 1] if i + 1 < n else None
+        if typ is NOP:
+            if res and nxt is not None and type(res[-1]) is not LABEL and type(nxt) is not LABEL:
+                i += 1
+                continue
+        elif typ is LOAD_UNDEFINED and type(nxt) is POP:
+            i += 2
+            continue
+        if i + 2 < n:
+            fused = _fuse3(op, nxt, tape[i + 2])
+            if fused is not None:
+                res.append(fused)
+                i += 3
+                continue
+        if nxt is not None:
+            fused = _fuse2(op, nxt)
+            if fused is not None:
+                res.append(fused)
+                i += 2
+                continue
+        res.append(op)
+        i += 1
+    return res
@@ -67,7 +67,11 @@ class ArrayPrototype:
         separator = ',' if is_undefined(separator) else to_string(separator)
         elems = []
         for e in xrange(arr_len):
-            elem = array.get(unicode(e))
+            dense = array.dense  # toString of the elements can modify the array
+            if dense is not None and e < len(dense):
+                elem = dense[e]
+            else:
+                elem = array.get(unicode(e))
             if elem in ARR_STACK:
                 s = ''
             else:
@@ -84,9 +88,12 @@ class ArrayPrototype:
         if not arr_len:
             array.put('length', float(arr_len))
             return undefined
-        ind = unicode(arr_len - 1)
-        element = array.get(ind)
-        array.delete(ind)
+        if array.dense is not None and len(array.dense) == arr_len:
+            element = array.dense.pop()
+        else:
+            ind = unicode(arr_len - 1)
+            element = array.get(ind)
+            array.delete(ind)
         array.put('length', float(arr_len - 1))
         return element
 
@@ -146,6 +153,9 @@ class ArrayPrototype:
             relative_end, arr_len)
         res = []
         n = 0
+        dense = array.dense
+        if dense is not None and final <= len(dense):
+            return args.space.ConstructArray(dense[k:final])
         while k < final:
             pk = unicode(k)
             if array.has_property(pk):
@@ -348,10 +358,14 @@ class ArrayPrototype:
         _this = get_arg(args, 1)
         k = 0
         while k < arr_len:
-            sk = unicode(k)
-            if array.has_property(sk):
-                kValue = array.get(sk)
-                callbackfn.call(_this, (kValue, float(k), array))
+            dense = array.dense  # the callback can modify the array
+            if dense is not None and k < len(dense):
+                callbackfn.call(_this, (dense[k], float(k), array))
+            else:
+                sk = unicode(k)
+                if array.has_property(sk):
+                    kValue = array.get(sk)
+                    callbackfn.call(_this, (kValue, float(k), array))
             k += 1
         return undefined
 
@@ -120,7 +120,7 @@ def jo(value, stack, gap, property_list, replacer_function, space):
     if not is_undefined(property_list):
         k = property_list
     else:
-        k = [unicode(e) for e, d in value.own.items() if d.get('enumerable')]
+        k = [unicode(e) for e in value.own_keys(enumerable_only=True)]
     partial = []
     for p in k:
         str_p = Str(p, value, replacer_function, property_list, gap, stack,
@@ -194,9 +194,7 @@ def walk(holder, name, reviver):
             else:
                 new_element.put(i, new_element)
     elif is_object(val):
-        for key in [
-                unicode(e) for e, d in val.own.items() if d.get('enumerable')
-        ]:
+        for key in [unicode(e) for e in val.own_keys(enumerable_only=True)]:
             new_element = walk(val, key, reviver)
             if is_undefined(new_element):
                 val.delete(key)
@@ -4,26 +4,28 @@ from . import fill_space
 from .byte_trans import ByteCodeGenerator
 from .code import Code
 from .simplex import *
+from .func_utils import convert_to_js_type
+from ..utils.parse_cache import parse
+
+import six
+import weakref
 
 
 pyjsparser.parser.ENABLE_JS2PY_ERRORS = lambda msg: MakeError(u'SyntaxError', unicode(msg))
 
 def get_js_bytecode(js):
     a = ByteCodeGenerator(Code())
-    d = pyjsparser.parse(js)
+    d = parse(js)
     a.emit(d)
     return  a.exe.tape
     
-def eval_js_vm(js, debug=False):
-    a = ByteCodeGenerator(Code(debug_mode=debug))
-    s = Space()
-    a.exe.space = s
-    s.exe = a.exe
+def eval_js_vm(js, debug=False, optimize=None):
+    a = ByteCodeGenerator(Code(debug_mode=debug, optimize=optimize))
 
-    d = pyjsparser.parse(js)
+    d = parse(js)
 
     a.emit(d)
-    fill_space.fill_space(s, a)
+    fill_space.forked_space(a)
     if debug:
         from pprint import pprint
         pprint(a.exe.tape)
@@ -31,3 +33,48 @@ def eval_js_vm(js, debug=False):
     a.exe.compile()
 
     return a.exe.run(a.exe.space.GlobalObj)
+
+
+class VmProgram(object):
+    ''' JavaScript program parsed and compiled once and then executed by the VM many times. Every
+        run gets a new space (a fork of the pristine one) unless a space made by new_space is
+        given, the pooled space is reused with only the declared globals reset to undefined (the
+        other changes made by the previous runs stay).
+        Not thread safe, the runs share the compiled tape.
+
+        >>> program = VmProgram('var total = price * count; total > limit')
+        >>> program.run({'price': 2, 'count': 3, 'limit': 5}, outputs=['total'])
+        (True, {'total': 6.0})
+    '''
+
+    def __init__(self, js, optimize=None):
+        self.byte_generator = ByteCodeGenerator(Code(optimize=optimize))
+        self.byte_generator.emit(parse(js))
+        self.byte_generator.exe.compile()
+        self.declared_vars = tuple(self.byte_generator.declared_vars)
+        self._cached_space = lambda: None  # weak reference to the space of the last run
+
+    def new_space(self):
+        ''' Returns a new space for the runs of this program. '''
+        return fill_space.forked_space(self.byte_generator)
+
+    def run(self, inputs=None, outputs=(), space=None):
+        ''' Runs the program with the inputs (dict name -> value) defined as global variables.
+            Returns the completion value and the dict with the values of the outputs globals. '''
+        if space is None:
+            space = self.new_space()
+        else:
+            for var in self.declared_vars:
+                space.GlobalObj.put(var, undefined)
+        exe = self.byte_generator.exe
+        exe.space = space
+        if self._cached_space() is not space:
+            # the inline caches must not keep the prototypes of the previous space alive
+            exe.clear_property_caches()
+            self._cached_space = weakref.ref(space)
+        glob = space.GlobalObj
+        if inputs:
+            for name, value in six.iteritems(inputs):
+                glob.put(unicode(name), convert_to_js_type(value, space))
+        value = exe.run(glob)
+        return value, dict((name, glob.get(unicode(name))) for name in outputs)
@@ -1,6 +1,8 @@
 from .base import *
 from .simplex import *
 
+import six
+
 
 class Space(object):
     def __init__(self):
@@ -48,6 +50,39 @@ class Space(object):
             'URIError': self.URIErrorPrototype,
         }
 
+    def fork(self):
+        ''' Returns a copy of this space and of all the objects reachable from it (builtins,
+            global scope), so that the copy can be modified without affecting this space. What
+            has to be copied is found by the first fork and remembered, so this space must not be
+            modified afterwards. The byte_generator and exe of the copy still have to be set. '''
+        plan = self.__dict__.get('_fork_plan')
+        if plan is None:
+            plan = self._fork_plan = _fork_plan(self)
+        copies = {}
+        for obj, _ in plan:
+            new = obj.__class__.__new__(obj.__class__)
+            new.__dict__ = obj.__dict__.copy()
+            copies[id(obj)] = new
+        for obj, fixes in plan:
+            d = copies[id(obj)].__dict__
+            for attr, mutable, paths in fixes:
+                v = d[attr]
+                if paths is None:  # reference to a copied object
+                    d[attr] = copies[id(v)]
+                    continue
+                v = d[attr] = v.copy() if type(v) is dict else list(v)
+                for k in mutable:  # the descriptors that can change
+                    v[k] = v[k].copy()
+                for path in paths:
+                    if len(path) == 1:
+                        v[path[0]] = copies[id(v[path[0]])]
+                    else:
+                        container = v[path[0]]
+                        container[path[1]] = copies[id(container[path[1]])]
+        fork = copies[id(self)]
+        del fork.__dict__['_fork_plan']
+        return fork
+
     def get_global_environment(self):
         return self.GlobalCtx.variable_environment()
 
@@ -55,7 +90,7 @@ class Space(object):
         return PyJsObject(self.ObjectPrototype)
 
     def NewFunction(self, code, ctx, params, name, is_declaration,
-                    definitions):
+                    definitions, layout=None):
         return PyJsFunction(
             code,
             ctx,
@@ -64,7 +99,8 @@ class Space(object):
             self,
             is_declaration,
             definitions,
-            prototype=self.FunctionPrototype)
+            prototype=self.FunctionPrototype,
+            layout=layout)
 
     def NewDate(self, value):
         return PyJsDate(value, self.DatePrototype)
@@ -90,3 +126,63 @@ class Space(object):
         for k, v in py_obj.items():
             obj.put(unicode(k), v)
         return obj
+
+
+def _fork_plan(space):
+    # the space and the PyJs objects reachable from it through attributes, dicts and lists, with
+    # the attributes that fork has to change: (attr, None, None) for the references to these
+    # objects and (attr, mutable, paths) for the dicts and lists to copy, mutable are the keys
+    # of the nested dicts to copy too and paths lead to the references inside
+    seen = {id(space): space}
+    todo = [space]
+    while todo:
+        obj = todo.pop()
+        stack = list(six.itervalues(obj.__dict__))
+        while stack:
+            v = stack.pop()
+            if type(v) is dict:
+                stack.extend(six.itervalues(v))
+            elif type(v) in (list, tuple):
+                stack.extend(v)
+            elif isinstance(v, PyJs) and id(v) not in seen:
+                seen[id(v)] = v
+                todo.append(v)
+
+    def paths(container):
+        res = []
+        items = six.iteritems(container) if type(container) is dict else enumerate(container)
+        for k, e in items:
+            if id(e) in seen:
+                res.append((k, ))
+            elif type(e) is dict:
+                for field, value in six.iteritems(e):
+                    if id(value) in seen:
+                        res.append((k, field))
+                    elif type(value) in (dict, list, tuple):
+                        raise TypeError('Space objects nested too deep to fork')
+            elif type(e) in (list, tuple):
+                raise TypeError('Space objects nested too deep to fork')
+        return res
+
+    def mutable(container):
+        # descriptors of constant properties (like length of the functions) can be shared
+        if type(container) is not dict:
+            return ()
+        return [
+            k for k, e in six.iteritems(container)
+            if type(e) is dict and (e.get('writable') or e.get('configurable')
+                                    or 'value' not in e or id(e['value']) in seen)
+        ]
+
+    plan = []
+    for obj in seen.values():
+        fixes = []
+        for attr, v in six.iteritems(obj.__dict__):
+            if id(v) in seen:
+                fixes.append((attr, None, None))
+            elif type(v) in (dict, list):
+                fixes.append((attr, mutable(v), paths(v)))
+            elif type(v) is tuple and paths(v):
+                raise TypeError('Space objects referenced from a tuple can not be forked')
+        plan.append((obj, fixes))
+    return plan
@@ -33,3 +33,44 @@ def float_repr(f):
     if int(f) == f:
         return unicode(repr(int(f)))
     return unicode(repr(f))
+
+
+def function_scope_info(body):
+    ''' returns (declared_names, is_dynamic, uses_arguments) of the function with the body node.
+        declared_names are the names of the variables and functions declared in the function
+        (in the order of appearance), is_dynamic is true when the function scope can not be known
+        statically (the function contains with statement or uses eval), uses_arguments is true when
+        the function references its arguments object. '''
+    names = []
+    seen = set()
+    dynamic = False
+    uses_arguments = False
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+            continue
+        if not isinstance(node, dict):
+            continue
+        typ = node.get('type')
+        if typ == 'FunctionDeclaration' or typ == 'VariableDeclarator':
+            name = node['id']['name']
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+            if typ == 'FunctionDeclaration':
+                continue
+        elif typ == 'FunctionExpression':
+            continue
+        elif typ == 'WithStatement':
+            dynamic = True
+        elif typ == 'Identifier':
+            if node['name'] == 'eval':
+                dynamic = True
+            elif node['name'] == 'arguments':
+                uses_arguments = True
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                stack.append(value)
+    return names, dynamic, uses_arguments
@@ -1,4 +1,5 @@
 from .base import *
+import six
 from .constructors.jsmath import Math
 from .constructors.jsdate import Date
 from .constructors.jsobject import Object
@@ -29,7 +30,8 @@ __all__ = [
     'Js', 'PyJsComma', 'PyJsStrictEq', 'PyJsStrictNeq', 'PyJsException',
     'PyJsBshift', 'Scope', 'PyExceptionToJs', 'JsToPyException', 'JS_BUILTINS',
     'appengine', 'set_global_object', 'JsRegExp', 'PyJsException',
-    'PyExceptionToJs', 'JsToPyException', 'PyJsSwitchException'
+    'PyExceptionToJs', 'JsToPyException', 'PyJsSwitchException',
+    'new_global_scope'
 ]
 
 # these were defined in base.py
@@ -98,3 +100,19 @@ for name, error in ERRORS.items():
 scope['eval'] = Eval
 scope['JSON'] = JSON
 JS_BUILTINS = dict((k, v) for k, v in scope.items())
+
+_GLOBAL_SCOPE_TEMPLATE = None
+
+
+def new_global_scope():
+    '''Returns a new global scope, equivalent to Scope(JS_BUILTINS) followed by set_global_object.
+       The builtins are set up only once, later scopes just copy their property descriptors.'''
+    global _GLOBAL_SCOPE_TEMPLATE
+    if _GLOBAL_SCOPE_TEMPLATE is None:
+        _GLOBAL_SCOPE_TEMPLATE = Scope(JS_BUILTINS)
+    var = Scope.__new__(Scope)
+    var.prototype = None
+    var.own = dict((k, dict(v))
+                   for k, v in six.iteritems(_GLOBAL_SCOPE_TEMPLATE.own))
+    set_global_object(var)
+    return var
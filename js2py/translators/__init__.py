@@ -20,12 +20,14 @@
 
 __all__ = [
     'PyJsParser', 'Node', 'WrappingNode', 'node_to_dict', 'parse',
-    'translate_js', 'translate', 'syntax_tree_translate', 'DEFAULT_HEADER'
+    'translate_js', 'translate', 'syntax_tree_translate', 'DEFAULT_HEADER',
+    'IncrementalTranslator', 'translate_js_stream'
 ]
 __author__ = 'Piotr Dabkowski'
 __version__ = '2.2.0'
 from pyjsparser import PyJsParser
-from .translator import translate_js, trasnlate, syntax_tree_translate, DEFAULT_HEADER
+from .translator import translate_js, trasnlate, syntax_tree_translate, DEFAULT_HEADER, IncrementalTranslator, translate_js_stream
+from ..utils import parsers
 
 
 def parse(javascript_code):
@@ -33,6 +35,6 @@ def parse(javascript_code):
 
     Syntax tree has the same structure as syntax tree produced by esprima.js
 
-       Same as PyJsParser().parse  For your convenience :) """
-    p = PyJsParser()
-    return p.parse(javascript_code)
+       Parsed with the current parser backend (PyJsParser().parse by default, see
+       js2py.utils.parsers). For your convenience :) """
+    return parsers.parse(javascript_code)
@@ -1,4 +1,5 @@
 import binascii
+import re
 
 from pyjsparser import PyJsParser
 import six
@@ -40,6 +41,52 @@ def inject_before_lval(source, lval, code):
     return source[:inj + 1] + indent(code, ind) + source[inj + 1:]
 
 
+INLINE_NAME_RE = re.compile(r'PyJs_\w+', re.UNICODE)
+
+
+def inject_inlines(source, names, reps):
+    """Same as calling inject_before_lval(source, name, reps[name]) for every name in names
+       (in order), but in linear time: every lval is located just once - either in source or
+       in the code of an inline injected before it - and the result is joined only at the end."""
+    order = dict((name, i) for i, name in enumerate(names))
+    # texts[0] is source, texts[i + 1] is the code of names[i]
+    texts = [source] + [reps[name] for name in names]
+    found = {}
+    for owner, text in enumerate(texts):
+        for m in INLINE_NAME_RE.finditer(text):
+            i = order.get(m.group(0))
+            # only the source and the code of the inlines injected before count
+            if i is not None and owner <= i:
+                if i in found:
+                    raise RuntimeError('To many lvals (%s)' % names[i])
+                found[i] = owner, m.start()
+    inserts = [{} for _ in texts]  # owner -> {line start: [(inline, indentation)]}
+    for i, name in enumerate(names):
+        if i not in found:
+            raise RuntimeError('No lval found "%s"' % name)
+        owner, end = found[i]
+        text = texts[owner]
+        inj = text.rfind('\n', 0, end) + 1
+        ind = inj
+        while text[ind] == ' ':
+            ind += 1
+        inserts[owner].setdefault(inj, []).append((i + 1, ind - inj))
+    return ''.join(_join_inlines(texts, inserts, 0))
+
+
+def _join_inlines(texts, inserts, owner):
+    text = texts[owner]
+    res = []
+    last = 0
+    for inj in sorted(inserts[owner]):
+        res.append(text[last:inj])
+        for inline, ind in inserts[owner][inj]:
+            res.append(indent(''.join(_join_inlines(texts, inserts, inline)), ind))
+        last = inj
+    res.append(text[last:])
+    return res
+
+
 def get_continue_label(label):
     return CONTINUE_LABEL % to_hex(label)
 
@@ -2,6 +2,9 @@ from __future__ import unicode_literals
 from pyjsparser.pyjsparserdata import *
 from .friendly_nodes import *
 import random
+import hashlib
+import marshal
+import re
 import six
 
 if six.PY3:
@@ -48,18 +51,22 @@ class LoopController:
 
 class InlineStack:
     NAME = 'PyJs_%s_%d_'
+    TAGGED_NAME = 'PyJs_%s_%s_%d_'
 
-    def __init__(self):
+    def __init__(self, tag=None):
         self.reps = {}
         self.names = []
+        self.tag = tag  # makes the names unique when translating parts of the program separately
 
     def inject_inlines(self, source):
-        for lval in self.names:  # first in first out! Its important by the way
-            source = inject_before_lval(source, lval, self.reps[lval])
-        return source
+        # first in first out! Its important by the way
+        return inject_inlines(source, self.names, self.reps)
 
     def require(self, typ):
-        name = self.NAME % (typ, len(self.names))
+        if self.tag is None:
+            name = self.NAME % (typ, len(self.names))
+        else:
+            name = self.TAGGED_NAME % (typ, self.tag, len(self.names))
         self.names.append(name)
         return name
 
@@ -95,11 +102,150 @@ class ContextStack:
         return code
 
 
-def clean_stacks():
-    global Context, inline_stack, loop_controller
+def clean_stacks(hoist_literals=True):
+    global Context, inline_stack, loop_controller, function_depth, constants, local_vars
     Context = ContextStack()
     inline_stack = InlineStack()
     loop_controller = LoopController()
+    function_depth = 0
+    constants = {} if hoist_literals else None
+    local_vars = {}
+
+
+# Literal values are created once when the translated program is loaded: every literal becomes
+# a global constant whose name is derived from its value (see constant), this dict maps the
+# names used by the program to their definitions. None when literals are not hoisted.
+constants = None
+SIMPLE_STRING = re.compile(r'[a-zA-Z0-9]{0,24}\Z')
+
+
+def constant(value):
+    """Returns the name of the constant holding the translation of the literal value
+       (Js(value) or null)."""
+    if constants is None:
+        return literal_code(value)
+    if value is None:
+        name = 'PyJsNull_'
+    elif isinstance(value, bool):
+        name = 'PyJsTrue_' if value else 'PyJsFalse_'
+    elif isinstance(value, (float,) + six.integer_types):
+        name = 'PyJsNum_%s_' % repr(value).replace('.', '_').replace('+', '').replace('-', 'm')
+    elif SIMPLE_STRING.match(value):
+        name = 'PyJsStr_%s_' % value
+    else:
+        name = 'PyJsStrH_%s_' % hashlib.md5(value.encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+    if name not in constants:
+        constants[name] = '%s = %s\n' % (name, literal_code(value))
+    return name
+
+
+def literal_code(value):
+    if value is None:
+        return 'var.get(u"null")'
+    return 'Js(%s)' % repr(value) if value != inf else 'Js(float("inf"))'
+
+
+def get_constants_code(names):
+    return ''.join(constants[name] for name in sorted(names))
+
+
+def undefined_constant():
+    if constants is None:
+        return 'Js(None)'
+    constants.setdefault('PyJsUndefined_', 'PyJsUndefined_ = Js(None)\n')
+    return 'PyJsUndefined_'
+
+
+# Variables of the function being translated that are stored in python locals instead of its
+# Scope (see local_names), maps their js names to the python names. 'this' is included when
+# the function does not need it in its Scope.
+local_vars = {}
+
+
+# Incremental translation, see translator.IncrementalTranslator. When not None this is a pair of
+# dicts (previous, current) mapping keys of top-level functions to their translation.
+function_cache = None
+function_depth = 0
+
+
+def translate_function(node, tag):
+    """Translates function node on its own (with its own Context and InlineStack whose names
+       are tagged with tag, so that they don't clash with the rest of the program).
+       Returns the translation that can be used anywhere in the program via use_translation."""
+    global Context, inline_stack, function_depth, constants
+    outer_context, outer_stack, outer_constants = Context, inline_stack, constants
+    Context, inline_stack = ContextStack(), InlineStack(tag)
+    if constants is not None:
+        constants = {}
+    function_depth += 1
+    try:
+        res = trans(node)
+        names, reps = inline_stack.names, inline_stack.reps
+        declared = list(Context.to_define.items())
+        used_constants = constants
+    finally:
+        Context, inline_stack, constants = outer_context, outer_stack, outer_constants
+        function_depth -= 1
+    # inject the inline definitions right away into the code that uses them, only the
+    # names used by res remain to be injected into the program
+    exported = []
+    for name in names:
+        for i, (k, code) in enumerate(declared):
+            if name in code:
+                declared[i] = (k, inject_before_lval(code, name, reps[name]))
+                break
+        else:
+            for other in exported:
+                if name in reps[other]:
+                    reps[other] = inject_before_lval(reps[other], name, reps[name])
+                    break
+            else:
+                exported.append(name)
+    return res, declared, exported, dict((name, reps[name]) for name in exported), used_constants
+
+
+def use_translation(translation):
+    res, declared, names, reps, used_constants = translation
+    if constants is not None:
+        constants.update(used_constants)
+    for name, code in declared:
+        Context.define(name, code)
+    inline_stack.names.extend(names)
+    inline_stack.reps.update(reps)
+    return res
+
+
+def incremental(func):
+    """Decorator for function translators. Keeps track of the function nesting depth and when
+       function_cache is set reuses the translations of top-level functions whose syntax tree
+       did not change."""
+
+    def f(*args, **node):
+        global function_depth
+        if function_cache is None or function_depth or args:
+            function_depth += 1
+            try:
+                return func(*args, **node)
+            finally:
+                function_depth -= 1
+        previous, current = function_cache
+        h = hashlib.sha1(marshal.dumps(node, 2)).hexdigest()[:12]
+        n = 0
+        while ('ast', h, n) in current:  # identical functions still need unique names
+            n += 1
+        key = ('ast', h, n)
+        translation = previous.get(key)
+        if translation is None:
+            translation = translate_function(node, 'a%sx%d' % (h, n))
+        current[key] = translation
+        return use_translation(translation)
+
+    return f
+
+
+def TranslatedFunction(type, key):
+    """Function translated in advance by translator.IncrementalTranslator"""
+    return use_translation(function_cache[1][key])
 
 
 def to_key(literal_or_identifier):
@@ -174,16 +320,16 @@ inf = float('inf')
 
 
 def Literal(type, value, raw, regex=None):
-    if regex:  # regex
+    if regex:  # regex, every evaluation creates a new object
         return 'JsRegExp(%s)' % repr(compose_regex(value))
-    elif value is None:  # null
-        return 'var.get(u"null")'
     # Todo template
-    # String, Bool, Float
-    return 'Js(%s)' % repr(value) if value != inf else 'Js(float("inf"))'
+    # Null, String, Bool, Float
+    return constant(value)
 
 
 def Identifier(type, name):
+    if name in local_vars:
+        return local_vars[name]
     return 'var.get(%s)' % repr(name)
 
 
@@ -202,7 +348,7 @@ def MemberExpression(type, computed, object, property):
 
 
 def ThisExpression(type):
-    return 'var.get(u"this")'
+    return local_vars.get('this', 'var.get(u"this")')
 
 
 @limited
@@ -291,7 +437,7 @@ def UnaryExpression(type, operator, argument, prefix):
         if argument['type'] in ('Identifier', 'MemberExpression'):
             # means that operation is valid
             return js_delete(a)
-        return 'PyJsComma(%s, Js(True))' % a  # otherwise not valid, just perform expression and return true.
+        return 'PyJsComma(%s, %s)' % (a, constant(True))  # otherwise not valid, just perform expression and return true.
     elif operator == 'typeof':
         return js_typeof(a)
     return UNARY[operator](a)
@@ -373,7 +519,28 @@ def BlockStatement(type, body):
 
 
 def ExpressionStatement(type, expression):
-    return trans(expression) + '\n'  # end expression space with new line
+    return trans_statement_expression(expression)
+
+
+def trans_statement_expression(node):
+    """Translates expression whose value is not used to python statements, assignments and
+       updates of the local variables are possible only here (see local_names)."""
+    typ = node['type']
+    if typ == 'SequenceExpression':
+        return ''.join(trans_statement_expression(e) for e in node['expressions'])
+    elif typ == 'AssignmentExpression' and node['left']['type'] == 'Identifier':
+        name = local_vars.get(node['left']['name'])
+        if name is not None:
+            operator = node['operator'][:-1]
+            if operator:
+                return '%s = %s\n' % (name, BINARY[operator](name, trans(node['right'])))
+            return '%s = %s\n' % (name, trans(node['right']))
+    elif typ in ('UpdateExpression', 'PostfixExpression') and \
+            node['argument']['type'] == 'Identifier':
+        name = local_vars.get(node['argument']['name'])
+        if name is not None:
+            return '%s = (%s.to_number()%s%s)\n' % (name, name, node['operator'][0], constant(1))
+    return trans(node) + '\n'  # end expression space with new line
 
 
 def BreakStatement(type, label):
@@ -418,8 +585,11 @@ def DoWhileStatement(type, body, test):
 
 
 def ForStatement(type, init, test, update, body):
-    update = trans(update) if update else ''
-    init = trans(init) if init else ''
+    update = trans_statement_expression(update).rstrip('\n') if update else ''
+    if init and init['type'] != 'VariableDeclaration':
+        init = trans_statement_expression(init)
+    else:
+        init = trans(init) if init else ''
     if not init.endswith('\n'):
         init += '\n'
     test = trans(test) if test else '1'
@@ -450,7 +620,10 @@ def ForInStatement(type, left, right, body, each):
     else:
         raise RuntimeError('Unusual ForIn loop')
     loop_controller.enter()
-    res += indent('var.put(%s, PyJsTemp)\n' % repr(name) + trans(body))
+    if name in local_vars:
+        res += indent('%s = PyJsTemp\n' % local_vars[name] + trans(body))
+    else:
+        res += indent('var.put(%s, PyJsTemp)\n' % repr(name) + trans(body))
     loop_controller.leave()
     return res
 
@@ -565,6 +738,8 @@ def LexicalDeclaration(type, declarations, kind):
 
 def VariableDeclarator(type, id, init):
     name = id['name']
+    if name in local_vars:
+        return '%s = %s\n' % (local_vars[name], trans(init)) if init else ''
     # register the name if not already registered
     Context.register(name)
     if init:
@@ -595,14 +770,182 @@ def Program(type, body):
     code = ''.join(trans(e) for e in body)
     # here add hoisted elements (register variables and define functions)
     code = Context.get_code() + code
+    if constants:
+        code = get_constants_code(constants) + code
     # replace all inline variables
     code = inline_stack.inject_inlines(code)
     return code
 
 
+def hoisted_names(node, names=None):
+    """Returns the set of variable and function names declared in the scope of node"""
+    if names is None:
+        names = set()
+    if isinstance(node, list):
+        for e in node:
+            hoisted_names(e, names)
+    elif isinstance(node, dict):
+        typ = node.get('type')
+        if typ == 'FunctionDeclaration':
+            if node['id']:
+                names.add(node['id']['name'])
+            return names
+        elif typ in ('FunctionExpression', 'ArrowFunctionExpression'):
+            return names
+        elif typ == 'VariableDeclarator':
+            names.add(node['id']['name'])
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                hoisted_names(value, names)
+    return names
+
+
+class DynamicScope(Exception):
+    """Raised by local_names for functions using eval or with"""
+
+
+def local_names(params, body):
+    """Returns the dict mapping the variables of a function (params and var declarations) that can
+       be stored in python locals to their python names. These are the variables not used by the
+       nested functions, not assigned inside of expressions (python can't do that), not deleted
+       and not shadowed by catch parameters. A function using eval or with gets no locals."""
+    declared = set(p['name'] for p in params)
+    escaping = set(['arguments'])
+    try:
+        _find_locals(body, declared, escaping)
+    except DynamicScope:
+        return {}
+    res = {'this': 'this'}  # nested functions have their own this
+    for name in declared - escaping:
+        py_name = 'PyJsVar_%s_' % name
+        res[name] = py_name if is_valid_py_name(py_name) else 'PyJsVar_%s_' % to_hex(name)
+    return res
+
+
+def _find_locals(node, declared, escaping, statement=False):
+    if isinstance(node, list):
+        for e in node:
+            if e is not None:  # array holes
+                _find_locals(e, declared, escaping)
+        return
+    typ = node.get('type')
+    if typ in ('FunctionDeclaration', 'FunctionExpression', 'ArrowFunctionExpression'):
+        names = _identifiers(node, set())
+        if 'eval' in names:
+            raise DynamicScope()
+        escaping.update(names)
+        return
+    elif typ == 'Identifier':
+        if node['name'] == 'eval':
+            raise DynamicScope()
+    elif typ == 'WithStatement':
+        raise DynamicScope()
+    elif typ == 'VariableDeclarator':
+        declared.add(node['id']['name'])
+    elif typ == 'AssignmentExpression':
+        if node['left']['type'] == 'Identifier' and not statement:
+            escaping.add(node['left']['name'])
+    elif typ in ('UpdateExpression', 'PostfixExpression'):
+        if node['argument']['type'] == 'Identifier' and not statement:
+            escaping.add(node['argument']['name'])
+    elif typ == 'UnaryExpression' and node['operator'] == 'delete':
+        if node['argument']['type'] == 'Identifier':
+            escaping.add(node['argument']['name'])
+    elif typ == 'CatchClause':
+        escaping.add(node['param']['name'])
+    elif typ == 'ExpressionStatement':
+        return _find_locals(node['expression'], declared, escaping, True)
+    elif typ == 'SequenceExpression':
+        for e in node['expressions']:
+            _find_locals(e, declared, escaping, statement)
+        return
+    elif typ == 'ForStatement':
+        for key in ('init', 'update'):
+            if node[key]:
+                _find_locals(node[key], declared, escaping, True)
+        for key in ('test', 'body'):
+            if node[key]:
+                _find_locals(node[key], declared, escaping)
+        return
+    for value in node.values():
+        if isinstance(value, (dict, list)):
+            _find_locals(value, declared, escaping)
+
+
+def _identifiers(node, names):
+    """Adds the names of all identifiers in node to names"""
+    if isinstance(node, list):
+        for e in node:
+            _identifiers(e, names)
+    elif isinstance(node, dict):
+        if node.get('type') == 'Identifier':
+            names.add(node['name'])
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                _identifiers(value, names)
+    return names
+
+
+def uses_arguments(node):
+    """Returns whether the function body node may use the arguments object of the function, the
+       nested functions have their own arguments objects"""
+    if isinstance(node, list):
+        return any(uses_arguments(e) for e in node if e is not None)
+    typ = node.get('type')
+    if typ in ('FunctionDeclaration', 'FunctionExpression', 'ArrowFunctionExpression'):
+        return False
+    elif typ == 'Identifier':
+        return node['name'] in ('arguments', 'eval')
+    elif typ == 'WithStatement':
+        return True
+    return any(uses_arguments(value) for value in node.values() if isinstance(value, (dict, list)))
+
+
+def locals_code(local_vars, params):
+    """Returns the python code setting the local variables that are not params to undefined"""
+    names = sorted(py_name for name, py_name in six.iteritems(local_vars)
+                   if name not in params and name != 'this')
+    if not names:
+        return ''
+    return '%s = %s\n' % (' = '.join(names), undefined_constant())
+
+
+def trans_program_stream(body):
+    """Translates the body of a Program statement by statement, yields the python code of each
+       top-level statement with its inline definitions already injected, so that only one
+       statement is held in memory. The registration of all hoisted names comes first, followed
+       by the top-level function declarations. Functions declared in nested blocks are defined
+       right before their statement."""
+    global Context, inline_stack
+    registered = hoisted_names(body)
+    defined = set()  # constants
+    yield 'var.registers([%s])\n' % ', '.join(repr(e) for e in sorted(registered))
+    statements = [e for e in body if e['type'] == 'FunctionDeclaration'] + \
+                 [e for e in body if e['type'] != 'FunctionDeclaration']
+    try:
+        for n, e in enumerate(statements):
+            # every statement gets its own inline names
+            Context, inline_stack = ContextStack(), InlineStack('s%d' % n)
+            code = trans(e)
+            code = ''.join(Context.to_define.values()) + code
+            code = inline_stack.inject_inlines(code)
+            new = Context.to_register - registered
+            if new:
+                registered.update(new)
+                code = 'var.registers([%s])\n' % ', '.join(repr(e) for e in sorted(new)) + code
+            if constants is not None and len(constants) > len(defined):
+                new_constants = set(constants) - defined
+                defined.update(new_constants)
+                code = get_constants_code(new_constants) + code
+            yield code
+    finally:
+        clean_stacks()
+
+
 # ======== FUNCTIONS ============
 
 
+@incremental
 def FunctionDeclaration(type, id, params, defaults, body, generator,
                         expression):
     if generator:
@@ -616,22 +959,25 @@ def FunctionDeclaration(type, id, params, defaults, body, generator,
     PyName = 'PyJsHoisted_%s_' % JsName
     PyName = PyName if is_valid_py_name(PyName) else 'PyJsHoistedNonPyName'
     # this is quite complicated
-    global Context
-    previous_context = Context
+    global Context, local_vars
+    previous_context, previous_locals = Context, local_vars
     # change context to the context of this function
     Context = ContextStack()
+    local_vars = local_names(params, body)
     # translate body within current context
     code = trans(body)
     # get arg names
     vars = [v['name'] for v in params]
-    # args are automaticaly registered variables
-    Context.to_register.update(vars)
+    # args are automaticaly registered variables (unless they are python locals)
+    Context.to_register.update(v for v in vars if v not in local_vars)
     # add all hoisted elements inside function
-    code = Context.get_code() + code
+    code = Context.get_code() + locals_code(local_vars, vars) + code
     # check whether args are valid python names:
     used_vars = []
     for v in vars:
-        if is_valid_py_name(v):
+        if v in local_vars:
+            used_vars.append(local_vars[v])
+        elif is_valid_py_name(v):
             used_vars.append(v)
         else:  # invalid arg in python, for example $, replace with alternatice arg
             used_vars.append('PyJsArg_%s_' % to_hex(v))
@@ -639,21 +985,24 @@ def FunctionDeclaration(type, id, params, defaults, body, generator,
     header += 'def %s(%sthis, arguments, var=var):\n' % (
         PyName, ', '.join(used_vars) + (', ' if vars else ''))
     # transfer names from Py scope to Js scope
-    arg_map = dict(zip(vars, used_vars))
+    arg_map = dict((v, py_v) for v, py_v in zip(vars, used_vars) if v not in local_vars)
     arg_map.update({'this': 'this', 'arguments': 'arguments'})
     arg_conv = 'var = Scope({%s}, var)\n' % ', '.join(
         repr(k) + ':' + v for k, v in six.iteritems(arg_map))
     # and finally set the name of the function to its real name:
     footer = '%s.func_name = %s\n' % (PyName, repr(JsName))
+    if not uses_arguments(body):
+        footer += '%s.needs_arguments = False\n' % PyName
     footer += 'var.put(%s, %s)\n' % (repr(JsName), PyName)
     whole_code = header + indent(arg_conv + code) + footer
     # restore context
-    Context = previous_context
+    Context, local_vars = previous_context, previous_locals
     # define in upper context
     Context.define(JsName, whole_code)
     return 'pass\n'
 
 
+@incremental
 def FunctionExpression(type, id, params, defaults, body, generator,
                        expression):
     if generator:
@@ -668,22 +1017,25 @@ def FunctionExpression(type, id, params, defaults, body, generator,
     PyName = inline_stack.require(ScriptName)  # this is unique
 
     # again quite complicated
-    global Context
-    previous_context = Context
+    global Context, local_vars
+    previous_context, previous_locals = Context, local_vars
     # change context to the context of this function
     Context = ContextStack()
+    local_vars = local_names(params, body)
     # translate body within current context
     code = trans(body)
     # get arg names
     vars = [v['name'] for v in params]
-    # args are automaticaly registered variables
-    Context.to_register.update(vars)
+    # args are automaticaly registered variables (unless they are python locals)
+    Context.to_register.update(v for v in vars if v not in local_vars)
     # add all hoisted elements inside function
-    code = Context.get_code() + code
+    code = Context.get_code() + locals_code(local_vars, vars) + code
     # check whether args are valid python names:
     used_vars = []
     for v in vars:
-        if is_valid_py_name(v):
+        if v in local_vars:
+            used_vars.append(local_vars[v])
+        elif is_valid_py_name(v):
             used_vars.append(v)
         else:  # invalid arg in python, for example $, replace with alternatice arg
             used_vars.append('PyJsArg_%s_' % to_hex(v))
@@ -691,7 +1043,7 @@ def FunctionExpression(type, id, params, defaults, body, generator,
     header += 'def %s(%sthis, arguments, var=var):\n' % (
         PyName, ', '.join(used_vars) + (', ' if vars else ''))
     # transfer names from Py scope to Js scope
-    arg_map = dict(zip(vars, used_vars))
+    arg_map = dict((v, py_v) for v, py_v in zip(vars, used_vars) if v not in local_vars)
     arg_map.update({'this': 'this', 'arguments': 'arguments'})
     if id:  # make self available from inside...
         if id['name'] not in arg_map:
@@ -700,9 +1052,11 @@ def FunctionExpression(type, id, params, defaults, body, generator,
         repr(k) + ':' + v for k, v in six.iteritems(arg_map))
     # and finally set the name of the function to its real name:
     footer = '%s._set_name(%s)\n' % (PyName, repr(JsName))
+    if not uses_arguments(body):
+        footer += '%s.needs_arguments = False\n' % PyName
     whole_code = header + indent(arg_conv + code) + footer
     # restore context
-    Context = previous_context
+    Context, local_vars = previous_context, previous_locals
     # define in upper context
     inline_stack.define(PyName, whole_code)
     return PyName
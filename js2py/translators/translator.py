@@ -1,6 +1,8 @@
 import pyjsparser
 import pyjsparser.parser
 from . import translating_nodes
+from ..utils import disk_cache, parse_cache
+from ..utils.snippet_cache import SnippetCache
 
 import hashlib
 import re
@@ -8,30 +10,40 @@ import re
 # Enable Js2Py exceptions and pyimport in parser
 pyjsparser.parser.ENABLE_PYIMPORT = True
 
-# the re below is how we'll recognise numeric constants.
-# it finds any 'simple numeric that is not preceded with an alphanumeric character
-# the numeric can be a float (so a dot is found) but
-# it does not recognise notation such as 123e5, 0xFF, infinity or NaN
-CP_NUMERIC_RE = re.compile(r'(?<![a-zA-Z0-9_"\'])([0-9\.]+)')
-CP_NUMERIC_PLACEHOLDER = '__PyJsNUM_%i_PyJsNUM__'
-CP_NUMERIC_PLACEHOLDER_REVERSE_RE = re.compile(
-    CP_NUMERIC_PLACEHOLDER.replace('%i', r'([0-9\.]+)'))
-
-# the re below is how we'll recognise string constants
-# it finds a ' or ", then reads until the next matching ' or "
-# this re only services simple cases, it can not be used when
-# there are escaped quotes in the expression
-
-#CP_STRING_1 = re.compile(r'(["\'])(.*?)\1') # this is how we'll recognise string constants
-
-CP_STRING = '"([^\\\\"]+|\\\\([bfnrtv\'"\\\\]|[0-3]?[0-7]{1,2}|x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}))*"|\'([^\\\\\']+|\\\\([bfnrtv\'"\\\\]|[0-3]?[0-7]{1,2}|x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}))*\''
-CP_STRING_RE = re.compile(
-    CP_STRING)  # this is how we'll recognise string constants
-CP_STRING_PLACEHOLDER = '__PyJsSTR_%i_PyJsSTR__'
-CP_STRING_PLACEHOLDER_REVERSE_RE = re.compile(
-    CP_STRING_PLACEHOLDER.replace('%i', r'([0-9\.]+)'))
-
-cache = {}
+# Compilation plans: every string and numeric literal of the source is replaced with a
+# numbered placeholder string. The resulting template is translated and compiled only once,
+# the literal values are passed to the compiled code in a constants tuple, so sources that
+# differ only in their literals (eg. generated rule expressions) skip both the translation
+# and python compile().
+CP_TOKEN_RE = re.compile(r'''
+    (?P<space>\s+) |
+    (?P<comment>//[^\n\r]*|/\*[\s\S]*?\*/) |
+    (?P<string>"(?:[^"\\\n\r]|\\(?:\r\n|[\s\S]))*"|\'(?:[^\'\\\n\r]|\\(?:\r\n|[\s\S]))*\') |
+    (?P<number>(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)(?![\w$])) |
+    (?P<name>(?:[^\W\d]|\$)(?:\w|\$)*) |
+    (?P<punct>[\s\S])
+''', re.VERBOSE | re.UNICODE)
+CP_REGEX_RE = re.compile(
+    r'/(?:[^/\\\[\n\r]|\\.|\[(?:[^\]\\\n\r]|\\.)*\])+/(?:\w|\$)*', re.UNICODE)
+# after these keywords a slash starts a regex literal, after other names it is a division
+CP_REGEX_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+    'throw', 'case', 'do', 'else'
+}
+
+CP_PLACEHOLDER = '"__PyJsCONST_%d__"'
+CP_VALUE_RE = re.compile(r"Js\(u?'__PyJsCONST_(\d+)__'\)")
+CP_KEY_RE = re.compile(r"u?'__PyJsCONST_(\d+)__'")
+CP_FUNCTION = 'PyJsCompilationPlan'
+
+# the translated and compiled compilation plans by the hash of their template
+COMPILATION_PLAN_MAX_ENTRIES = 1024
+COMPILATION_PLAN_MAX_BYTES = 32 * 1024 * 1024
+cache = SnippetCache(
+    max_entries=COMPILATION_PLAN_MAX_ENTRIES, max_bytes=COMPILATION_PLAN_MAX_BYTES)
+
+# approximate size (in characters) of the python code chunks yielded by translate_js_stream
+STREAM_CHUNK_SIZE = 64 * 1024
 
 # This crap is still needed but I removed it for speed reasons. Have to think ofa  better idea
 # import js2py.pyjs, sys
@@ -58,107 +70,341 @@ def dbg(x):
 # Another way of doing that would be with my auto esprima translation but its much slower:
 # parsed = esprima.parse(js).to_dict()
 def pyjsparser_parse_fn(code):
-    parser = pyjsparser.PyJsParser()
-    return parser.parse(code)
+    # the callers get their own copy of the tree, the trees of the parse cache are shared
+    return parse_cache.parse(code, copy=True)
 
-def translate_js(js, HEADER=DEFAULT_HEADER, use_compilation_plan=False, parse_fn=pyjsparser_parse_fn):
-    """js has to be a javascript source code.
-       returns equivalent python code."""
-    if use_compilation_plan and not '//' in js and not '/*' in js:
-        return translate_js_with_compilation_plan(js, HEADER=HEADER)
 
-    parsed = parse_fn(js)
-    translating_nodes.clean_stacks()
-    return HEADER + translating_nodes.trans(
-        parsed)  # syntax tree to python code
+def _parse(parse_fn, code):
+    """Returns the syntax tree of code. The translator never modifies the trees so with the
+       default parse_fn it uses the shared ones of the parse cache."""
+    if parse_fn is pyjsparser_parse_fn:
+        return parse_cache.parse(code)
+    return parse_fn(code)
 
 
-class match_unumerator(object):
-    """This class ise used """
-    matchcount = -1
+def translate_js(js, HEADER=DEFAULT_HEADER, use_compilation_plan=False, parse_fn=pyjsparser_parse_fn):
+    """js has to be a javascript source code.
+       returns equivalent python code.
 
-    def __init__(self, placeholder_mask):
-        self.placeholder_mask = placeholder_mask
-        self.matches = []
+       If the disk cache is enabled (see js2py.enable_disk_cache) the translation is looked up there first.
+       Translations made with a custom parse_fn are not cached."""
+    dc = disk_cache.get_disk_cache() if parse_fn is pyjsparser_parse_fn else None
+    # compilation plans generate different (but equivalent) code
+    kind = 'py-plan' if use_compilation_plan else 'py'
+    if dc is not None:
+        cached = dc.get(kind, js)
+        if cached is not None:
+            return HEADER + cached
+
+    py_code = None
+    if use_compilation_plan:
+        py_code = translate_js_with_compilation_plan(js, HEADER='')
+    if py_code is None:
+        parsed = _parse(parse_fn, js)
+        translating_nodes.clean_stacks()
+        py_code = translating_nodes.trans(parsed)  # syntax tree to python code
 
-    def __call__(self, match):
-        self.matchcount += 1
-        self.matches.append(match.group(0))
-        return self.placeholder_mask % self.matchcount
+    if dc is not None:
+        dc.set(kind, js, py_code)
+    return HEADER + py_code
 
-    def __repr__(self):
-        return '\n'.join(self.placeholder_mask % counter + '=' + match
-                         for counter, match in enumerate(self.matches))
 
-    def wrap_up(self, output):
-        for counter, value in enumerate(self.matches):
-            output = output.replace(
-                "u'" + self.placeholder_mask % (counter) + "'", value, 1)
-        return output
+def translate_js_stream(js, HEADER=DEFAULT_HEADER, parse_fn=pyjsparser_parse_fn,
+                        chunk_size=STREAM_CHUNK_SIZE):
+    """Like translate_js but yields the python code in chunks of roughly chunk_size characters.
+       Every chunk consists of whole top-level statements so it can be compiled and executed on
+       its own (in order, in the same globals). Only the syntax tree and one chunk are held in
+       memory, use this for very large bundles. The disk cache is not used."""
+    parsed = _parse(parse_fn, js)
+    translating_nodes.clean_stacks()
+    if HEADER:
+        yield HEADER
+    chunk = []
+    size = 0
+    for code in translating_nodes.trans_program_stream(parsed['body']):
+        chunk.append(code)
+        size += len(code)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def tokenize(js):
+    """Yields (kind, token, start) for every token of js, kind is one of space, comment, string,
+       number, name, regex and punct (single character). This is a light tokenizer, it raises
+       ValueError when js can't be tokenized reliably (a slash that can be either a division or
+       a regex literal, ES6 template strings)."""
+    prev = prev2 = (None, None)  # (kind, token) of the last two significant tokens
+    pos = 0
+    length = len(js)
+    while pos < length:
+        m = CP_TOKEN_RE.match(js, pos)
+        kind = m.lastgroup
+        tok = m.group(0)
+        if kind == 'punct' and tok == '/':
+            if prev[1] == '}' or (prev[1] in ('+', '-') and prev2 == prev):
+                raise ValueError('ambiguous slash at %d' % pos)
+            if (prev[0] is None or prev[1] in CP_REGEX_KEYWORDS or
+                    prev[0] == 'punct' and prev[1] not in ')]'):
+                m = CP_REGEX_RE.match(js, pos)
+                if m is None:
+                    raise ValueError('invalid regex literal at %d' % pos)
+                kind = 'regex'
+                tok = m.group(0)
+        elif kind == 'punct' and tok == '`':
+            raise ValueError('template strings are not supported')
+        yield kind, tok, pos
+        if kind != 'space' and kind != 'comment':
+            prev2, prev = prev, (kind, tok)
+        pos = m.end()
 
 
 def get_compilation_plan(js):
-    match_increaser_str = match_unumerator(CP_STRING_PLACEHOLDER)
-    compilation_plan = re.sub(CP_STRING, match_increaser_str, js)
-
-    match_increaser_num = match_unumerator(CP_NUMERIC_PLACEHOLDER)
-    compilation_plan = re.sub(CP_NUMERIC_RE, match_increaser_num,
-                              compilation_plan)
-    # now put quotes, note that just patching string replaces is somewhat faster than
-    # using another re:
-    compilation_plan = compilation_plan.replace(
-        '__PyJsNUM_', '"__PyJsNUM_').replace('_PyJsNUM__', '_PyJsNUM__"')
-    compilation_plan = compilation_plan.replace(
-        '__PyJsSTR_', '"__PyJsSTR_').replace('_PyJsSTR__', '_PyJsSTR__"')
-
-    return match_increaser_str, match_increaser_num, compilation_plan
+    """Splits js into a template and its literals.
+
+       Returns (template, literals) where every string and numeric literal of js
+       was replaced in the template by a numbered placeholder string, or None if js
+       can't be tokenized reliably (the caller should translate js normally then).
+       literals is the list of (value, key) of the literals, key is the property name
+       the literal stands for when it is used as an object key."""
+    scanner = pyjsparser.PyJsParser()
+    template = []
+    literals = []
+    try:
+        for kind, tok, start in tokenize(js):
+            if kind == 'string' or kind == 'number':
+                literal = _scan_literal(scanner, tok)
+                if literal is not None:
+                    literals.append(literal)
+                    tok = CP_PLACEHOLDER % (len(literals) - 1)
+            template.append(tok)
+    except ValueError:
+        return None
+    return ''.join(template), literals
+
+
+def _scan_literal(scanner, raw):
+    """Returns (value, key) of the string or numeric literal raw or None if it should
+       stay in the template (octal literals that strict mode rejects, directives)."""
+    scanner.source = raw + ' '
+    scanner.length = len(scanner.source)
+    scanner.index = 0
+    try:
+        if raw[0] in '\'"':
+            token = scanner.scanStringLiteral()
+            if token['octal'] or token['value'] == 'use strict':
+                return None
+        else:
+            if raw[0] == '0' and raw[1:2].isdigit():
+                return None
+            token = scanner.scanNumericLiteral()
+    except Exception:
+        return None
+    if scanner.index != len(raw):
+        return None
+    value = token['value']
+    try:
+        key = translating_nodes.to_key({'type': 'Literal', 'value': value})
+    except (OverflowError, ValueError):  # infinite numbers (eg. 1e400)
+        return None
+    return value, key
+
+
+def translate_compilation_plan(template, count):
+    """Translates the template of a compilation plan into a python function
+       PyJsCompilationPlan(var, PyJsConstants, PyJsKeys) that runs the original js when
+       called with its literal values and keys. Returns None if the template can't be
+       parameterized. The result is cached."""
+    return _compilation_plan(template, count)[0]
+
+
+def _compilation_plan(template, count):
+    """Returns the cached (python_code, code) of the template, both are None if the template
+       can't be parameterized."""
+    cp_hash = hashlib.md5(template.encode('utf-8', 'surrogatepass')).digest()
+    entry = cache.get(cp_hash)
+    if entry is None:
+        python_code = _translate_template(template, count)
+        code = None
+        if python_code is not None:
+            code = compile(python_code, '<JsCompilationPlan>', 'exec')
+        entry = (python_code, code)
+        cache.set(cp_hash, entry)
+    return entry
+
+
+def _translate_template(template, count):
+    try:
+        parsed = parse_cache.parse(template)
+    except Exception:
+        return None  # let the normal translation report the error
+    # the literals must stay in place to be replaced with the constants of the plan
+    translating_nodes.clean_stacks(hoist_literals=False)
+    python_code = translating_nodes.trans(parsed)
+    python_code = CP_VALUE_RE.sub(r'Js(PyJsConstants[\1])', python_code)
+    python_code = CP_KEY_RE.sub(r'PyJsKeys[\1]', python_code)
+    used = set(int(i) for i in re.findall(r'PyJs(?:Constants|Keys)\[(\d+)\]', python_code))
+    if '__PyJsCONST_' in python_code or used != set(range(count)):
+        # some placeholder did not end up as a literal - the template was
+        # tokenized incorrectly (eg. a regex literal taken for a division)
+        return None
+    return 'def %s(var, PyJsConstants, PyJsKeys):\n%s    pass\n' % (
+        CP_FUNCTION, ''.join('    ' + line + '\n' for line in python_code.splitlines()))
+
+
+def compile_js_with_compilation_plan(js):
+    """Returns (code, constants, keys) or None if js can't use a compilation plan.
+
+       code is a compiled module defining PyJsCompilationPlan (see translate_compilation_plan),
+       it is shared by all sources that differ only in their literals. Executing the code in a
+       namespace with the names of js2py.pyjs and then calling
+       PyJsCompilationPlan(var, constants, keys) runs js."""
+    plan = get_compilation_plan(js)
+    if plan is None:
+        return None
+    template, literals = plan
+    code = _compilation_plan(template, len(literals))[1]
+    if code is None:
+        return None
+    return (code, tuple(value for value, key in literals),
+            tuple(key for value, key in literals))
 
 
 def translate_js_with_compilation_plan(js, HEADER=DEFAULT_HEADER):
     """js has to be a javascript source code.
-       returns equivalent python code.
+       returns equivalent python code or None if js can't use a compilation plan.
 
-       compile plans only work with the following restrictions:
-       - only enabled for oneliner expressions
-       - when there are comments in the js code string substitution is disabled
-       - when there nested escaped quotes string substitution is disabled, so
+       All string and numeric literals are replaced with placeholders and the resulting
+       template is translated only once, so for js code with similar structure subsequent
+       calls only have to tokenize js. For example these share the same compilation plan:
 
-       cacheable:
        Q1 == 1 && name == 'harry'
-
-       not cacheable:
-       Q1 == 1 && name == 'harry' // some comment
-
-       not cacheable:
-       Q1 == 1 && name == 'o\'Reilly'
-
-       not cacheable:
-       Q1 == 1 && name /* some comment */ == 'o\'Reilly'
+       Q1 == 2 && name == 'o\'Reilly' // some comment
        """
-
-    match_increaser_str, match_increaser_num, compilation_plan = get_compilation_plan(
-        js)
-
-    cp_hash = hashlib.md5(compilation_plan.encode('utf-8')).digest()
-    try:
-        python_code = cache[cp_hash]['proto_python_code']
-    except:
-        parser = pyjsparser.PyJsParser()
-        parsed = parser.parse(compilation_plan)  # js to esprima syntax tree
-        # Another way of doing that would be with my auto esprima translation but its much slower and causes import problems:
-        # parsed = esprima.parse(js).to_dict()
+    plan = get_compilation_plan(js)
+    if plan is None:
+        return None
+    template, literals = plan
+    python_code = translate_compilation_plan(template, len(literals))
+    if python_code is None:
+        return None
+    constants = ''.join(
+        (repr(value) if value != float('inf') else 'float("inf")') + ', '
+        for value, key in literals)
+    keys = ''.join(repr(key) + ', ' for value, key in literals)
+    return HEADER + python_code + '%s(var, (%s), (%s))\n' % (CP_FUNCTION, constants, keys)
+
+
+def split_function_declarations(js):
+    """Returns (start, end) positions of the function declarations in the global scope of js.
+       Raises ValueError if js can't be tokenized reliably."""
+    spans = []
+    depth = 0
+    start = None  # start of the current function declaration
+    in_body = False
+    prev = None
+    for kind, tok, pos in tokenize(js):
+        if kind == 'space' or kind == 'comment':
+            continue
+        if kind == 'punct':
+            if tok in '([{':
+                if tok == '{' and start is not None and not depth:
+                    in_body = True
+                depth += 1
+            elif tok in ')]}':
+                depth -= 1
+                if not depth and in_body:
+                    spans.append((start, pos + 1))
+                    start = None
+                    in_body = False
+        elif (tok == 'function' and not depth and start is None and
+              prev in (None, ';', '}')):
+            start = pos
+        prev = tok
+    return spans
+
+
+class IncrementalTranslator(object):
+    """Translates successive versions of the same js source (eg. a file that is being edited),
+       reusing the python code generated for top-level functions that did not change since the
+       previous translate call, so that the reload latency scales with the size of the edit.
+
+       Function declarations in the global scope are compared by their source and the unchanged
+       ones are neither parsed nor translated again. Other top-level functions (function
+       expressions) are compared by their syntax tree, so they are parsed but not translated again.
+
+       >>> translator = IncrementalTranslator()
+       >>> py_code = translator.translate(js)
+       >>> py_code = translator.translate(edited_js)  # much faster
+       >>> translator.reused, translator.translated
+       (153, 1)
+
+       The generated code differs from translate_js output only in names of python functions."""
+
+    def __init__(self, parse_fn=pyjsparser_parse_fn):
+        self.parse_fn = parse_fn
+        self.functions = {}
+        self.reused = 0  # top-level functions reused by the last translate call
+        self.translated = 0  # top-level functions translated by the last translate call
+
+    def translate(self, js, HEADER=DEFAULT_HEADER):
         translating_nodes.clean_stacks()
-        python_code = translating_nodes.trans(
-            parsed)  # syntax tree to python code
-        cache[cp_hash] = {
-            'compilation_plan': compilation_plan,
-            'proto_python_code': python_code,
-        }
-
-    python_code = match_increaser_str.wrap_up(python_code)
-    python_code = match_increaser_num.wrap_up(python_code)
-
-    return HEADER + python_code
+        current = {}
+        translating_nodes.function_cache = (self.functions, current)
+        try:
+            parsed = self._parse(js, current)
+            py_code = translating_nodes.trans(parsed)
+        finally:
+            translating_nodes.function_cache = None
+        self.reused = sum(1 for key in current if key in self.functions)
+        self.translated = len(current) - self.reused
+        self.functions = current  # forget the functions that are gone
+        return HEADER + py_code
+
+    def _parse(self, js, current):
+        """Parses js except of the function declarations that did not change, these (and the
+           changed ones) are translated in advance and replaced with TranslatedFunction nodes."""
+        try:
+            spans = split_function_declarations(js)
+        except ValueError:
+            return _parse(self.parse_fn, js)
+        functions = []
+        remainder = []
+        last = 0
+        try:
+            for start, end in spans:
+                source = js[start:end]
+                h = hashlib.sha1(source.encode('utf-8', 'surrogatepass')).hexdigest()[:12]
+                n = 0
+                while ('src', h, n) in current:
+                    n += 1
+                key = ('src', h, n)
+                translation = self.functions.get(key)
+                if translation is None:
+                    # keep the line numbers in syntax errors
+                    parsed = _parse(self.parse_fn, '\n' * js.count('\n', 0, start) + source)
+                    if [e['type'] for e in parsed['body'] if e['type'] != 'EmptyStatement'
+                        ] != ['FunctionDeclaration']:
+                        raise ValueError('not a function declaration')
+                    translation = translating_nodes.translate_function(
+                        parsed['body'][0], 's%sx%d' % (h, n))
+                current[key] = translation
+                functions.append({'type': 'TranslatedFunction', 'key': key})
+                # function declarations are hoisted so they can be moved to the top
+                remainder.append(js[last:start])
+                remainder.append(';' + '\n' * source.count('\n'))
+                last = end
+            remainder.append(js[last:])
+            parsed = _parse(self.parse_fn, ''.join(remainder))
+        except Exception:
+            # function declarations were not split correctly, let the parser report the errors
+            current.clear()
+            return _parse(self.parse_fn, js)
+        # parsed may be shared by the parse cache
+        return dict(parsed, body=functions + parsed['body'])
 
 
 def trasnlate(js, HEADER=DEFAULT_HEADER):
@@ -0,0 +1,214 @@
+'''Persistent on-disk cache for translated and compiled JavaScript.
+
+Translation is by far the slowest step of running a JS bundle with Js2Py, so the
+results of translate_js (Python source) and of EvalJs.execute (compiled code objects)
+can be stored in a cache directory and reused after the process restarts.
+
+Every entry is a single marshalled file whose name is derived from the source hash, the Js2Py
+version, the hash of the translator sources, the parser settings and the Python bytecode version,
+so entries written by a different Js2Py, translator, parser or Python version are simply never
+found. Writes are atomic (write to a temp file in the same directory and rename it over the
+target) so multiple workers can safely share one directory. The total size of the directory is
+capped and the least recently used entries (by file modification time, refreshed on every hit)
+are evicted first.
+
+The cache is opt-in:
+>>> import js2py
+>>> js2py.enable_disk_cache('/var/cache/js2py', max_size=256 * 1024 * 1024)
+'''
+__all__ = ['DiskCache', 'enable_disk_cache', 'disable_disk_cache', 'get_disk_cache']
+
+import os
+import sys
+import binascii
+import marshal
+import hashlib
+import tempfile
+import platform
+
+import pyjsparser.parser
+
+from .. import __version__ as JS2PY_VERSION
+from .parsers import get_parser_backend
+
+ENTRY_SUFFIX = '.jsc'
+DEFAULT_MAX_SIZE = 128 * 1024 * 1024  # bytes
+
+
+def _python_tag():
+    try:
+        from importlib.util import MAGIC_NUMBER
+    except ImportError:  # python 2
+        import imp
+        MAGIC_NUMBER = imp.get_magic()
+    return '%s-%d.%d-%s' % (platform.python_implementation(),
+                            sys.version_info[0], sys.version_info[1],
+                            binascii.hexlify(MAGIC_NUMBER).decode('ascii'))
+
+
+PYTHON_TAG = _python_tag()
+
+# the translated code depends on these sources, they may change without a version bump
+TRANSLATOR_SOURCES = ('translators', 'base.py', 'pyjs.py')
+_translator_tag = None
+
+
+def translator_tag():
+    '''Returns the hash of the translator sources (and of the runtime the translated code uses)'''
+    global _translator_tag
+    if _translator_tag is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        h = hashlib.sha1()
+        for name in TRANSLATOR_SOURCES:
+            path = os.path.join(root, name)
+            paths = [path]
+            if os.path.isdir(path):
+                paths = [os.path.join(path, e) for e in sorted(os.listdir(path)) if e.endswith('.py')]
+            for path in paths:
+                try:
+                    with open(path, 'rb') as f:
+                        h.update(f.read())
+                except (IOError, OSError):  # eg. installed without the sources
+                    h.update(path.encode('utf-8'))
+        _translator_tag = h.hexdigest()[:16]
+    return _translator_tag
+
+
+class DiskCache(object):
+    '''Stores marshallable values (code objects, strings) in cache_dir.
+
+       Never raises on a broken or concurrently modified cache - a failed read is
+       treated as a miss and a failed write is ignored.'''
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self._size = None  # lazily computed total size of the entries
+
+    def entry_path(self, kind, source):
+        '''kind distinguishes what is stored (eg 'py' source or 'code' object) for the same source'''
+        if not isinstance(source, bytes):
+            # lone surrogates are valid in js strings
+            source = source.encode('utf-8', 'surrogatepass')
+        h = hashlib.sha1()
+        # pyimport statements are only parsed when enabled (see js2py.disable_pyimport)
+        h.update(('%s|%s|%s|%s|%s|%d|' % (kind, JS2PY_VERSION, translator_tag(), PYTHON_TAG,
+                                          get_parser_backend().name,
+                                          pyjsparser.parser.ENABLE_PYIMPORT)).encode('utf-8'))
+        h.update(source)
+        return os.path.join(self.cache_dir, h.hexdigest() + ENTRY_SUFFIX)
+
+    def get(self, kind, source):
+        path = self.entry_path(kind, source)
+        try:
+            with open(path, 'rb') as f:
+                value = marshal.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception:  # corrupted entry, marshal raises EOFError, ValueError or TypeError
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)  # mark as recently used
+        except OSError:
+            pass
+        return value
+
+    def set(self, kind, source, value):
+        path = self.entry_path(kind, source)
+        data = marshal.dumps(value)
+        if len(data) > self.max_size:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                suffix='.tmp', prefix='.', dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                try:
+                    replaced = os.path.getsize(path)  # the entry may already exist
+                except OSError:
+                    replaced = 0
+                if hasattr(os, 'replace'):
+                    os.replace(tmp_path, path)
+                else:  # python 2, rename is atomic on posix
+                    os.rename(tmp_path, path)
+            except Exception:
+                self._remove(tmp_path)
+                raise
+        except (IOError, OSError):
+            return
+        if self._size is not None:
+            self._size += len(data) - replaced
+        if self.size() > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # removed by another process
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self):
+        if self._size is None:
+            self._size = sum(e[1] for e in self._entries())
+        return self._size
+
+    def evict(self, target=None):
+        '''Removes least recently used entries until the total size is below target
+           (by default 3/4 of max_size so that eviction does not run on every write).'''
+        if target is None:
+            target = self.max_size * 3 // 4
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        for mtime, size, path in entries:
+            if total <= target:
+                break
+            if self._remove(path):
+                total -= size
+        self._size = total
+
+    def clear(self):
+        self.evict(0)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+
+_disk_cache = None
+
+
+def enable_disk_cache(cache_dir, max_size=DEFAULT_MAX_SIZE):
+    '''Enables persistent caching of translate_js and EvalJs.execute results in cache_dir.
+       max_size is the size limit of the cache directory in bytes.'''
+    global _disk_cache
+    _disk_cache = DiskCache(cache_dir, max_size)
+    return _disk_cache
+
+
+def disable_disk_cache():
+    global _disk_cache
+    _disk_cache = None
+
+
+def get_disk_cache():
+    '''Returns the currently enabled DiskCache or None.'''
+    return _disk_cache
@@ -0,0 +1,72 @@
+'''Cache of parsed syntax trees shared by the translator and the VM.
+
+The same sources tend to be parsed over and over (eval and new Function bodies, snippets
+executed with EvalJs, the VM and the translator running the same code), so parse results are
+kept in a bounded LRU cache keyed by the hash of the source. Sources are parsed with the
+current parser backend (see js2py.utils.parsers). By default only sources shorter
+than 64KB are cached - big bundles are usually parsed only once and their trees are huge.
+
+The returned trees are shared: they are never modified by Js2Py and must not be modified by
+the caller either. Use parse(code, copy=True) to get a private copy (this is what the public
+js2py.translators.translator.pyjsparser_parse_fn returns).
+
+>>> from js2py.utils import parse_cache
+>>> parse_cache.enable_parse_cache(max_entries=1024, max_source_length=1024 * 1024)
+>>> parse_cache.get_parse_cache().stats()
+{'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+'''
+__all__ = ['parse', 'enable_parse_cache', 'disable_parse_cache', 'get_parse_cache']
+
+import copy as _copy
+import hashlib
+
+import pyjsparser.parser
+
+from .snippet_cache import SnippetCache
+from .parsers import get_parser_backend
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_SOURCE_LENGTH = 64 * 1024  # characters
+
+_parse_cache = SnippetCache(max_entries=DEFAULT_MAX_ENTRIES)
+_max_source_length = DEFAULT_MAX_SOURCE_LENGTH
+
+
+def parse(code, copy=False):
+    '''Returns the syntax tree of code. The tree may be shared with other callers, do not
+       modify it unless copy is True.'''
+    cache = _parse_cache
+    backend = get_parser_backend()
+    if cache is None or len(code) > _max_source_length:
+        return backend.parse(code)
+    # pyimport statements are only parsed when enabled (see js2py.disable_pyimport),
+    # lone surrogates are valid in js sources
+    key = hashlib.sha1(('%s|%d|' % (backend.name, pyjsparser.parser.ENABLE_PYIMPORT) +
+                        code).encode('utf-8', 'surrogatepass')).digest()
+    tree = cache.get(key)
+    if tree is None:
+        tree = backend.parse(code)
+        cache.set(key, tree, size=len(code))
+    return _copy.deepcopy(tree) if copy else tree
+
+
+def enable_parse_cache(max_entries=DEFAULT_MAX_ENTRIES,
+                       max_source_length=DEFAULT_MAX_SOURCE_LENGTH,
+                       max_total_length=None):
+    '''Replaces the parse cache with a new one. Sources longer than max_source_length
+       characters are never cached, max_total_length limits the total length of cached sources.'''
+    global _parse_cache, _max_source_length
+    _parse_cache = SnippetCache(
+        max_entries=max_entries, max_bytes=max_total_length)
+    _max_source_length = max_source_length
+    return _parse_cache
+
+
+def disable_parse_cache():
+    global _parse_cache
+    _parse_cache = None
+
+
+def get_parse_cache():
+    '''Returns the SnippetCache used to store the syntax trees or None if disabled.'''
+    return _parse_cache
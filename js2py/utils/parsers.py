@@ -0,0 +1,329 @@
+'''Parser backends producing the syntax trees used by the translator and the VM.
+
+A backend turns JavaScript source into an ESTree syntax tree with exactly the same structure
+as the one produced by pyjsparser (the default backend), including its SyntaxError handling
+and pyimport statements. Faster parsers can be plugged in by registering a backend, the
+available backend with the highest priority is used:
+
+>>> class MyParser(ParserBackend):
+...     name = 'my_parser'
+...     priority = 10
+...     def is_available(self):
+...         return my_parser is not None
+...     def parse(self, code):
+...         return my_parser.parse(code)
+>>> register_parser_backend(MyParser())
+>>> get_parser_backend().name
+'my_parser'
+>>> set_parser_backend('pyjsparser')  # force a particular backend
+
+Since any difference in the trees changes the translated code, a new backend should first be
+checked with tests/parser_conformance.py.
+
+When the optional mini-racer package is installed (pip install mini-racer) the esprima_v8
+backend can be selected with set_parser_backend('esprima_v8'), preferably by the main thread: it
+runs esprima (js2py/utils/esprima.js) in V8 and is several times faster than pyjsparser on big
+sources. Sources it can't handle (syntax errors, pyimport statements, syntax that is not ECMA 5.1
+and astral characters it can't map back to the source) are parsed with pyjsparser, so the errors
+are always the ones of pyjsparser.
+'''
+__all__ = [
+    'ParserBackend', 'PyJsParserBackend', 'EsprimaV8Backend', 'register_parser_backend',
+    'get_parser_backend', 'set_parser_backend', 'available_parser_backends'
+]
+
+import os
+import re
+import sys
+import json
+import atexit
+import threading
+
+import six
+import pyjsparser
+import pyjsparser.parser
+
+
+class ParserBackend(object):
+    '''Base class of parser backends.'''
+    name = None
+    priority = 0
+
+    def is_available(self):
+        '''Returns whether the backend can be used (eg. its optional dependency is installed)'''
+        return True
+
+    def setup(self):
+        '''Called in the thread that selects the backend, before it is used.'''
+
+    def parse(self, code):
+        '''Returns the syntax tree of code. Must raise the same errors as pyjsparser.'''
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.name)
+
+
+class PyJsParserBackend(ParserBackend):
+    '''The pure python parser, always available.'''
+    name = 'pyjsparser'
+    priority = 0
+
+    def __init__(self):
+        # the parser is reused, one per thread since it is not thread-safe
+        self._local = threading.local()
+
+    def parse(self, code):
+        try:
+            parser = self._local.parser
+        except AttributeError:
+            parser = self._local.parser = pyjsparser.PyJsParser()
+        return parser.parse(code)
+
+
+def _import_mini_racer():
+    try:
+        from py_mini_racer import MiniRacer
+    except ImportError:
+        try:
+            from py_mini_racer.py_mini_racer import MiniRacer  # older versions
+        except ImportError:
+            return None
+    return MiniRacer
+
+
+# the nodes of the ECMA 5.1 syntax trees, esprima also produces the ones of ES6
+ECMA51_NODE_TYPES = frozenset([
+    'Program', 'EmptyStatement', 'BlockStatement', 'ExpressionStatement', 'IfStatement',
+    'LabeledStatement', 'BreakStatement', 'ContinueStatement', 'WithStatement', 'SwitchStatement',
+    'SwitchCase', 'ReturnStatement', 'ThrowStatement', 'TryStatement', 'CatchClause',
+    'WhileStatement', 'DoWhileStatement', 'ForStatement', 'ForInStatement', 'DebuggerStatement',
+    'FunctionDeclaration', 'FunctionExpression', 'VariableDeclaration', 'VariableDeclarator',
+    'ThisExpression', 'ArrayExpression', 'ObjectExpression', 'Property', 'UnaryExpression',
+    'UpdateExpression', 'BinaryExpression', 'AssignmentExpression', 'LogicalExpression',
+    'MemberExpression', 'ConditionalExpression', 'CallExpression', 'NewExpression',
+    'SequenceExpression', 'Identifier', 'Literal'
+])
+# names that are identifiers for esprima (outside of the strict mode) but keywords for pyjsparser
+KEYWORD_IDENTIFIERS = frozenset(['let', 'yield'])
+
+# characters outside of the BMP, on narrow python builds they already are surrogate pairs
+ASTRAL = re.compile(u'[\U00010000-\U0010FFFF]') if sys.maxunicode > 0xFFFF else None
+
+
+def _surrogate_pair(match):
+    code = ord(match.group()) - 0x10000
+    return six.unichr(0xD800 + (code >> 10)) + six.unichr(0xDC00 + (code & 0x3FF))
+
+
+class _Unsupported(Exception):
+    '''Raised for the trees that must be produced by pyjsparser'''
+
+
+class _V8Context(object):
+    '''MiniRacer context closed as soon as it is not used anymore, V8 keeps the process from
+       exiting while a context is open.'''
+    # creating and freeing the contexts is not thread-safe in mini-racer
+    _lock = threading.Lock()
+
+    def __init__(self, mini_racer):
+        with self._lock:
+            self._context = mini_racer()
+        self.eval = self._context.eval
+        self.call = self._context.call
+
+    def close(self):
+        context, self._context = self._context, None
+        self.eval = self.call = None
+        if context is not None and hasattr(context, 'close'):
+            with self._lock:
+                context.close()
+
+    def __del__(self):
+        self.close()
+
+
+class EsprimaV8Backend(ParserBackend):
+    '''Esprima running in V8 via the optional mini-racer package. The trees are converted to
+       the ones of pyjsparser (which also is a port of esprima).'''
+    name = 'esprima_v8'
+    priority = -10  # opt-in, see set_parser_backend
+
+    ESPRIMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'esprima.js')
+    # pyjsparser appends this to every source, it adds an EmptyStatement after a closing brace
+    SOURCE_SUFFIX = ' \n ; //END'
+    # regex values become null (the python side uses the regex pattern and flags),
+    # infinite numbers are not valid JSON so they are passed as strings. pyjsparser supports
+    # the \u{...} escapes only in strings, the identifiers are checked when the source has any
+    PARSE_TO_JSON = '''
+    function PyJsParseToJSON(code, checkEscapes) {
+        var tree = esprima.parse(code, {range: checkEscapes});
+        delete tree.sourceType;
+        return JSON.stringify(tree, function (key, value) {
+            if (key === 'range') {
+                return undefined;
+            }
+            if (value instanceof RegExp) {
+                return null;
+            }
+            if (typeof value === 'number' && !isFinite(value)) {
+                return {PyJsNumber: String(value)};
+            }
+            if (checkEscapes && value && value.type === 'Identifier' &&
+                    code.slice(value.range[0], value.range[1]).indexOf('\\\\u{') !== -1) {
+                throw new Error('Unsupported escape in ' + value.name);
+            }
+            return value;
+        });
+    }
+    '''
+    # pyjsparser returns ints for hex, octal and binary literals and floats for the others
+    INT_LITERAL = re.compile(r'0(?:([xX])|([oO])|([bB])|([0-7]+$))')
+
+    def __init__(self):
+        self._mini_racer = _import_mini_racer()
+        self._esprima = None
+        # V8 contexts are not shared between threads, every thread gets its own
+        self._local = threading.local()
+        # atexit runs in the main thread, its context would block the exit (the contexts of the
+        # other threads are closed when they end)
+        atexit.register(self.close)
+        self._fallback = PyJsParserBackend()
+
+    def is_available(self):
+        return self._mini_racer is not None and os.path.isfile(self.ESPRIMA_PATH)
+
+    def _get_context(self):
+        context = getattr(self._local, 'context', None)
+        if context is None:
+            if self._esprima is None:
+                with open(self.ESPRIMA_PATH, 'rb') as f:
+                    self._esprima = f.read().decode('utf-8')
+            context = self._local.context = _V8Context(self._mini_racer)
+            context.eval(self._esprima)
+            context.eval(self.PARSE_TO_JSON)
+        return context
+
+    def setup(self):
+        # V8 crashes when it was initialized by a thread that has ended, so it is initialized by
+        # the thread selecting the backend (the main thread usually) with its context
+        self._get_context()
+
+    def close(self):
+        '''Closes the V8 context of the calling thread, the next parse creates a new one. The
+           contexts are also closed when their threads end.'''
+        context = getattr(self._local, 'context', None)
+        if context is not None:
+            del self._local.context
+            context.close()
+
+    def parse(self, code):
+        if pyjsparser.parser.ENABLE_PYIMPORT and 'pyimport' in code:
+            return self._fallback.parse(code)
+        try:
+            tree = self._get_context().call('PyJsParseToJSON', code + self.SOURCE_SUFFIX,
+                                            '\\u{' in code)
+            return json.loads(tree, object_hook=self._to_pyjsparser_node)
+        except Exception:
+            # a syntax error, a source V8 can't take (eg. lone surrogates) or a tree that is not
+            # the one of pyjsparser, let pyjsparser report the error or parse it
+            return self._fallback.parse(code)
+
+    def _to_pyjsparser_node(self, node):
+        typ = node.get('type')
+        if typ is None:
+            if 'PyJsNumber' in node:
+                return float(node['PyJsNumber'])
+            return node
+        if typ not in ECMA51_NODE_TYPES:
+            raise _Unsupported(typ)
+        if typ == 'Literal':
+            value = node['value']
+            if 'regex' in node:
+                node['value'] = (node['regex']['pattern'], node['regex']['flags'])
+            elif isinstance(value, six.integer_types + (float, )) and not isinstance(value, bool):
+                raw = node['raw']
+                m = self.INT_LITERAL.match(raw)
+                if m is None:
+                    node['value'] = float(value)
+                elif m.group(4):
+                    node['value'] = int(raw[1:], 8)
+                else:
+                    node['value'] = int(raw[2:], 16 if m.group(1) else 8 if m.group(2) else 2)
+            elif ASTRAL is not None and isinstance(value, six.text_type) and ASTRAL.search(value):
+                # pyjsparser keeps the astral characters of the source but decodes the escaped
+                # ones to surrogate pairs, V8 returns both as single characters
+                raw = node['raw']
+                if '\\' in raw:
+                    if ASTRAL.search(raw):
+                        raise _Unsupported('astral characters and escapes in %s' % raw)
+                    node['value'] = ASTRAL.sub(_surrogate_pair, value)
+        elif typ == 'Identifier':
+            if node['name'] in KEYWORD_IDENTIFIERS:
+                raise _Unsupported(node['name'])
+        elif typ in ('FunctionDeclaration', 'FunctionExpression'):
+            if node['generator'] or any(e is not None for e in node['defaults']):
+                raise _Unsupported('generator or default parameters')
+        return node
+
+
+_backends = {}
+_selected = None  # the forced backend or None to select automatically
+_current = None
+_lock = threading.Lock()
+
+
+def register_parser_backend(backend):
+    '''Registers a ParserBackend, a previously registered backend with the same name is replaced.'''
+    global _current
+    if not backend.name:
+        raise ValueError('Parser backend must have a name')
+    with _lock:
+        _backends[backend.name] = backend
+        _current = None
+
+
+def available_parser_backends():
+    '''Returns the available backends, the preferred ones first.'''
+    with _lock:
+        backends = list(_backends.values())
+    return sorted((b for b in backends if b.is_available()),
+                  key=lambda b: (-b.priority, b.name))
+
+
+def set_parser_backend(name=None):
+    '''Forces the backend with the given name, None restores the automatic selection.'''
+    global _selected, _current
+    if name is not None:
+        backend = _backends.get(name)
+        if backend is None:
+            raise ValueError('Unknown parser backend %r, registered backends: %s' %
+                             (name, ', '.join(sorted(_backends))))
+        if not backend.is_available():
+            raise ValueError('Parser backend %r is not available' % name)
+        backend.setup()
+    _selected = name
+    _current = None
+
+
+def get_parser_backend():
+    '''Returns the backend that is currently used.'''
+    global _current
+    backend = _current
+    if backend is None:
+        if _selected is not None:
+            backend = _backends[_selected]
+        else:
+            backend = available_parser_backends()[0]
+            backend.setup()
+        _current = backend
+    return backend
+
+
+def parse(code):
+    '''Returns a new syntax tree of code, parsed with the current backend.'''
+    return get_parser_backend().parse(code)
+
+
+register_parser_backend(PyJsParserBackend())
+register_parser_backend(EsprimaV8Backend())
@@ -0,0 +1,110 @@
+'''In-memory cache of compiled snippets used by EvalJs.execute.
+
+A SnippetCache can be bounded by the number of entries, by the total (approximate) size
+of the cached code objects and by the time to live of an entry. Least recently used
+entries are evicted first. It is thread-safe, so a single instance can be shared by
+many EvalJs objects (also from different threads):
+
+>>> cache = SnippetCache(max_entries=10000, max_bytes=64 * 1024 * 1024, ttl=3600)
+>>> ctx1 = EvalJs(cache=cache)
+>>> ctx2 = EvalJs(cache=cache)
+>>> cache.stats()
+{'entries': 0, 'bytes': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+'''
+__all__ = ['SnippetCache']
+
+import marshal
+import threading
+import time
+from collections import OrderedDict
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class SnippetCache(object):
+    '''LRU cache with optional max_entries, max_bytes and ttl (in seconds) limits.
+       None means unlimited.'''
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''Returns the cached value or None'''
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] is not None and entry[2] < _clock():
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            # mark as most recently used
+            del self._data[key]
+            self._data[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=None):
+        '''size is the approximate memory used by value, by default the length of its marshalled form'''
+        if size is None:
+            size = self.estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        expires_at = _clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            self._evict()
+
+    def _remove(self, key):
+        value, size, expires_at = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        while self._data and (
+            (self.max_entries is not None and len(self._data) > self.max_entries) or
+            (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            self._remove(next(iter(self._data)))  # least recently used
+            self.evictions += 1
+
+    @staticmethod
+    def estimate_size(value):
+        try:
+            return len(marshal.dumps(value))
+        except ValueError:  # not marshallable
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
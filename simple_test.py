@@ -39,7 +39,7 @@ assert js2py.eval_js('1 + "1"') == '11'
 
 assert js2py.eval_js('function (r) {return r}')(5) == 5
 
-x, c = js2py.run_file('examples/esprima.js')
+x, c = js2py.run_file('js2py/utils/esprima.js')
 assert c.esprima.parse('var abc = 40').to_dict() == {'type': 'Program', 'body': [{'type': 'VariableDeclaration', 'kind': 'var', 'declarations': [{'id': {'type': 'Identifier', 'name': 'abc'}, 'type': 'VariableDeclarator', 'init': {'type': 'Literal', 'raw': '40', 'value': 40}}]}], 'sourceType': 'script'}
 assert js2py.eval_js('var x = {get y() { return this.val;}, val: 11};x.y') == 11
 try:
@@ -87,6 +87,228 @@ context.execute('foo.set_bar(33)')
 assert context.foo.get_bar() == 33
 assert context.eval('foo.bar_history.push(foo.bar_history[1].get_bar());foo.bar_history[foo.bar_history.length-1].get_bar()') == 11.11
 
+# persistent disk cache of translated code
+import tempfile, shutil
+cache_dir = tempfile.mkdtemp()
+js2py.enable_disk_cache(cache_dir)
+assert js2py.eval_js('[1, 2, 3].length') == 3
+assert js2py.eval_js('[1, 2, 3].length') == 3  # now loaded from the disk cache
+dc = js2py.utils.disk_cache.get_disk_cache()
+for n in range(2):  # lone surrogates are valid in js sources, overwritten entries are counted once
+    dc.set('py', u'"\ud800"', u'x')
+assert dc.get('py', u'"\ud800"') == u'x' and dc.size() == sum(e[1] for e in dc._entries())
+import pyjsparser.parser
+pyjsparser.parser.ENABLE_PYIMPORT = True  # disabled above
+assert js2py.eval_js('pyimport os; 1') == 1 and js2py.EvalJs().eval('pyimport os; 2') == 2
+js2py.disable_pyimport()
+for run in (js2py.eval_js, js2py.EvalJs().eval):  # the cached translations must not be used
+    try:
+        run('pyimport os; 1')
+        raise AssertionError('pyimport must be a syntax error when disabled')
+    except js2py.internals.simplex.JsException as err:
+        assert 'pyimport' in str(err)
+js2py.disable_disk_cache()
+shutil.rmtree(cache_dir)
+
+# ahead-of-time compiled bundles, with sources or with the bytecode only
+import importlib, os
+from js2py import compile as js2py_compile
+bundle_dir = tempfile.mkdtemp()
+os.makedirs(os.path.join(bundle_dir, 'src', 'lib'))
+with open(os.path.join(bundle_dir, 'src', 'lib', 'my-lib.js'), 'w') as f:
+    f.write('var base = 40; function answer(n) {return base + n}')
+sys.path.insert(0, bundle_dir)
+for package, options in (('jslibs_src', []), ('jslibs_pyc', ['--bytecode-only'])):
+    js2py_compile.main([os.path.join(bundle_dir, 'src'), os.path.join(bundle_dir, package), '-q'] + options)
+    jslibs = importlib.import_module(package)
+    assert jslibs.MANIFEST['modules']['lib_my_lib'] == {'exports': ['base', 'answer'], 'source': 'lib/my-lib.js'}
+    assert jslibs.load('lib_my_lib').answer(2) == 42
+    assert os.path.exists(os.path.join(bundle_dir, package, 'lib_my_lib.py')) != bool(options)
+sys.path.remove(bundle_dir)
+shutil.rmtree(bundle_dir)
+
+# bounded snippet cache shared between contexts
+snippet_cache = js2py.SnippetCache(max_entries=2)
+ctx1, ctx2 = js2py.EvalJs(cache=snippet_cache), js2py.EvalJs(cache=snippet_cache)
+for n in range(3):
+    ctx1.execute('var n = %d' % n)
+ctx2.execute('var n = 2')
+assert ctx2.n == 2 and len(snippet_cache) == 2
+assert snippet_cache.hits == 1 and snippet_cache.misses == 3 and snippet_cache.evictions == 1
+
+# compilation plans - snippets differing only in literals share the compiled code
+ctx = js2py.EvalJs({'name': 'Robert'})
+ctx.execute("function f() {return name == 'Robert' && 46} /* c */ var r = {'a': f()}.a", use_compilation_plan=True)
+ctx.execute("function g() {return name == 'o\\'Reilly' && 50} // c\nvar s = {'b': g()}.b", use_compilation_plan=True)
+assert ctx.r == 46 and ctx.s is False and 'PyJsCompilationPlan' not in ctx.context
+ctx.name = "o'Reilly"
+assert ctx.f() is False and ctx.g() == 50
+
+# incremental translation reuses unchanged top-level functions
+from js2py.translators.translator import IncrementalTranslator
+translator = IncrementalTranslator()
+src = 'function f(x) {return [x].map(function (e) {return e + 1})[0]}\nvar g = function () {return f(%d)}'
+translator.translate(src % 1)
+ctx = {}
+exec(translator.translate(src % 2), ctx)
+assert translator.reused == 1 and translator.translated == 1 and ctx['var'].to_python().g() == 3
+
+# function variables are python locals unless they escape: used by a nested function, assigned
+# inside an expression, deleted or shadowed by a catch parameter (eval and with disable the locals)
+import re
+from js2py.translators import translating_nodes
+from js2py.translators.translator import pyjsparser_parse_fn
+def check_locals(js, value, names):
+    assert js2py.eval_js(js) == value and set(re.findall(r'PyJsVar_(\w+?)_', js2py.translate_js(js))) == set(names), js
+check_locals('function f(n) {var s = 0; for (var i = 0; i < n; i++) {s += i}; return s}; f(5)', 10, 'nsi')
+check_locals('function f() {var c = 1; function g() {return c}; c = 2; return g()}; f()', 2, '')
+check_locals('function f() {var e = 1; try {throw 2} catch (e) {e = 3}; return e}; f()', 1, '')
+check_locals('function f() {var d = 1; delete d; return typeof d}; f()', 'number', '')
+check_locals('function f() {var x = 1; eval("x = 2"); return x}; f()', 2, '')
+check_locals('function f() {var a = 1, g = function () {return a}; a += 2; a++; return g()}; f()', 4, 'g')
+check_locals('function f() {var b = 1, c = (b += 2) * 2 + b++; return b + c}; f()', 13, 'c')
+assert translating_nodes.local_names([], pyjsparser_parse_fn('var x = 1, o = {}; with (o) {x = 2}')['body']) == {}
+try:  # duplicate params are not supported
+    js2py.eval_js('function f(a, a) {return a}; f(1, 2)')
+    raise AssertionError('duplicate params must be a python SyntaxError')
+except SyntaxError:
+    pass
+
+# string primitives behave like their String objects, assigning their properties does nothing
+assert js2py.eval_js('"ab"[1] + "ab".charAt(0) + ("ab".constructor === String) + "abc".length') == 'batrue3'
+assert js2py.eval_js('"ab".hasOwnProperty("length") && new String("ab").hasOwnProperty("1")') is True
+assert sorted(js2py.eval_js('Object.getOwnPropertyNames(new String("ab"))')) == ['0', '1', 'length']
+assert js2py.eval_js('var r; try {Object.getOwnPropertyNames("ab")} catch (e) {r = e.name}; r') == 'TypeError'
+assert js2py.eval_js('var s = "ab"; s.x = 1; s.length = 5; s[0] = "z"; typeof s.x + s.length + s') == 'undefined2ab'
+
+# the arguments object is only built for the functions that may use it
+assert js2py.eval_js('function f() {return eval("arguments[1]") + eval("eval(\'arguments.length\')")}; f(1, 2, 3)') == 5
+assert js2py.eval_js('function f() {return function () {return eval("arguments.length")}(1)}; f(1, 2, 3)') == 1
+assert js2py.eval_js('function f(a) {var args = arguments; return function () {return args[0] + arguments.length}}; f(5)(1, 2)') == 7
+assert js2py.eval_js('function f() {return [1].map(function () {return arguments.length})[0] + arguments.length}; f(1, 2)') == 5
+assert js2py.eval_js('function g() {return arguments.length + ":" + this.x}; function f() {return g.apply(this, arguments)};'
+                     'f.call({x: 1}, 1, 2)') == '2:1'
+assert js2py.translate_js('function f() {return eval("1")}; function g() {return 1}').count('needs_arguments = False') == 1
+
+# literals are hoisted into constants named after their values
+assert js2py.eval_js(u'"\\ud800".length + "\ud800".length') == 2  # lone surrogates
+assert js2py.eval_js('["a b", "0cc9cd4dd26c5137"].join()') == 'a b,0cc9cd4dd26c5137'  # md5('a b')[:16]
+
+# number fast paths must not modify the shared NUM_BANK numbers
+assert js2py.eval_js('-1 % 3; var a = 2; a') == 2
+
+# syntax trees are shared by the translator and the VM
+from js2py.utils import parse_cache
+from js2py.internals import seval
+parse_cache.enable_parse_cache()
+assert js2py.eval_js('var s = 0; for (var i = 0; i < 3; i++) {s += new Function("a", "return a * 2")(i)}; s') == 6
+assert seval.eval_js_vm('var s = 0; for (var i = 0; i < 3; i++) {s += new Function("a", "return a * 2")(i)}; s') == 6
+assert parse_cache.get_parse_cache().hits >= 5
+
+# the parser backends produce the same trees as pyjsparser (see tests/parser_conformance.py)
+from js2py.utils import parsers
+sample = js2py.get_file_contents('js2py/utils/esprima.js')
+for backend in parsers.available_parser_backends():
+    assert backend.parse(sample) == parsers.PyJsParserBackend().parse(sample), backend.name
+assert parsers.get_parser_backend().name == 'pyjsparser'  # the other backends are opt-in
+for backend in parsers.available_parser_backends():
+    parsers.set_parser_backend(backend.name)
+    for run in (js2py.eval_js, seval.eval_js_vm):
+        assert run('"\\u{1F600}".length + "\\uD83D\\uDE00".length') == 4, backend.name
+        for code in ('class A {}', 'var f = (a) => a; f(2)'):  # not ECMA 5.1
+            try:
+                run(code)
+                raise AssertionError('%s must be a syntax error (%s)' % (code, backend.name))
+            except js2py.internals.simplex.JsException as err:
+                assert 'is not supported by ECMA 5.1' in str(err)
+parsers.set_parser_backend(None)
+import subprocess
+for backend in parsers.available_parser_backends():  # usable from other threads, the process exits
+    assert subprocess.call([sys.executable, '-c', 'import threading, js2py; from js2py.utils import parsers;'
+                            'parsers.set_parser_backend(%r); t = threading.Thread(target=js2py.eval_js, args=("1",));'
+                            't.start(); t.join(); js2py.eval_js("2")' % backend.name]) == 0, backend.name
+assert seval.eval_js_vm('eval("//" + String.fromCharCode(0xD800) + "\\n1")') == 1  # lone surrogate
+from js2py.translators.translator import pyjsparser_parse_fn
+assert pyjsparser_parse_fn('var a') == pyjsparser_parse_fn('var a') and \
+    pyjsparser_parse_fn('var a') is not pyjsparser_parse_fn('var a')  # callers get a copy
+
+# streaming translation, compiled and executed statement by statement
+ctx = js2py.EvalJs()
+ctx.execute_stream('var t = typeof x + f(1); var x = [1, 2].map(function (e) {return f(e)});'
+                   'function f(a) {return a * 2}', chunk_size=1)
+assert ctx.t == 'undefined2' and ctx.x.to_list() == [2, 4]
+
+# VM objects keep their data properties in shapes, they switch to the dictionary mode when they
+# get too many properties, lose a property other than the last one or become watched prototypes
+run_vm = lambda js: seval.VmProgram(js).run()[0]
+big = run_vm('var o = {}; for (var i = 0; i < 70; i++) {o["p" + i] = i}; o')
+assert big.shape is None and big.own_keys() == ['p%d' % i for i in range(70)] and big.get(u'p65') == 65
+assert run_vm('var o = {a: 1, b: 2, c: 3}; delete o.a; o').shape is None
+last_deleted = run_vm('var o = {a: 1, b: 2, c: 3}; delete o.c; o')
+assert last_deleted.shape is not None and last_deleted.own_keys() == ['a', 'b']
+proto = run_vm('function F() {}; F.prototype.x = 1; var f = new F(); for (var i = 0; i < 3; i++) {f.x}; F.prototype')
+assert proto.is_watched and proto.shape is None
+assert seval.eval_js_vm('function F() {}; F.prototype.x = 1; var f = new F(), s = 0;'
+                        'for (var i = 0; i < 3; i++) {s += f.x; F.prototype.x = 5}; s') == 11
+assert seval.eval_js_vm('var a = {a: 1, b: 2, c: 3}, b = {a: 1, b: 2, c: 3}, c = {a: 1, b: 2, c: 3};'
+                        'delete a.a; a.a = 0; delete b.b; b.b = 0; delete c.c; c.c = 0;'
+                        '[Object.keys(a), Object.keys(b), Object.keys(c)].join(" ")') == 'b,c,a a,c,b a,b,c'
+
+# VM arrays keep their elements in a list (dense mode), holes at the end are allowed. Holes
+# inside, other own properties, accessors and non-default attributes switch to the dictionary mode
+assert run_vm('var a = [1, 2, 3]; a.push(4); a').dense == [1, 2, 3, 4]
+grown, shrunk = run_vm('var a = [1, 2]; a.length = 5; var b = [1, 2, 3, 4]; b.length = 2; [a, b]').dense
+assert grown.dense == [1, 2] and grown.length == 5 and shrunk.dense == [1, 2] and shrunk.length == 2
+for change in ('a[5] = 1', 'a.x = 1', 'delete a[0]', 'Object.defineProperty(a, "1", {get: function () {return 7}})',
+               'Object.defineProperty(a, "0", {value: 1, writable: false})'):
+    assert run_vm('var a = [1, 2, 3]; %s; a' % change).dense is None, change
+assert seval.eval_js_vm('var a = [1, 2, 3]; a[5] = 6; a.length + " " + a[4] + " " + a.join()') == '6 undefined 1,2,3,,,6'
+assert seval.eval_js_vm('var a = [1, 2, 3]; Object.defineProperty(a, "1", {get: function () {return 7}});'
+                        'a[1] + " " + a.join()') == '7 1,7,3'
+assert seval.eval_js_vm('var a = [1, 2, 3]; delete a[0]; a.length = 1; a.length + " " + a[2] + (0 in a)') == '1 undefinedfalse'
+assert seval.eval_js_vm('var a = [1, 2, 3]; a.x = 1; a.length = 5; a.push(6); a.length + " " + a.join() + a.x') == '6 1,2,3,,,61'
+
+# the code compiled by eval and Function leaves the VM tape once it is not referenced, functions
+# created by the code that stays keep working
+import gc
+tape_sizes = []
+for n in (5, 50):
+    program = seval.VmProgram(
+        'var tmp = new Function("return 1"); var keep = new Function("a", "return a * 3"); tmp = null;'
+        'var s = 0; for (var i = 0; i < n; i++) {s += eval("i + 1") + new Function("return " + i)()}; keep(s)')
+    value, outputs = program.run({'n': n}, outputs=['keep'])
+    gc.collect()  # the functions are in reference cycles
+    program.byte_generator.exe.collect_segments()
+    stats = program.byte_generator.exe.segment_stats()
+    assert value == 3 * n * n and outputs['keep'].call(None, (2.0, )) == 6 and stats['live_segments'] == 1
+    tape_sizes.append(stats['tape_size'])
+assert tape_sizes[0] == tape_sizes[1]
+
+# every eval_js_vm call runs in its own fork of the pristine space, which itself never runs code
+from js2py.internals import fill_space
+assert seval.eval_js_vm('Object.prototype.polluted = 1; Array.prototype.push = null; var leaked = 2; [].polluted') == 1
+assert seval.eval_js_vm('var a = []; a.push(2); typeof ({}).polluted + typeof leaked + a.length') == 'undefinedundefined1'
+pristine = fill_space._PRISTINE_SPACE[0]
+assert pristine.ObjectPrototype.get_own_property(u'polluted') is None and not pristine.byte_generator.exe.tape
+
+# VmProgram runs in fresh spaces by default, a pooled space keeps everything but the declared globals
+import weakref
+program = seval.VmProgram('var total = (total || 0) + price * count; var runs = ({}).runs + 1 || 1;'
+                          'Object.prototype.runs = runs; total > limit')
+for price in (1, 2, 3):
+    assert program.run({'price': price, 'count': 3, 'limit': 5}, outputs=['total', 'runs']) == (price > 1, {'total': price * 3, 'runs': 1})
+pooled = program.new_space()
+assert [program.run({'price': 1, 'count': 1, 'limit': 0}, ['total', 'runs'], pooled)[1] for i in range(2)] == [{'total': 1, 'runs': 1}, {'total': 1, 'runs': 2}]
+assert program.run({'price': 1, 'count': 1, 'limit': 0}, ['runs'])[1] == {'runs': 1}
+program = seval.VmProgram('({}).hasOwnProperty("x")')
+pooled = program.new_space()
+assert program.run(space=pooled)[0] is False
+old_prototype = weakref.ref(pooled.ObjectPrototype)
+del pooled
+assert program.run()[0] is False
+gc.collect()
+assert old_prototype() is None  # not kept alive by the inline caches
+
 print("Passed ECMA 5 simple tests!\n"+30*'-')
 
 print('Now harder tests - test on huge JS libraries:')
@@ -125,7 +347,7 @@ function helloWorld(a, b, c) {
 }
 '''
 # we can even parse esprima's own source code, but its size is too big for the travis test.
-#sample_js_code = js2py.get_file_contents('examples/esprima.js')
+#sample_js_code = js2py.get_file_contents('js2py/utils/esprima.js')
 parsed = esprima.parse(sample_js_code)
 print('use escodegen to get back the js code from the parsed AST')
 reconstructed = escodegen.generate(parsed)
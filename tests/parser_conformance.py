@@ -0,0 +1,123 @@
+"""Checks that parser backends produce exactly the same syntax trees as pyjsparser.
+
+Parses every test case (and the includes) and the EXTRA_SOURCES (syntax beyond ECMA 5.1 and
+characters outside of the BMP) with every available backend and compares the trees, and the
+messages of the syntax errors, with the ones produced by the reference pyjsparser backend. Run
+from the tests directory:
+
+    python parser_conformance.py [backend ...]
+"""
+from __future__ import print_function
+import os
+import sys
+import codecs
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from js2py.utils import parsers
+
+REFERENCE = 'pyjsparser'
+TEST_PATHS = ['includes', 'test_cases']
+MAX_REPORTED = 20
+
+# ES6 syntax the backends may support but js2py can't run, it must be rejected like pyjsparser
+# does, and astral characters, written as such or escaped (pyjsparser splits the escaped ones)
+EXTRA_SOURCES = [
+    'class A {}', 'var A = class {}', 'var f = (a) => a', 'var f = a => {return a}',
+    '`a${1}`', 'f`a`', 'for (var x of y) {}', 'function f(a = 1) {}', 'function f(...a) {}',
+    'var {a} = b', 'var [a] = b', '({a} = b)', 'f(...a)', 'function* g() {yield 1}',
+    'function f() {new.target}', 'var yield = 1', 'var let = 1', 'let a = 1', 'const a = 1',
+    'var o = {a, b() {}, [c]: 1}', 'super.x', 'import a from "b"', 'export var a', 'a\\u{62}',
+    '/a/u', '0o17 + 0b11', u'"\U0001F600"', u'var \U0001D400 = 1', u'/\U0001F600/',
+    '"\\u{1F600}"', '"\\uD83D\\uDE00"', u'"\U0001F600\\n"', u'"\\uD83D\\uDE00 \U0001F600"',
+    u'// \U0001F600\n1'
+]
+
+
+def load(path):
+    with codecs.open(path, "r", "utf-8") as f:
+        return f.read()
+
+
+def sources():
+    '''Yields the names and the sources to check'''
+    for test_path in TEST_PATHS:
+        for root, dirs, files in os.walk(test_path):
+            dirs.sort()
+            for f in sorted(files):
+                if f.endswith('.js'):
+                    path = os.path.join(root, f)
+                    yield path, load(path)
+    for code in EXTRA_SOURCES:
+        yield repr(code), code
+
+
+def parse(backend, code):
+    try:
+        return 'tree', backend.parse(code)
+    except Exception as e:
+        return 'error', '%s: %s' % (e.__class__.__name__, e)
+
+
+def first_difference(a, b, path='tree'):
+    if type(a) != type(b):
+        return '%s: %r != %r' % (path, a, b)
+    if isinstance(a, dict):
+        for k in sorted(set(a) | set(b)):
+            if k not in a or k not in b:
+                return '%s: key %r missing in %s' % (path, k, 'reference' if k not in a else 'backend')
+            diff = first_difference(a[k], b[k], '%s.%s' % (path, k))
+            if diff:
+                return diff
+    elif isinstance(a, list):
+        if len(a) != len(b):
+            return '%s: length %d != %d' % (path, len(a), len(b))
+        for n, (x, y) in enumerate(zip(a, b)):
+            diff = first_difference(x, y, '%s[%d]' % (path, n))
+            if diff:
+                return diff
+    elif a != b:
+        return '%s: %r != %r' % (path, a, b)
+    return None
+
+
+def check(backend, reference):
+    print('Checking %s against %s' % (backend.name, reference.name))
+    checked = differences = 0
+    for path, code in sources():
+        expected = parse(reference, code)
+        got = parse(backend, code)
+        checked += 1
+        if expected[0] != got[0]:
+            diff = 'expected %s, got %s' % (expected[0], got[0])
+        elif expected[0] == 'error':
+            diff = expected[1] != got[1] and '%r != %r' % (expected[1], got[1])
+        else:
+            diff = first_difference(expected[1], got[1])
+        if diff:
+            differences += 1
+            if differences <= MAX_REPORTED:
+                print('  %s: %s' % (path, diff))
+    print('  %d sources, %d differences' % (checked, differences))
+    return differences
+
+
+def main(names):
+    reference = parsers.PyJsParserBackend()
+    backends = [b for b in parsers.available_parser_backends() if b.name != REFERENCE]
+    if names:
+        backends = [b for b in backends if b.name in names]
+        missing = set(names) - set(b.name for b in backends) - {REFERENCE}
+        if missing:
+            print('Not available: %s' % ', '.join(sorted(missing)))
+            return 1
+    if not backends:
+        print('No parser backend other than %s is available.' % REFERENCE)
+        return 0
+    failed = sum(check(backend, reference) for backend in backends)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.setrecursionlimit(10000)
+    sys.exit(main(sys.argv[1:]))
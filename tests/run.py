@@ -16,8 +16,14 @@ TEST_PATH = 'test_cases/language'
 FAILING = []
 
 # choose which JS runtime to test. Js2Py has 2 independent runtimes. Translation based (translator) and the vm interpreter based.
+# vm_unoptimized is the vm without the peephole optimizer, compare its results with the vm ones.
 RUNTIME_TO_TEST = 'vm'
 
+# the tests are parsed with the selected parser backend (see js2py.utils.parsers), set to check
+# first that the installed ones produce the same syntax trees as pyjsparser (it is slow, the check
+# can also be run alone with python parser_conformance.py)
+CHECK_PARSER_BACKENDS = False
+
 
 if RUNTIME_TO_TEST == 'translator':
     JS_EVALUATOR = js2py.eval_js
@@ -27,12 +33,16 @@ elif RUNTIME_TO_TEST == 'vm':
     JS_EVALUATOR = seval.eval_js_vm
     PY_JS_EXCEPTION = PyJsException
     MESSAGE_FROM_PY_JS_EXCEPTION = lambda x: str(x)
+elif RUNTIME_TO_TEST == 'vm_unoptimized':
+    JS_EVALUATOR = lambda js: seval.eval_js_vm(js, optimize=False)
+    PY_JS_EXCEPTION = PyJsException
+    MESSAGE_FROM_PY_JS_EXCEPTION = lambda x: str(x)
 elif RUNTIME_TO_TEST == 'node':
     JS_EVALUATOR = node_eval_js
     PY_JS_EXCEPTION = NodeJsError
     MESSAGE_FROM_PY_JS_EXCEPTION = lambda x: str(x)
 else:
-    raise RuntimeError("Js2Py has currently only 2 runtimes available - 'translator' and the 'vm' - RUNTIME_TO_TEST must be one of these.")
+    raise RuntimeError("Js2Py has currently only 2 runtimes available - 'translator' and the 'vm' (or 'vm_unoptimized') - RUNTIME_TO_TEST must be one of these.")
 
 
 
@@ -251,6 +261,11 @@ def fest_all(path):
 
 
 
+if CHECK_PARSER_BACKENDS:
+    import parser_conformance
+    if parser_conformance.main([]):
+        print('Parser backends produce different syntax trees than pyjsparser, see above.')
+
 fest_all(TEST_PATH)
 with open('failed.txt', 'w') as f:
     f.write('\n'.join(filter(lambda x: x, FAILING)))
@@ -3,10 +3,10 @@ import datetime
 now = datetime.datetime.now
 
 # the line below will
-# - build a 'compilation plan' by substituting strings and constants with placeholders
+# - build a 'compilation plan' by substituting strings and numbers with placeholders
 # - then build the ast and emit the python code from that compilation plan
-# - then substitute back in the constants
-# This causes some regex overhead, but for js code with similar structure
+# - then pass the constants to the generated code
+# This causes some tokenizing overhead, but for js code with similar structure
 # subsequent translate_js calls are 20 times faster
 js2py.translate_js('name == "Robert" && age == 46', use_compilation_plan=True)
 
@@ -29,8 +29,14 @@ print(('duration with compilation plan %i'%(now() - start).seconds))
 # you can see how a compilation plan works with the lines below:
 from js2py.translators.translator import get_compilation_plan
 expression = "Age==1 && Gender==2 && JobTitle=='Decision maker'"
-strings, numbers, plan = get_compilation_plan(expression)
-print('strings:\n%s'%strings)
-print('numbers:\n%s'%numbers)
+plan, literals = get_compilation_plan(expression)
+print('literals:\n%s'%literals)
 print('plan:\n%s'%plan)
-print(js2py.translate_js(expression))
+print(js2py.translate_js(expression, use_compilation_plan=True))
+
+# EvalJs.execute goes one step further and reuses the compiled python code as well
+ctx = js2py.EvalJs({'Age': 1, 'Gender': 2, 'JobTitle': 'Decision maker'})
+start = now()
+for cnt in range(10000):
+	ctx.execute('result = Age==%i && JobTitle=="Decision maker"'%cnt, use_compilation_plan=True)
+print(('duration of execute with compilation plan %i'%(now() - start).seconds))